@@ -0,0 +1,173 @@
+# Copyright (c) 2011-2015 Rusty Wagner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+from BinaryData import *
+
+
+class AddressRange:
+	def __init__(self, start, end, virtual_addr, file_offset, file_size):
+		self.start = start
+		self.end = end
+		self.virtual_addr = virtual_addr
+		self.file_offset = file_offset
+		self.file_size = file_size
+
+
+class AddressMap:
+	# Translates virtual addresses of an executable to offsets in the underlying file.  Segments
+	# are flattened into sorted, non-overlapping ranges when the executable is loaded, with later
+	# segments taking precedence where they overlap earlier ones, so that each lookup is a bisect.
+	def __init__(self, segments):
+		# Each segment is a (virtual_addr, memory_size, file_offset, file_size) tuple
+		self.ranges = []
+		self.segment_starts = []
+		self.min_addr = None
+		self.max_addr = None
+
+		for virtual_addr, memory_size, file_offset, file_size in segments:
+			if memory_size == 0:
+				continue
+			end = virtual_addr + memory_size
+			self.add_range(AddressRange(virtual_addr, end, virtual_addr, file_offset, file_size))
+			self.segment_starts.append(virtual_addr)
+			if (self.min_addr is None) or (virtual_addr < self.min_addr):
+				self.min_addr = virtual_addr
+			if (self.max_addr is None) or (end > self.max_addr):
+				self.max_addr = end
+
+		self.ranges.sort(key = lambda r: r.start)
+		self.range_starts = [r.start for r in self.ranges]
+		self.segment_starts.sort()
+		self.last_hit = None
+
+	def add_range(self, new_range):
+		# Trim any existing ranges covered by the new one
+		ranges = []
+		for r in self.ranges:
+			if (r.end <= new_range.start) or (r.start >= new_range.end):
+				ranges.append(r)
+				continue
+			if r.start < new_range.start:
+				ranges.append(AddressRange(r.start, new_range.start, r.virtual_addr, r.file_offset, r.file_size))
+			if r.end > new_range.end:
+				ranges.append(AddressRange(new_range.end, r.end, r.virtual_addr, r.file_offset, r.file_size))
+		ranges.append(new_range)
+		self.ranges = ranges
+
+	def find(self, addr):
+		cur = self.last_hit
+		if (cur is not None) and (addr >= cur.start) and (addr < cur.end):
+			return cur
+		i = bisect.bisect_right(self.range_starts, addr) - 1
+		if i < 0:
+			return None
+		cur = self.ranges[i]
+		if addr >= cur.end:
+			return None
+		self.last_hit = cur
+		return cur
+
+	def start(self):
+		return self.min_addr
+
+	def end(self):
+		return self.max_addr
+
+	def next_valid_addr(self, addr):
+		i = bisect.bisect_left(self.segment_starts, addr)
+		if i >= len(self.segment_starts):
+			return -1
+		return self.segment_starts[i]
+
+	def file_offset(self, addr):
+		cur = self.find(addr)
+		if cur is None:
+			return None
+		return cur.file_offset + (addr - cur.virtual_addr)
+
+	def span(self, data, ofs, length):
+		# Locates a range that is backed by a single contiguous region of the file
+		cur = self.find(ofs)
+		if cur is None:
+			return None
+		prog_ofs = ofs - cur.virtual_addr
+		if ((ofs + length) > cur.end) or ((prog_ofs + length) > cur.file_size):
+			return None
+		return data.span(cur.file_offset + prog_ofs, length)
+
+	def read(self, data, ofs, length):
+		result = []
+		while length > 0:
+			cur = self.find(ofs)
+			if cur is None:
+				break
+
+			prog_ofs = ofs - cur.virtual_addr
+			mem_len = min(cur.end - ofs, length)
+			file_len = min(cur.file_size - prog_ofs, mem_len)
+
+			if file_len <= 0:
+				result.append("\x00" * mem_len)
+				length -= mem_len
+				ofs += mem_len
+				continue
+
+			result.append(data.read(cur.file_offset + prog_ofs, file_len))
+			length -= file_len
+			ofs += file_len
+
+		return "".join(result)
+
+	def get_modification(self, data, ofs, length):
+		result = []
+		while length > 0:
+			cur = self.find(ofs)
+			if cur is None:
+				break
+
+			prog_ofs = ofs - cur.virtual_addr
+			mem_len = min(cur.end - ofs, length)
+			file_len = min(cur.file_size - prog_ofs, mem_len)
+
+			if file_len <= 0:
+				result += [DATA_ORIGINAL] * mem_len
+				length -= mem_len
+				ofs += mem_len
+				continue
+
+			result += data.get_modification(cur.file_offset + prog_ofs, file_len)
+			length -= file_len
+			ofs += file_len
+
+		return result
+
+	def write(self, data, ofs, contents):
+		result = 0
+		while len(contents) > 0:
+			cur = self.find(ofs)
+			if cur is None:
+				break
+
+			prog_ofs = ofs - cur.virtual_addr
+			file_len = min(cur.file_size - prog_ofs, cur.end - ofs, len(contents))
+			if file_len <= 0:
+				break
+
+			result += data.write(cur.file_offset + prog_ofs, contents[0:file_len])
+			contents = contents[file_len:]
+			ofs += file_len
+
+		return result
@@ -13,77 +13,167 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import sys
 import threading
 import time
 import struct
+try:
+	import multiprocessing
+except ImportError:
+	multiprocessing = None
 import X86
 import PPC
 import Arm
 from ElfFile import *
 from PEFile import *
 from MachOFile import *
+from AnalysisDatabase import *
+from WorkList import *
+from CallGraph import *
+from LinearSweep import *
 
 
 ExeFormats = [ElfFile, PEFile, MachOFile]
 
+# Seconds to wait for a worker process before decoding in this process instead
+DISCOVERY_TIMEOUT = 30
+
 
 class InstructionText:
 	def __init__(self):
 		self.lines = []
 		self.tokens = []
-
-class X86Instruction:
-	def __init__(self, opcode, addr, disasm, addr_size):
+		self.refs = []
+
+# Kinds of instruction, recorded when an instruction is decoded so that the code can be followed
+# without keeping the decoded instruction
+INSTR_VALID = 1
+INSTR_CALL = 2
+INSTR_CONDITIONAL_BRANCH = 4
+INSTR_LOCAL_JUMP = 8
+INSTR_BLOCK_ENDING = 16
+
+# Text of every instruction that has not been formatted
+EmptyInstructionText = InstructionText()
+
+def get_branch_xref_type(flags):
+	if flags & INSTR_CALL:
+		return "call"
+	return "jump"
+
+class CompactInstruction(object):
+	# An instruction is kept for every address of every function, so it only holds its bytes and
+	# what analysis needs to follow the code.  The decoded instruction, with its operands, is
+	# produced again from the bytes when the instruction is formatted or patched.
+	__slots__ = ["opcode", "addr", "size", "flags", "target", "xrefs", "text"]
+
+	def __init__(self, opcode, addr, size, flags, target, xrefs):
 		self.opcode = opcode
 		self.addr = addr
-		self.disasm = disasm
-		self.addr_size = addr_size
-		self.plt = None
-		self.text = InstructionText()
-
-		if ((disasm.operation == "jmpn") or self.isCall() or self.isConditionalBranch()) and (disasm.operands[0].operand == "imm"):
-			self.target = disasm.operands[0].immediate
-		else:
-			self.target = None
+		self.size = size
+		self.flags = flags
+		self.target = target
+		self.xrefs = xrefs
+		self.text = EmptyInstructionText
 
 	def isConditionalBranch(self):
-		return self.disasm.operation in ["jo", "jno", "jb", "jae", "je", "jne", "jbe", "ja", "js", "jns",
-			"jpe", "jpo", "jl", "jge", "jle", "jg", "jcxz", "jecxz", "jrcxz", "loop"]
+		return (self.flags & INSTR_CONDITIONAL_BRANCH) != 0
 
 	def isLocalJump(self):
-		if self.disasm.operation == "jmpn":
-			return True
-		if self.isConditionalBranch():
-			return True
-		return False
+		return (self.flags & INSTR_LOCAL_JUMP) != 0
 
 	def isCall(self):
-		if self.disasm.operation == "calln":
-			return True
-		if self.disasm.operation == "callf":
-			return True
-		return False
+		return (self.flags & INSTR_CALL) != 0
 
 	def isBlockEnding(self):
-		if self.disasm.operation in ["jmpn", "jmpf", "retn", "retf"]:
-			return True
-		if self.isConditionalBranch():
-			return True
-		if self.disasm.operation == "hlt":
-			return True
-		return False
+		return (self.flags & INSTR_BLOCK_ENDING) != 0
 
 	def isValid(self):
-		return self.disasm.operation != None
+		return (self.flags & INSTR_VALID) != 0
 
 	def length(self):
-		return self.disasm.length
+		return self.size
+
+	def save(self):
+		# Fields stored in the analysis database, and sent back by discovery workers
+		return (self.opcode, self.addr, self.size, self.flags, self.target, self.xrefs)
+
+def create_x86_instr(opcode, addr, disasm, addr_size, exe):
+	flags = 0
+	target = None
+	xrefs = []
+	if disasm.operation != None:
+		flags = INSTR_VALID
+		if disasm.operation in X86.ConditionalBranches:
+			flags |= INSTR_CONDITIONAL_BRANCH | INSTR_LOCAL_JUMP | INSTR_BLOCK_ENDING
+		if disasm.operation in ["calln", "callf"]:
+			flags |= INSTR_CALL
+		if disasm.operation == "jmpn":
+			flags |= INSTR_LOCAL_JUMP
+		if disasm.operation in ["jmpn", "jmpf", "retn", "retf", "hlt"]:
+			flags |= INSTR_BLOCK_ENDING
+
+		if (flags & (INSTR_CALL | INSTR_LOCAL_JUMP)) and (disasm.operands[0].operand == "imm"):
+			target = disasm.operands[0].immediate
+			xrefs.append((get_branch_xref_type(flags), target))
+
+	# Addresses within the executable referenced by the instruction, as (type, addr) pairs
+	mask = (1 << (addr_size * 8)) - 1
+	for operand in disasm.operands:
+		if (operand.operand == "imm") and (operand.size == addr_size):
+			value = operand.immediate & mask
+			if (value != target) and (value >= exe.start()) and (value < exe.end()):
+				xrefs.append(("ptr", value))
+		elif (operand.operand == "mem") and (operand.components[0] == None):
+			# Absolute and RIP relative operands, and tables indexed by a register
+			value = operand.immediate & mask
+			if (value >= exe.start()) and (value < exe.end()):
+				xrefs.append(("data", value))
+	return X86Instruction(opcode, addr, disasm.length, flags, target, tuple(xrefs), addr_size)
+
+class X86Instruction(CompactInstruction):
+	__slots__ = ["addr_size"]
+
+	def __init__(self, opcode, addr, size, flags, target, xrefs, addr_size):
+		CompactInstruction.__init__(self, opcode, addr, size, flags, target, xrefs)
+		self.addr_size = addr_size
+
+	@property
+	def disasm(self):
+		if self.addr_size == 8:
+			return X86.disassemble64(self.opcode, self.addr)
+		return X86.disassemble32(self.opcode, self.addr)
+
+	def get_plt(self, exe):
+		# Name of the PLT entry referenced by an absolute or RIP relative memory operand, if any
+		if not hasattr(exe, "plt"):
+			return None
+		disasm = self.disasm
+		plt = None
+		for operand in disasm.operands:
+			if operand.operand != "mem":
+				continue
+			plus = (operand.components[0] != None) or (operand.components[1] != None)
+			if plus and (operand.immediate >= -0x8000) and (operand.immediate <= 0x7f):
+				continue
+			if disasm.flags & X86.FLAG_64BIT_ADDRESS:
+				value = operand.immediate
+			elif self.addr_size == 4:
+				value = operand.immediate & 0xffffffff
+			else:
+				continue
+			if value in exe.plt:
+				plt = exe.plt[value]
+		return plt
 
 	def format_text(self, block, options):
 		old_lines = []
 		old_tokens = []
-		self.text.lines = []
-		self.text.tokens = []
+
+		# Text is built separately and replaced in one assignment, so that it can be read without
+		# the analysis lock while being formatted.  Addresses whose names are looked up are kept
+		# in the text's references, so that it can be formatted again when they are renamed.
+		text = InstructionText()
 
 		line = []
 		tokens = []
@@ -97,9 +187,10 @@ class X86Instruction:
 
 		if instr.operation == None:
 			line += [["??", Qt.black]]
-			self.text.lines += [line]
-			self.text.tokens += [tokens]
-			return (old_lines != self.text.lines) or (old_tokens != self.text.tokens)
+			text.lines += [line]
+			text.tokens += [tokens]
+			self.text = text
+			return (old_lines != text.lines) or (old_tokens != text.tokens)
 
 		result = ""
 		operation = ""
@@ -122,6 +213,7 @@ class X86Instruction:
 				result += ", "
 			if instr.operands[j].operand == "imm":
 				value = instr.operands[j].immediate & ((1 << (instr.operands[j].size * 8)) - 1)
+				text.refs.append(value)
 				numfmt = "0x%%.%dx" % (instr.operands[j].size * 2)
 				string = numfmt % value
 				if (instr.operands[j].size == self.addr_size) and (block.analysis.functions.has_key(value)):
@@ -184,15 +276,15 @@ class X86Instruction:
 						if plus:
 							result += '+'
 						value = instr.operands[j].immediate
+						text.refs.append(value)
 						string = "0x%.16x" % instr.operands[j].immediate
 						if hasattr(block.exe, "plt") and block.exe.plt.has_key(value):
 							# Pointer to PLT entry
-							self.plt = block.exe.plt[value]
 							if len(result) > 0:
 								line += [[result, Qt.black]]
 								x += len(result)
 								result = ""
-							string = self.plt + "@PLT"
+							string = block.exe.plt[value] + "@PLT"
 							line += [[string, QColor(0, 0, 192)]]
 							tokens += [[x, len(string), "ptr", value, string]]
 							x += len(string)
@@ -213,15 +305,15 @@ class X86Instruction:
 						if plus:
 							result += '+'
 						value = instr.operands[j].immediate & 0xffffffff
+						text.refs.append(value)
 						string = "0x%.8x" % value
 						if (self.addr_size == 4) and hasattr(block.exe, "plt") and block.exe.plt.has_key(value):
 							# Pointer to PLT entry
-							self.plt = block.exe.plt[value]
 							if len(result) > 0:
 								line += [[result, Qt.black]]
 								x += len(result)
 								result = ""
-							string = block.exe.decorate_plt_name(self.plt)
+							string = block.exe.decorate_plt_name(block.exe.plt[value])
 							line += [[string, QColor(0, 0, 192)]]
 							tokens += [[x, len(string), "ptr", value, string]]
 							x += len(string)
@@ -245,10 +337,11 @@ class X86Instruction:
 
 		if len(result) > 0:
 			line += [[result, Qt.black]]
-		self.text.lines += [line]
-		self.text.tokens += [tokens]
+		text.lines += [line]
+		text.tokens += [tokens]
+		self.text = text
 
-		return (old_lines != self.text.lines) or (old_tokens != self.text.tokens)
+		return (old_lines != text.lines) or (old_tokens != text.tokens)
 
 	def get_prefix_count(self):
 		for count in range(0, len(self.opcode)):
@@ -300,50 +393,46 @@ class X86Instruction:
 		exe.write(self.addr, "\xb8" + struct.pack("<I", value & 0xffffffff) + ("\x90" * (len(self.opcode) - 5)))
 
 
-class PPCInstruction:
-	def __init__(self, opcode, addr, disasm):
-		self.opcode = opcode
-		self.addr = addr
-		self.disasm = disasm
-		self.plt = None
-		self.text = InstructionText()
-
-		self.target = None
-		if self.disasm.operation and self.disasm.operation.startswith('b') and (len(self.disasm.operands) > 0):
-			if type(disasm.operands[-1]) != str:
-				self.target = disasm.operands[-1]
-
-	def isConditionalBranch(self):
-		return self.disasm.operation in PPC.ConditionalBranches
-
-	def isLocalJump(self):
-		if self.disasm.operation in ["b", "ba"]:
-			return True
-		if self.isConditionalBranch():
-			return True
-		return False
-
-	def isCall(self):
-		return self.disasm.operation in PPC.CallInstructions
-
-	def isBlockEnding(self):
-		if self.disasm.operation in (PPC.BranchInstructions + ["trap"]):
-			return True
-		if self.isLocalJump():
-			return True
-		return False
-
-	def isValid(self):
-		return self.disasm.operation != None
-
-	def length(self):
-		return 4
+def create_ppc_instr(opcode, addr, disasm, exe):
+	operation = disasm.operation
+	flags = 0
+	target = None
+	xrefs = []
+	if operation != None:
+		flags = INSTR_VALID
+		if operation in PPC.ConditionalBranches:
+			flags |= INSTR_CONDITIONAL_BRANCH | INSTR_LOCAL_JUMP | INSTR_BLOCK_ENDING
+		if operation in ["b", "ba"]:
+			flags |= INSTR_LOCAL_JUMP | INSTR_BLOCK_ENDING
+		if operation in PPC.CallInstructions:
+			flags |= INSTR_CALL
+		if operation in (PPC.BranchInstructions + ["trap"]):
+			flags |= INSTR_BLOCK_ENDING
+
+		if operation.startswith('b') and (len(disasm.operands) > 0) and (type(disasm.operands[-1]) != str):
+			target = disasm.operands[-1]
+			xrefs.append((get_branch_xref_type(flags), target))
+	for operand in disasm.operands:
+		if (type(operand) in [int, long]) and (operand != target) and (operand >= exe.start()) and (operand < exe.end()):
+			xrefs.append(("ptr", operand))
+	return PPCInstruction(opcode, addr, 4, flags, target, tuple(xrefs))
+
+class PPCInstruction(CompactInstruction):
+	__slots__ = []
+
+	@property
+	def disasm(self):
+		if len(self.opcode) != 4:
+			return PPC.Instruction()
+		return PPC.disassemble(struct.unpack(">I", self.opcode)[0], self.addr)
+
+	def get_plt(self, exe):
+		return None
 
 	def format_text(self, block, options):
 		old_lines = []
 		old_tokens = []
-		self.text.lines = []
-		self.text.tokens = []
+		text = InstructionText()
 
 		line = []
 		tokens = []
@@ -357,9 +446,10 @@ class PPCInstruction:
 
 		if instr.operation == None:
 			line += [["??", Qt.black]]
-			self.text.lines += [line]
-			self.text.tokens += [tokens]
-			return (old_lines != self.text.lines) or (old_tokens != self.text.tokens)
+			text.lines += [line]
+			text.tokens += [tokens]
+			self.text = text
+			return (old_lines != text.lines) or (old_tokens != text.tokens)
 
 		result = ""
 		operation = instr.operation
@@ -372,6 +462,7 @@ class PPCInstruction:
 				result += ", "
 			if type(instr.operands[j]) != str:
 				value = instr.operands[j]
+				text.refs.append(value)
 				if instr.operands[j] < 0:
 					string = "-0x%x" % -instr.operands[j]
 				else:
@@ -410,10 +501,11 @@ class PPCInstruction:
 
 		if len(result) > 0:
 			line += [[result, Qt.black]]
-		self.text.lines += [line]
-		self.text.tokens += [tokens]
+		text.lines += [line]
+		text.tokens += [tokens]
+		self.text = text
 
-		return (old_lines != self.text.lines) or (old_tokens != self.text.tokens)
+		return (old_lines != text.lines) or (old_tokens != text.tokens)
 
 	def patch_to_nop(self, exe):
 		exe.write(self.addr, "\x60\x00\x00\x00")
@@ -440,57 +532,59 @@ class PPCInstruction:
 		pass
 
 
-class ArmInstruction:
-	def __init__(self, opcode, addr, disasm):
-		self.opcode = opcode
-		self.addr = addr
-		self.disasm = disasm
-		self.plt = None
-		self.text = InstructionText()
-
-		self.target = None
-		if self.disasm.operation and ((self.disasm.operation == "b") or (self.disasm.operation == "bx") or (self.disasm.operation == "bl") or (self.disasm.operation == "blx")) and (type(self.disasm.operands[0]) != str):
-			self.target = disasm.operands[0]
-		elif self.disasm.operation and ((self.disasm.operation[0:2] == "b.") or (self.disasm.operation[0:3] == "bx.") or (self.disasm.operation[0:3] == "bl.") or (self.disasm.operation[0:4] == "blx.")) and (type(self.disasm.operands[0]) != str):
-			self.target = disasm.operands[0]
-
-	def isConditionalBranch(self):
-		if self.disasm.operation and ((self.disasm.operation[0:2] == "b.") or (self.disasm.operation[0:3] == "bx.")) and (self.target is not None):
-			return True
-		return False
-
-	def isLocalJump(self):
-		if self.disasm.operation and ((self.disasm.operation == "b") or (self.disasm.operation == "bx")) and (self.target is not None):
-			return True
-		return self.isConditionalBranch()
-
-	def isCall(self):
-		return self.disasm.operation and ((self.disasm.operation == "bl") or (self.disasm.operation == "blx") or (self.disasm.operation[0:3] == "bl.") or (self.disasm.operation[0:4] == "blx."))
-
-	def isBlockEnding(self):
-		if self.isLocalJump():
-			return True
-		if self.disasm.operation and ((self.disasm.operation == "b") or (self.disasm.operation == "bx")):
-			return True
-		if self.disasm.operation and (self.disasm.operation[0:3] == "ldm") and ("pc" in self.disasm.operands[1:]):
-			return True
-		if self.disasm.operation and (self.disasm.operation == "ldr") and (self.disasm.operands[0] == "pc"):
-			return True
-		if self.disasm.operation and (self.disasm.operation == "pop") and ("pc" in self.disasm.operands):
-			return True
-		return False
-
-	def isValid(self):
-		return self.disasm.operation != None
-
-	def length(self):
-		return self.disasm.length
+def create_arm_instr(opcode, addr, disasm, exe):
+	operation = disasm.operation
+	flags = 0
+	target = None
+	xrefs = []
+	if operation != None:
+		flags = INSTR_VALID
+		if ((operation in ["b", "bx", "bl", "blx"]) or (operation[0:2] == "b.") or (operation[0:3] == "bx.") or
+			(operation[0:3] == "bl.") or (operation[0:4] == "blx.")) and (type(disasm.operands[0]) != str):
+			target = disasm.operands[0]
+		if ((operation[0:2] == "b.") or (operation[0:3] == "bx.")) and (target is not None):
+			flags |= INSTR_CONDITIONAL_BRANCH | INSTR_LOCAL_JUMP
+		if (operation in ["b", "bx"]) and (target is not None):
+			flags |= INSTR_LOCAL_JUMP
+		if (operation in ["bl", "blx"]) or (operation[0:3] == "bl.") or (operation[0:4] == "blx."):
+			flags |= INSTR_CALL
+		if (flags & INSTR_LOCAL_JUMP) or (operation in ["b", "bx"]):
+			flags |= INSTR_BLOCK_ENDING
+		elif (operation[0:3] == "ldm") and ("pc" in disasm.operands[1:]):
+			flags |= INSTR_BLOCK_ENDING
+		elif (operation == "ldr") and (disasm.operands[0] == "pc"):
+			flags |= INSTR_BLOCK_ENDING
+		elif (operation == "pop") and ("pc" in disasm.operands):
+			flags |= INSTR_BLOCK_ENDING
+
+		if target != None:
+			xrefs.append((get_branch_xref_type(flags), target))
+	for operand in disasm.operands:
+		if (type(operand) in [int, long]) and (operand != target) and (operand >= exe.start()) and (operand < exe.end()):
+			xrefs.append(("ptr", operand))
+		elif (operand.__class__ == Arm.MemoryOperand) and (len(operand.components) == 1) and (type(operand.components[0]) in [int, long]):
+			# PC relative literal load
+			value = operand.components[0]
+			if (value >= exe.start()) and (value < exe.end()):
+				xrefs.append(("data", value))
+	return ArmInstruction(opcode, addr, disasm.length, flags, target, tuple(xrefs))
+
+class ArmInstruction(CompactInstruction):
+	__slots__ = []
+
+	@property
+	def disasm(self):
+		if len(self.opcode) != 4:
+			return Arm.Instruction()
+		return Arm.disassemble(struct.unpack("<I", self.opcode)[0], self.addr)
+
+	def get_plt(self, exe):
+		return None
 
 	def format_text(self, block, options):
 		old_lines = []
 		old_tokens = []
-		self.text.lines = []
-		self.text.tokens = []
+		text = InstructionText()
 
 		line = []
 		tokens = []
@@ -504,9 +598,10 @@ class ArmInstruction:
 
 		if instr.operation == None:
 			line += [["??", Qt.black]]
-			self.text.lines += [line]
-			self.text.tokens += [tokens]
-			return (old_lines != self.text.lines) or (old_tokens != self.text.tokens)
+			text.lines += [line]
+			text.tokens += [tokens]
+			self.text = text
+			return (old_lines != text.lines) or (old_tokens != text.tokens)
 
 		result = ""
 		operation = instr.operation.replace(".", "")
@@ -574,6 +669,7 @@ class ArmInstruction:
 							result += "%s %d" % (instr.operands[j].components[k][1], instr.operands[j].components[k][2])
 					else:
 						value = instr.operands[j].components[k]
+						text.refs.append(value)
 						if instr.operands[j].components[k] < 0:
 							string = "-0x%x" % -instr.operands[j].components[k]
 						else:
@@ -611,6 +707,7 @@ class ArmInstruction:
 					result += "!"
 			elif type(instr.operands[j]) != str:
 				value = instr.operands[j]
+				text.refs.append(value)
 				if instr.operands[j] < 0:
 					string = "-0x%x" % -instr.operands[j]
 				else:
@@ -657,6 +754,7 @@ class ArmInstruction:
 			if (addr >= block.exe.start()) and ((addr + 4) <= block.exe.end()):
 				result += " ; ="
 				value = block.exe.read_uint32(addr)
+				text.refs.append(value)
 				string = "0x%x" % value
 				if block.analysis.functions.has_key(value):
 					# Pointer to existing function
@@ -689,14 +787,15 @@ class ArmInstruction:
 
 		if len(result) > 0:
 			line += [[result, Qt.black]]
-		self.text.lines += [line]
-		self.text.tokens += [tokens]
+		text.lines += [line]
+		text.tokens += [tokens]
+		self.text = text
 
-		return (old_lines != self.text.lines) or (old_tokens != self.text.tokens)
+		return (old_lines != text.lines) or (old_tokens != text.tokens)
 
 	def patch_to_nop(self, exe):
 		if self.addr & 1:
-			if self.disasm.length == 4:
+			if self.size == 4:
 				exe.write(self.addr & (~1), "\x00\x46\x00\x46")
 			else:
 				exe.write(self.addr & (~1), "\x00\x46")
@@ -730,7 +829,7 @@ class ArmInstruction:
 
 	def patch_to_zero_return(self, exe):
 		if self.addr & 1:
-			if self.disasm.length == 4:
+			if self.size == 4:
 				exe.write(self.addr & (~1), "\x00\x20\x00\x46")
 			else:
 				exe.write(self.addr & (~1), "\x00\x20")
@@ -746,7 +845,7 @@ class ArmInstruction:
 	def patch_to_fixed_return_value(self, exe, value):
 		if self.addr & 1:
 			exe.write_uint16(self.addr & (~1), 0x2000 | (value & 0xff))
-			if self.disasm.length == 4:
+			if self.size == 4:
 				exe.write((self.addr + 2) & (~1), "\x00\x46")
 		else:
 			cc = exe.read_uint32(self.addr) & 0xf0000000
@@ -766,45 +865,19 @@ class BasicBlock:
 		self.false_path = None
 		self.instrs = []
 		self.header_text = InstructionText()
+		self.func = None
+		self.text_options = None
 
 	def populate(self, known_instrs):
 		addr = self.entry
 		while True:
 			known_instrs[addr] = self
 
-			if self.exe.architecture() == "x86":
-				opcode = self.exe.read(addr, 15)
-				result = X86.disassemble32(opcode, addr)
-				opcode = opcode[0:result.length]
-				instr = X86Instruction(opcode, addr, result, 4)
-				arch = X86
-			elif self.exe.architecture() == "x86_64":
-				opcode = self.exe.read(addr, 15)
-				result = X86.disassemble64(opcode, addr)
-				opcode = opcode[0:result.length]
-				instr = X86Instruction(opcode, addr, result, 8)
-				arch = X86
-			elif self.exe.architecture() == "ppc":
-				opcode = self.exe.read(addr, 4)
-				if len(opcode) == 4:
-					result = PPC.disassemble(struct.unpack(">I", opcode)[0], addr)
-					instr = PPCInstruction(opcode, addr, result)
-				else:
-					instr = PPCInstruction("", addr, PPC.Instruction())
-				arch = PPC
-			elif self.exe.architecture() == "arm":
-				opcode = self.exe.read(addr & (~1), 4)
-				if len(opcode) == 4:
-					result = Arm.disassemble(struct.unpack("<I", opcode)[0], addr)
-					instr = ArmInstruction(opcode, addr, result)
-				else:
-					instr = ArmInstruction("", addr, Arm.Instruction())
-				arch = Arm
-			else:
+			instr = self.analysis.get_instr(addr)
+			if instr is None:
 				break
 
 			self.instrs += [instr]
-			instr.format_text(self, self.analysis.options)
 			if not instr.isValid():
 				break
 
@@ -822,12 +895,24 @@ class BasicBlock:
 				self.exits += [addr]
 				break
 
-	def update(self):
-		changed = False
+	def format_text(self):
+		# Instruction text is only built when the block is shown, and is kept until the display
+		# options change or a name in the text is changed.  Returns True if the text was formatted.
+		if (self.text_options is not None) and (self.text_options == self.analysis.options):
+			return False
+		options = frozenset(self.analysis.options)
+		if self.func is not None:
+			header_text = InstructionText()
+			header_text.lines += [[[self.func.name + ":", QColor(192, 0, 0)]]]
+			header_text.tokens += [[[0, len(self.func.name), "ptr", self.entry, self.func.name]]]
+			self.header_text = header_text
 		for instr in self.instrs:
-			if instr.format_text(self, self.analysis.options):
-				changed = True
-		return changed
+			instr.format_text(self, options)
+		self.text_options = options
+		return True
+
+	def invalidate_text(self):
+		self.text_options = None
 
 class Function:
 	def __init__(self, analysis, exe, entry, name = None):
@@ -839,22 +924,20 @@ class Function:
 		else:
 			self.name = "sub_%.8x" % entry
 		self.blocks = {}
+		self.ref_addrs = set()
+		self.xref_addrs = set()
 		self.plt = False
 		self.ready = False
 		self.update_id = None
 
 	def findBasicBlocks(self):
-		# Reset block information in case we are reanalyzing an updated function
-		self.blocks = {}
-		self.plt = False
-		self.ready = False
-		self.update_id = self.analysis.get_next_update_id()
+		# Blocks are built separately and published when complete, so that the previous version
+		# of a function being reanalyzed can still be read without the analysis lock
+		blocks = {}
 
 		# Create initial basic block and add it to the queue
-		block = BasicBlock(self.analysis, self.exe, self.entry)
-		block.header_text.lines += [[[self.name + ":", QColor(192, 0, 0)]]]
-		block.header_text.tokens += [[[0, len(self.name), "ptr", self.entry, self.name]]]
-		queue = [block]
+		block = self.create_entry_block()
+		queue = WorkList([block])
 		known_instrs = {}
 
 		# Process until all blocks are found
@@ -863,15 +946,12 @@ class Function:
 
 			# Find instructions for this block
 			block.populate(known_instrs)
-			self.blocks[block.entry] = block
+			blocks[block.entry] = block
 
 			# Follow block exits
 			for edge in block.exits:
-				already_found = edge in self.blocks
-				for i in queue:
-					if i.entry == edge:
-						already_found = True
-				if not already_found:
+				# Queued blocks are already present in the block list
+				if edge not in blocks:
 					if edge in known_instrs:
 						# Address is within another basic block, split the block so that
 						# the new edge can point to a basic block as well
@@ -887,7 +967,7 @@ class Function:
 						new_block.instrs = block.instrs[i:]
 						for instr in new_block.instrs:
 							known_instrs[instr.addr] = new_block
-						self.blocks[edge] = new_block
+						blocks[edge] = new_block
 
 						block.exits = [edge]
 						block.true_path = None
@@ -896,22 +976,77 @@ class Function:
 					else:
 						# New basic block
 						block = BasicBlock(self.analysis, self.exe, edge)
-						self.blocks[edge] = block
+						blocks[edge] = block
 						known_instrs[edge] = block
-						queue += [block]
+						queue.add(block)
+
+		self.publish(blocks)
+
+		self.plt = False
+		if (len(blocks) == 1) and (len(block.instrs) == 1):
+			# get_plt decodes the instruction again, so only call it once
+			plt = block.instrs[0].get_plt(self.exe)
+			if plt != None:
+				# Function is a trampoline to a PLT entry
+				self.rename(plt)
+				self.plt = True
+				self.exe.create_symbol(self.entry, self.name)
+
+		self.update_id = self.analysis.get_next_update_id()
+
+	def create_entry_block(self):
+		# The entry block shows the name of the function above its instructions
+		block = BasicBlock(self.analysis, self.exe, self.entry)
+		block.func = self
+		return block
 
+	def publish(self, blocks):
 		# Set previous block list for each block
-		for block in self.blocks.values():
+		for block in blocks.values():
 			block.prev = []
-		for block in self.blocks.values():
+		for block in blocks.values():
 			for exit in block.exits:
-				self.blocks[exit].prev.append(block)
-
-		if (len(self.blocks) == 1) and (len(block.instrs) == 1) and (block.instrs[0].plt != None):
-			# Function is a trampoline to a PLT entry
-			self.rename(block.instrs[0].plt)
-			self.plt = True
+				blocks[exit].prev.append(block)
+
+		# Replace the block list in a single assignment, readers see either version in full
+		self.analysis.remove_from_instr_index(self)
+		self.analysis.remove_from_xref_index(self)
+		self.analysis.text_lock.acquire()
+		self.analysis.remove_from_ref_index(self)
+		self.blocks = blocks
+		self.analysis.add_to_ref_index(self)
+		self.analysis.text_lock.release()
+		self.analysis.add_to_instr_index(self)
+		self.analysis.add_to_xref_index(self)
+		self.analysis.call_graph.set_calls(self.entry, self.findCalls())
+
+	def restore(self, saved_blocks, plt):
+		# Rebuild the function from blocks saved in the analysis database, taking instructions
+		# from the instruction cache instead of following the code again
+		blocks = {}
+		for entry, instr_addrs, exits, true_path, false_path in saved_blocks:
+			if entry == self.entry:
+				block = self.create_entry_block()
+			else:
+				block = BasicBlock(self.analysis, self.exe, entry)
+			block.instrs = [self.analysis.get_instr(addr) for addr in instr_addrs]
+			block.exits = exits
+			block.true_path = true_path
+			block.false_path = false_path
+			blocks[entry] = block
+
+		self.publish(blocks)
+		self.plt = plt
+		if self.plt:
 			self.exe.create_symbol(self.entry, self.name)
+		self.update_id = self.analysis.get_next_update_id()
+
+	def save(self):
+		blocks = []
+		for block in self.blocks.values():
+			blocks.append((block.entry, [instr.addr for instr in block.instrs], block.exits,
+				block.true_path, block.false_path))
+		return (self.entry, self.name, self.plt, blocks)
 
 	def findCalls(self):
 		calls = []
@@ -922,18 +1057,77 @@ class Function:
 						calls += [instr.target]
 		return calls
 
+	def format_text(self, blocks):
+		# Formats the text of the given version of the block list, and records the names used by
+		# it when it is the current version
+		formatted = False
+		for block in blocks.values():
+			if block.format_text():
+				formatted = True
+		if formatted and (blocks is self.blocks):
+			self.analysis.remove_from_ref_index(self)
+			self.analysis.add_to_ref_index(self)
+
 	def update(self):
-		changed = False
-		for block in self.blocks.values():
-			if block.update():
-				changed = True
-		if changed:
-			self.update_id = self.analysis.get_next_update_id()
+		# Text is formatted again with the current options when the function is next shown
+		self.update_id = self.analysis.get_next_update_id()
 
 	def rename(self, name):
+		self.analysis.text_lock.acquire()
 		self.name = name
-		self.blocks[self.entry].header_text.lines[0] = [[name + ":", QColor(192, 0, 0)]]
-		self.blocks[self.entry].header_text.tokens[0] = [[0, len(self.name), "ptr", self.entry, self.name]]
+		if self.entry in self.blocks:
+			self.blocks[self.entry].invalidate_text()
+		self.analysis.text_lock.release()
+
+# State of a worker process used for parallel function discovery
+discovery_analysis = None
+
+def init_discovery_worker(exe_type, filename, regions):
+	# Workers map the file themselves, and are only sent the bytes that were changed from it
+	global discovery_analysis
+	if filename is None:
+		data = BinaryData(regions[0])
+	else:
+		data = BinaryFile(filename)
+		if regions != [(0, len(data))]:
+			parts = []
+			for region in regions:
+				if type(region) == tuple:
+					parts.append(data.read(region[0], region[1]))
+				else:
+					parts.append(region)
+			data = BinaryData("".join(parts))
+	discovery_analysis = Analysis(exe_type(data))
+
+def discover_function(entry):
+	# Decodes every instruction reachable from a function entry without following calls.  Runs
+	# in a worker process, and returns the saved form of the instructions so that they can be
+	# merged into the instruction cache of the main process.
+	analysis = discovery_analysis
+	instrs = []
+	found = set()
+	queue = [entry]
+	while len(queue) > 0:
+		addr = queue.pop()
+		while addr not in found:
+			found.add(addr)
+			instr = analysis.get_instr(addr)
+			if (instr is None) or (not instr.isValid()):
+				break
+			instrs.append(instr.save())
+
+			if instr.isBlockEnding():
+				if instr.isConditionalBranch():
+					queue += [instr.target, addr + instr.length()]
+				elif instr.target != None:
+					queue += [instr.target]
+				break
+
+			addr += instr.length()
+	return instrs
+
+def sweep_chunk_in_worker(chunk):
+	return sweep_chunk(discovery_analysis.exe, chunk)
 
 class Analysis:
 	def __init__(self, exe):
@@ -942,34 +1136,619 @@ class Analysis:
 		self.functions = {}
 		self.run = True
 		self.lock = threading.Lock()
-		self.queue = []
+		self.work_available = threading.Condition(self.lock)
+		# Guards instruction text and the reference index.  The GUI thread formats text holding only
+		# this lock, and the analysis thread takes it briefly to publish blocks or discard text, so
+		# rendering never waits for a function to be analyzed.  Taken after the analysis lock.
+		self.text_lock = threading.Lock()
+		# Priority requests from the GUI are queued under their own lock and applied by the analysis
+		# thread, so that they never wait for the analysis lock
+		self.priority_lock = threading.Lock()
+		self.priority_requests = []
+		self.queue = WorkList()
+		self.functions_analyzed = 0
 		self.status = ""
 		self.update_id = 0
 		self.update_request = False
 		self.options = set()
+		self.instr_cache = {}
+		self.instr_index = {}
+		self.ref_index = {}
+		self.xref_index = {}
+		self.call_graph = CallGraph()
+		self.renamed_addrs = set()
+		self.data_version = 0
+		self.discovery_pool = None
+		self.discovery_version = None
+		self.discovery = {}
+		self.discovery_failed = False
+		self.linear_sweep = True
+		self.sweep_chunks = []
+		self.sweep_results = []
+		self.sweep_wait_start = None
+		self.sweep_seeds = WorkList()
+		self.sweep_complete = False
+		self.persist_decode_tables = True
+		self.saved_decode_table_size = None
+		self.database_key = None
+		self.content_hash = None
+		self.file_stamp = None
+		self.files = []
+		self.user_symbols = []
+		self.edited_ranges = []
+		self.database_dirty = False
+		self.symbols_dirty = False
+		self.has_database = False
+		self.last_save_time = None
 		self.exe.add_callback(self)
 
+	def get_instr(self, addr):
+		# Decoded instructions are cached by address until a write touches their bytes
+		if addr in self.instr_cache:
+			return self.instr_cache[addr]
+
+		if self.exe.architecture() == "x86":
+			opcode = self.exe.read(addr, 15)
+			result = X86.disassemble32(opcode, addr)
+			opcode = opcode[0:result.length]
+		elif self.exe.architecture() == "x86_64":
+			opcode = self.exe.read(addr, 15)
+			result = X86.disassemble64(opcode, addr)
+			opcode = opcode[0:result.length]
+		elif self.exe.architecture() == "ppc":
+			opcode = self.exe.read(addr, 4)
+			if len(opcode) == 4:
+				result = PPC.disassemble(struct.unpack(">I", opcode)[0], addr)
+			else:
+				opcode = ""
+				result = PPC.Instruction()
+		elif self.exe.architecture() == "arm":
+			opcode = self.exe.read(addr & (~1), 4)
+			if len(opcode) == 4:
+				result = Arm.disassemble(struct.unpack("<I", opcode)[0], addr)
+			else:
+				opcode = ""
+				result = Arm.Instruction()
+		else:
+			return None
+
+		instr = self.create_instr(opcode, addr, result)
+		if instr.isValid():
+			self.instr_cache[addr] = instr
+		return instr
+
+	def create_instr(self, opcode, addr, result):
+		if self.exe.architecture() == "x86":
+			return create_x86_instr(opcode, addr, result, 4, self.exe)
+		elif self.exe.architecture() == "x86_64":
+			return create_x86_instr(opcode, addr, result, 8, self.exe)
+		elif self.exe.architecture() == "ppc":
+			return create_ppc_instr(opcode, addr, result, self.exe)
+		return create_arm_instr(opcode, addr, result, self.exe)
+
+	def restore_instr(self, saved):
+		# Recreates an instruction from the fields returned by its save method
+		opcode, addr, size, flags, target, xrefs = saved
+		if self.exe.architecture() == "x86":
+			return X86Instruction(opcode, addr, size, flags, target, xrefs, 4)
+		elif self.exe.architecture() == "x86_64":
+			return X86Instruction(opcode, addr, size, flags, target, xrefs, 8)
+		elif self.exe.architecture() == "ppc":
+			return PPCInstruction(opcode, addr, size, flags, target, xrefs)
+		return ArmInstruction(opcode, addr, size, flags, target, xrefs)
+
+	def disassemble_range(self, addr, size, instrs = False):
+		# Decodes the instructions in a range with a single read, without using the instruction cache
+		if self.exe.architecture() == "x86":
+			return X86.disassemble_range(self.exe.read(addr, size), addr, 32, instrs)
+		elif self.exe.architecture() == "x86_64":
+			return X86.disassemble_range(self.exe.read(addr, size), addr, 64, instrs)
+		elif self.exe.architecture() == "ppc":
+			return PPC.disassemble_range(self.exe.read(addr, size), addr, instrs)
+		elif self.exe.architecture() == "arm":
+			return Arm.disassemble_range(self.exe.read(addr & (~1), size), addr, instrs)
+		return None
+
+	def max_instr_length(self):
+		if self.exe.architecture() in ["x86", "x86_64"]:
+			return 15
+		return 4
+
+	def instr_addrs_in_range(self, table, start, end):
+		# Instructions are short, so only the addresses just before the range need to be checked
+		# for overlap.  Use the table's own keys when the range is larger than the table.
+		if (end - start) > len(table):
+			return table.keys()
+		return range(start - self.max_instr_length(), end + 1)
+
+	def invalidate_instrs(self, start, end):
+		# Remove cached instructions overlapping the byte range [start, end)
+		for addr in self.instr_addrs_in_range(self.instr_cache, start, end):
+			if addr not in self.instr_cache:
+				continue
+			instr = self.instr_cache[addr]
+			if self.exe.architecture() == "arm":
+				instr_start = addr & (~1)
+			else:
+				instr_start = addr
+			if (end > instr_start) and (start < (instr_start + len(instr.opcode))):
+				del self.instr_cache[addr]
+
+	def add_to_instr_index(self, func):
+		# The instruction index maps each instruction address to the functions containing it
+		for block in func.blocks.values():
+			for instr in block.instrs:
+				if instr.addr in self.instr_index:
+					self.instr_index[instr.addr].append((func, instr))
+				else:
+					self.instr_index[instr.addr] = [(func, instr)]
+
+	def remove_from_instr_index(self, func):
+		for block in func.blocks.values():
+			for instr in block.instrs:
+				if instr.addr not in self.instr_index:
+					continue
+				entries = [entry for entry in self.instr_index[instr.addr] if entry[0] is not func]
+				if len(entries) > 0:
+					self.instr_index[instr.addr] = entries
+				else:
+					del self.instr_index[instr.addr]
+
+	def add_to_ref_index(self, func):
+		# The reference index maps each address named in instruction text to the instructions
+		# naming it, so that only those are formatted again when the name changes.  Blocks that
+		# have not been formatted name nothing yet.
+		for block in func.blocks.values():
+			if block.text_options is None:
+				continue
+			for instr in block.instrs:
+				for addr in instr.text.refs:
+					if addr in self.ref_index:
+						self.ref_index[addr].append((func, block, instr))
+					else:
+						self.ref_index[addr] = [(func, block, instr)]
+					func.ref_addrs.add(addr)
+
+	def remove_from_ref_index(self, func):
+		for addr in func.ref_addrs:
+			if addr not in self.ref_index:
+				continue
+			entries = [entry for entry in self.ref_index[addr] if entry[0] is not func]
+			if len(entries) > 0:
+				self.ref_index[addr] = entries
+			else:
+				del self.ref_index[addr]
+		func.ref_addrs = set()
+
+	def add_to_xref_index(self, func):
+		# The cross reference index maps each address referenced by code to the instructions
+		# referencing it
+		for block in func.blocks.values():
+			for instr in block.instrs:
+				for xref_type, addr in instr.xrefs:
+					if addr in self.xref_index:
+						self.xref_index[addr].append((func, instr, xref_type))
+					else:
+						self.xref_index[addr] = [(func, instr, xref_type)]
+					func.xref_addrs.add(addr)
+
+	def remove_from_xref_index(self, func):
+		for addr in func.xref_addrs:
+			if addr not in self.xref_index:
+				continue
+			entries = [entry for entry in self.xref_index[addr] if entry[0] is not func]
+			if len(entries) > 0:
+				self.xref_index[addr] = entries
+			else:
+				del self.xref_index[addr]
+		func.xref_addrs = set()
+
+	def update_references(self, addrs):
+		# Discard the text of blocks naming any of the given addresses, along with the headers of
+		# functions at those addresses, so that it is formatted again when next shown
+		changed = set()
+		self.text_lock.acquire()
+		for addr in addrs:
+			if addr in self.functions:
+				changed.add(self.functions[addr])
+			if addr not in self.ref_index:
+				continue
+			for func, block, instr in self.ref_index[addr]:
+				block.invalidate_text()
+				changed.add(func)
+		self.text_lock.release()
+		for func in changed:
+			func.update_id = self.get_next_update_id()
+
+	def find_instrs_in_range(self, start, end):
+		result = []
+		for addr in self.instr_addrs_in_range(self.instr_index, start, end):
+			if addr not in self.instr_index:
+				continue
+			for func, instr in self.instr_index[addr]:
+				if (end > instr.addr) and (start < (instr.addr + len(instr.opcode))):
+					result.append((func, instr))
+		return result
+
+	def start_discovery_pool(self):
+		# Decoders are pure Python, so functions are disassembled in worker processes when more
+		# than one processor is available.  The pool is started when there is first work for it, kept
+		# until analysis stops, and started again for the new contents when the data is written to.
+		self.stop_discovery_pool()
+		self.discovery_version = self.data_version
+
+		if (multiprocessing is None) or self.discovery_failed or (self.exe.__class__ not in ExeFormats):
+			return
+
+		# The GUI replaces the standard streams with those of the Python console.  Workers are given
+		# the original streams, which multiprocessing flushes and closes when starting them.
+		streams = (sys.stdin, sys.stdout, sys.stderr)
+		try:
+			if multiprocessing.cpu_count() < 2:
+				return
+			if isinstance(self.exe.data, BinaryFile):
+				filename = self.exe.data.filename
+				regions = self.exe.data.file_regions()
+			else:
+				filename = None
+				regions = [self.exe.data.read(0, len(self.exe.data))]
+
+			# Start workers without forking where the platform allows it.  Python 2 on POSIX only has
+			# fork.  That is safe here, as the worker builds its own Analysis from the arguments and
+			# only runs the decoders.  It never uses Qt or the locks inherited from this process.
+			if hasattr(multiprocessing, "get_context"):
+				context = multiprocessing.get_context("spawn")
+			else:
+				context = multiprocessing
+			sys.stdin, sys.stdout, sys.stderr = sys.__stdin__, sys.__stdout__, sys.__stderr__
+			self.discovery_pool = context.Pool(initializer = init_discovery_worker,
+				initargs = (self.exe.__class__, filename, regions))
+			self.discovery_lookahead = multiprocessing.cpu_count() * 4
+		except Exception:
+			# Functions are decoded in this process instead
+			self.discovery_pool = None
+		finally:
+			sys.stdin, sys.stdout, sys.stderr = streams
+
+	def stop_discovery_pool(self):
+		if self.discovery_pool is not None:
+			self.discovery_pool.terminate()
+			self.discovery_pool = None
+		self.discovery_version = None
+		self.discovery = {}
+
+		# Chunks of the linear sweep that were handed to the workers must be scanned again
+		self.sweep_chunks = [chunk for chunk, result in self.sweep_results] + self.sweep_chunks
+		self.sweep_results = []
+		self.sweep_wait_start = None
+
+	def abandon_discovery_pool(self):
+		# Workers that do not respond, such as those that fail to start, are not used again and the
+		# remaining work is decoded in this process
+		self.stop_discovery_pool()
+		self.discovery_failed = True
+
+	def submit_discovery(self, entry):
+		# Submit the function along with those next in the queue, so that workers stay busy
+		if self.discovery_version != self.data_version:
+			self.start_discovery_pool()
+		if self.discovery_pool is None:
+			return None
+
+		for addr in [entry] + self.queue.peek(self.discovery_lookahead):
+			if addr not in self.discovery:
+				self.discovery[addr] = (self.discovery_version,
+					self.discovery_pool.apply_async(discover_function, (addr,)))
+		return self.discovery.pop(entry)
+
+	def merge_discovery(self, version, instrs):
+		# Results are discarded if the data was written to after they were submitted
+		if version != self.data_version:
+			return
+		for saved in instrs:
+			instr = self.restore_instr(saved)
+			if instr.addr not in self.instr_cache:
+				self.instr_cache[instr.addr] = instr
+
+	def start_sweep(self):
+		# Look for functions that are not reached through calls from the entry point, such as
+		# those only referenced through pointers.  Symbols in code are taken first, then the
+		# results of a linear sweep for prologues and for pointers into code.
+		if (not self.linear_sweep) or (self.exe.__class__ not in ExeFormats):
+			self.sweep_complete = True
+			return
+		self.sweep_chunks = create_sweep_chunks(self.exe)
+		code_ranges = self.exe.code_ranges()
+		for addr in sorted(self.exe.symbols_by_addr.keys(), reverse = True):
+			for start, end in code_ranges:
+				if (addr >= start) and (addr < end):
+					self.sweep_seeds.add(addr)
+					break
+
+	def continue_sweep(self):
+		# Scans one chunk of the linear sweep, or collects the result of one from the worker
+		# processes.  Returns False when the sweep is complete.
+		if self.discovery_version != self.data_version:
+			self.start_discovery_pool()
+		if self.discovery_pool is not None:
+			# Only keep a few chunks ahead of the workers, so that functions submitted for decoding
+			# do not wait behind the whole sweep
+			while (len(self.sweep_chunks) > 0) and (len(self.sweep_results) < self.discovery_lookahead):
+				chunk = self.sweep_chunks.pop(0)
+				self.sweep_results.append((chunk, self.discovery_pool.apply_async(sweep_chunk_in_worker, (chunk,))))
+
+		remaining = len(self.sweep_results) + len(self.sweep_chunks)
+		if remaining > 0:
+			self.status = "Scanning for functions (%d chunks remaining)..." % remaining
+
+		if len(self.sweep_results) > 0:
+			chunk, result = self.sweep_results[0]
+			if not result.ready():
+				if self.sweep_wait_start is None:
+					self.sweep_wait_start = time.time()
+				elif (time.time() - self.sweep_wait_start) > DISCOVERY_TIMEOUT:
+					self.abandon_discovery_pool()
+					return True
+				# Wait without the lock, returning periodically so that requests are not held up
+				self.lock.release()
+				result.wait(0.1)
+				self.lock.acquire()
+				return True
+			self.sweep_results.pop(0)
+			self.sweep_wait_start = None
+			try:
+				addrs = result.get()
+			except Exception:
+				addrs = sweep_chunk(self.exe, chunk)
+		elif len(self.sweep_chunks) > 0:
+			addrs = sweep_chunk(self.exe, self.sweep_chunks.pop(0))
+		else:
+			self.sweep_complete = True
+			return False
+
+		for addr in addrs:
+			self.sweep_seeds.add(addr)
+		return True
+
+	def cancel_sweep(self):
+		# A cancelled sweep counts as complete, so it is not started again when the database is loaded
+		self.lock.acquire()
+		self.clear_sweep()
+		if not self.sweep_complete:
+			self.sweep_complete = True
+			self.database_dirty = True
+		self.lock.release()
+
+	def clear_sweep(self):
+		self.sweep_chunks = []
+		self.sweep_results = []
+		self.sweep_wait_start = None
+		self.sweep_seeds.clear()
+
+	def next_function(self):
+		# Functions reached through calls or requested by the user are analyzed first.  Those found
+		# by the sweep are skipped if they turn out to be part of a function that is already known.
+		while self.run:
+			self.apply_priority_requests()
+			if len(self.queue) > 0:
+				return self.queue.pop()
+			if len(self.sweep_seeds) > 0:
+				entry = self.sweep_seeds.pop()
+				if (entry not in self.functions) and (entry not in self.instr_index):
+					return entry
+			elif not self.continue_sweep():
+				return None
+		return None
+
 	def get_next_update_id(self):
 		self.update_id += 1
 		return self.update_id
 
+	def load_database(self):
+		# Restore the results of an earlier analysis of the same contents, if there is one
+		if self.exe.__class__ not in ExeFormats:
+			return False
+		self.status = "Loading analysis database..."
+		self.database_key = sample_contents(self.exe.data)
+		if hasattr(self.exe.data, "filename"):
+			self.file_stamp = file_stamp(self.exe.data.filename)
+		if self.file_stamp is None:
+			# Not backed by a file that can be checked later, so hash the contents now
+			self.content_hash = hash_contents(self.exe.data)
+		db = load_analysis_database(self.database_key)
+		if (db is None) or (db["architecture"] != self.exe.architecture()):
+			return False
+
+		# A database with the same key is only used for a file it was saved for, or when the full
+		# hash shows that the contents are the same
+		self.files = list(db["files"])
+		if (self.file_stamp is None) or (self.file_stamp not in self.files):
+			if self.content_hash is None:
+				self.content_hash = hash_contents(self.exe.data)
+			if self.content_hash != db["content_hash"]:
+				self.content_hash = None
+				self.files = []
+				return False
+			if self.file_stamp is not None:
+				self.files = [stamp for stamp in self.files if stamp[0] != self.file_stamp[0]] + [self.file_stamp]
+				self.database_dirty = True
+		self.content_hash = db["content_hash"]
+
+		# Symbols and edits saved after the database was written replace the ones in it
+		symbols = db["symbols"]
+		edited_ranges = db["edited_ranges"]
+		delta = load_symbol_delta(self.database_key)
+		if (delta is not None) and (delta["content_hash"] == self.content_hash):
+			symbols = delta["symbols"]
+			edited_ranges = delta["edited_ranges"]
+
+		self.lock.acquire()
+		self.user_symbols = list(symbols)
+		self.sweep_complete = db.get("sweep_complete", False)
+		for addr, name, defined in self.user_symbols:
+			if defined:
+				self.exe.create_symbol(addr, name)
+			else:
+				self.exe.delete_symbol(addr, name)
+		for saved in db["instrs"]:
+			instr = self.restore_instr(saved)
+			self.instr_cache[instr.addr] = instr
+		self.lock.release()
+
+		for entry, name, plt, blocks in db["functions"]:
+			self.lock.acquire()
+			func = Function(self, self.exe, entry, name)
+			func.restore(blocks, plt)
+			self.functions[entry] = func
+			self.lock.release()
+
+		# Functions are shown once every function is known, so that call targets are named.  Names
+		# may have changed since the functions were saved.
+		self.lock.acquire()
+		for addr, name, defined in self.user_symbols:
+			if addr in self.functions:
+				if defined:
+					self.functions[addr].rename(name)
+				else:
+					self.functions[addr].rename("sub_%.8x" % addr)
+		for func in self.functions.values():
+			func.ready = True
+		self.lock.release()
+
+		# Functions containing bytes that were edited, but not saved, must be analyzed again
+		self.lock.acquire()
+		if hasattr(self.exe, "entry") and (self.exe.entry() in self.functions):
+			self.start = self.functions[self.exe.entry()]
+		for start, end in edited_ranges:
+			self.invalidate_data(start, end)
+		self.has_database = True
+		self.lock.release()
+		return True
+
+	def find_content_hash(self):
+		# The full hash of a file opened without a matching database is only needed once there is
+		# something to save.  Edits may have been made since, so hash the file as it is on disk, as long
+		# as it hasn't been changed.
+		if (self.content_hash is None) and (self.file_stamp is not None):
+			if file_stamp(self.exe.data.filename) == self.file_stamp:
+				self.content_hash = hash_file(self.exe.data.filename)
+				if self.content_hash is not None:
+					self.files = [self.file_stamp]
+		return self.content_hash
+
+	def save_database(self):
+		if (self.database_key is None) or (self.find_content_hash() is None):
+			# The contents can't be identified, so there is nowhere to save to
+			self.database_dirty = False
+			return
+
+		self.lock.acquire()
+		functions = []
+		instrs = {}
+		for func in self.functions.values():
+			if not func.ready:
+				continue
+			functions.append(func.save())
+			for block in func.blocks.values():
+				for instr in block.instrs:
+					if instr.isValid():
+						instrs[instr.addr] = instr.save()
+		db = {"architecture": self.exe.architecture(), "functions": functions, "instrs": instrs.values(),
+			"symbols": list(self.user_symbols), "edited_ranges": list(self.edited_ranges),
+			"sweep_complete": self.sweep_complete, "content_hash": self.content_hash, "files": list(self.files)}
+		self.database_dirty = False
+		self.symbols_dirty = False
+		self.lock.release()
+
+		if save_analysis_database(self.database_key, db):
+			self.has_database = True
+		self.last_save_time = time.time()
+
+	def save_symbols(self):
+		# Symbols and edits are saved on their own when they change, which is much smaller than the
+		# whole database.  Without a database to apply them to they wait for the next full save.
+		if not self.has_database:
+			return
+
+		self.lock.acquire()
+		delta = {"content_hash": self.content_hash, "symbols": list(self.user_symbols),
+			"edited_ranges": list(self.edited_ranges)}
+		self.symbols_dirty = False
+		self.lock.release()
+
+		save_symbol_delta(self.database_key, delta)
+
+	def is_database_save_due(self):
+		# The whole database is written at most once every DATABASE_SAVE_INTERVAL seconds
+		if not self.database_dirty:
+			return False
+		return (self.last_save_time is None) or ((time.time() - self.last_save_time) >= DATABASE_SAVE_INTERVAL)
+
+	def load_decode_tables(self):
+		# The Thumb lookup table is filled in as encodings are seen, so keep it between runs
+		if (not self.persist_decode_tables) or (self.exe.architecture() != "arm"):
+			return
+		table = load_decode_table("thumb16")
+		if table is not None:
+			Arm.set_thumb_16_table(table)
+		self.saved_decode_table_size = Arm.thumb_16_table_size()
+
+	def save_decode_tables(self):
+		if self.saved_decode_table_size is None:
+			return
+		size = Arm.thumb_16_table_size()
+		if size > self.saved_decode_table_size:
+			save_decode_table("thumb16", Arm.get_thumb_16_table())
+			self.saved_decode_table_size = size
+
 	def analyze(self):
+		self.load_decode_tables()
+		self.load_database()
+
 		self.lock.acquire()
-		if hasattr(self.exe, "entry"):
+		if hasattr(self.exe, "entry") and (self.start is None):
 			self.status = "Disassembling function at 0x%.8x..." % self.exe.entry()
 			self.start = Function(self, self.exe, self.exe.entry(), '_start')
 			self.functions[self.exe.entry()] = self.start
+			self.renamed_addrs.add(self.exe.entry())
 			self.start.findBasicBlocks()
-			self.queue += self.start.findCalls()
+			for call in self.start.findCalls():
+				self.queue.add(call)
 			self.start.ready = True
+			self.database_dirty = True
+		# A restored database already holds the functions found by a completed sweep
+		if not self.sweep_complete:
+			self.start_sweep()
 		self.lock.release()
 
 		while self.run:
-			while (len(self.queue) > 0) and self.run:
+			while self.run:
 				self.lock.acquire()
 
-				entry = self.queue.pop()
-				self.status = "Disassembling function at 0x%.8x..." % entry
+				entry = self.next_function()
+				if entry is None:
+					self.lock.release()
+					break
+				self.status = "Disassembling function at 0x%.8x (%d analyzed, %d queued)..." % (entry,
+					self.functions_analyzed, len(self.queue))
+
+				discovery = self.submit_discovery(entry)
+				if discovery is not None:
+					# Wait for a worker to decode the function without holding the lock
+					version, result = discovery
+					self.lock.release()
+					try:
+						instrs = result.get(DISCOVERY_TIMEOUT)
+					except multiprocessing.TimeoutError:
+						instrs = None
+					except Exception:
+						# Fall back to decoding in this process
+						instrs = []
+					self.lock.acquire()
+					if instrs is None:
+						self.abandon_discovery_pool()
+					else:
+						self.merge_discovery(version, instrs)
 
 				if entry not in self.functions:
 					if entry in self.exe.symbols_by_addr:
@@ -977,6 +1756,7 @@ class Analysis:
 					else:
 						func = Function(self, self.exe, entry)
 					self.functions[entry] = func
+					self.renamed_addrs.add(entry)
 				else:
 					func = self.functions[entry]
 
@@ -984,71 +1764,160 @@ class Analysis:
 				calls = func.findCalls()
 
 				for call in calls:
-					already_found = self.functions.has_key(call)
-					for i in self.queue:
-						if i == call:
-							already_found = True
-					if not already_found:
-						self.queue += [call]
+					if not self.functions.has_key(call):
+						self.queue.add(call)
 
 				func.ready = True
+				self.functions_analyzed += 1
+				self.database_dirty = True
 				self.lock.release()
 
-				# Give GUI thread a chance to do stuff
-				time.sleep(0.001)
+				# Yield so that the GUI thread can take the lock between functions
+				time.sleep(0)
 
-			# Update disassembly so that function names are correct
-			self.update_request = False
-			for func in self.functions.values():
-				if not self.run:
-					break
+			# Update instructions naming functions that were found or renamed
+			self.lock.acquire()
+			if len(self.renamed_addrs) > 0:
+				self.status = "Updating references to %d addresses..." % len(self.renamed_addrs)
+				self.update_references(self.renamed_addrs)
+				self.renamed_addrs = set()
+			self.lock.release()
+
+			# Update all disassembly when display options change
+			if self.update_request:
 				self.lock.acquire()
-				self.status = "Updating function at 0x%.8x..." % func.entry
-				func.update()
+				self.update_request = False
+				for func in self.functions.values():
+					func.update()
 				self.lock.release()
-				time.sleep(0.001)
 
-			# Wait for any additional function requests to come in
+			# Save results so that the file does not need to be analyzed again when reopened
+			if self.run and (len(self.queue) == 0):
+				if self.is_database_save_due():
+					self.status = "Saving analysis database..."
+					self.save_database()
+					self.save_decode_tables()
+				elif self.symbols_dirty:
+					self.save_symbols()
+
+			# Wait for any additional function requests to come in, or for a delayed save to be due
+			self.lock.acquire()
 			self.status = ""
-			while (len(self.queue) == 0) and (not self.update_request) and self.run:
-				time.sleep(0.1)
+			while (len(self.queue) == 0) and (len(self.renamed_addrs) == 0) and (not self.update_request) and self.run:
+				if self.database_dirty:
+					if self.is_database_save_due():
+						break
+					self.work_available.wait(self.last_save_time + DATABASE_SAVE_INTERVAL - time.time())
+				else:
+					self.work_available.wait()
+			self.lock.release()
+
+		self.stop_discovery_pool()
 
 	def stop(self):
-		run = False
+		self.lock.acquire()
+		self.run = False
+		self.clear_sweep()
+		self.work_available.notify()
+		self.lock.release()
+
+	def request_function(self, addr):
+		# Create a function at the requested address ahead of anything else in the queue
+		self.lock.acquire()
+		if addr not in self.functions:
+			self.queue.add_priority(addr)
+			self.work_available.notify()
+		self.lock.release()
+
+	def prioritize(self, addrs):
+		# Move queued functions ahead of the rest of the queue, with the first address analyzed first.
+		# This is called from the GUI thread, so the request is applied when the next function is
+		# chosen instead of waiting for the analysis lock.
+		self.priority_lock.acquire()
+		self.priority_requests.append(addrs)
+		self.priority_lock.release()
+
+	def apply_priority_requests(self):
+		# Called with the analysis lock held.  Later requests end up ahead of earlier ones.
+		self.priority_lock.acquire()
+		requests = self.priority_requests
+		self.priority_requests = []
+		self.priority_lock.release()
+		for addrs in requests:
+			for addr in reversed(addrs):
+				if addr in self.queue:
+					self.queue.add_priority(addr)
 
 	def find_instr(self, addr, exact_match = False):
 		self.lock.acquire()
 
-		for func in self.functions.values():
-			for block in func.blocks.values():
-				for instr in block.instrs:
-					if (exact_match and (addr == instr.addr)) or ((not exact_match) and (addr >= instr.addr) and (addr < (instr.addr + len(instr.opcode)))):
-						result = [func.entry, instr.addr]
-						self.lock.release()
-						return result
+		if exact_match:
+			if addr in self.instr_index:
+				func, instr = self.instr_index[addr][0]
+				self.lock.release()
+				return [func.entry, instr.addr]
+		else:
+			entries = self.find_instrs_in_range(addr, addr + 1)
+			if len(entries) > 0:
+				func, instr = entries[0]
+				self.lock.release()
+				return [func.entry, instr.addr]
 
 		self.lock.release()
 		return [None, None]
 
-	def notify_data_write(self, data, ofs, contents):
+	def get_xrefs(self, addr):
+		# Returns a sorted list of [from_addr, func_entry, type] for each reference to the address
+		self.lock.acquire()
+		result = []
+		if addr in self.xref_index:
+			for func, instr, xref_type in self.xref_index[addr]:
+				result.append([instr.addr, func.entry, xref_type])
+		self.lock.release()
+		result.sort()
+		return result
+
+	def get_callers(self, addr):
+		self.lock.acquire()
+		result = self.call_graph.get_callers(addr)
+		self.lock.release()
+		return result
+
+	def get_callees(self, addr):
 		self.lock.acquire()
+		result = self.call_graph.get_callees(addr)
+		self.lock.release()
+		return result
+
+	def format_text(self, func, blocks):
+		# Formats instruction text for display or export.  Analysis alone never builds text.  Only
+		# the text lock is held, so this does not wait while the analysis thread holds the lock.
+		self.text_lock.acquire()
+		func.format_text(blocks)
+		self.text_lock.release()
 
+	def get_call_graph(self):
+		# Returns a snapshot of the call graph for queries over the whole program
+		self.lock.acquire()
+		result = self.call_graph.compact()
+		self.lock.release()
+		return result
+
+	def invalidate_data(self, start, end):
 		# Update any functions containing the updated bytes
-		start = ofs
-		end = ofs + len(contents)
+		self.invalidate_instrs(start, end)
+		self.data_version += 1
 
-		for func in self.functions.values():
-			added = False
-			for block in func.blocks.values():
-				for instr in block.instrs:
-					if (end > instr.addr) and (start < (instr.addr + len(instr.opcode))):
-						if func.entry not in self.queue:
-							self.queue += [func.entry]
-							added = True
-							break
-				if added:
-					break
+		for func, instr in self.find_instrs_in_range(start, end):
+			self.queue.add(func.entry)
 
+	def notify_data_write(self, data, ofs, contents):
+		self.lock.acquire()
+		self.invalidate_data(ofs, ofs + len(contents))
+		self.edited_ranges.append((ofs, ofs + len(contents)))
+		self.database_dirty = True
+		self.symbols_dirty = True
+		self.work_available.notify()
 		self.lock.release()
 
 	def create_symbol(self, addr, name):
@@ -1056,7 +1925,10 @@ class Analysis:
 		self.exe.create_symbol(addr, name)
 		if addr in self.functions:
 			self.functions[addr].rename(name)
-		self.update_request = True
+		self.user_symbols.append((addr, name, True))
+		self.renamed_addrs.add(addr)
+		self.symbols_dirty = True
+		self.work_available.notify()
 		self.lock.release()
 
 	def undefine_symbol(self, addr, name):
@@ -1064,7 +1936,10 @@ class Analysis:
 		self.exe.delete_symbol(addr, name)
 		if addr in self.functions:
 			self.functions[addr].rename("sub_%.8x" % addr)
-		self.update_request = True
+		self.user_symbols.append((addr, name, False))
+		self.renamed_addrs.add(addr)
+		self.symbols_dirty = True
+		self.work_available.notify()
 		self.lock.release()
 
 	def set_address_view(self, addr):
@@ -1074,6 +1949,7 @@ class Analysis:
 		else:
 			self.options.remove("address") 
 		self.update_request = True
+		self.work_available.notify()
 		self.lock.release()
 
 	def isPreferredForFile(data):
@@ -0,0 +1,163 @@
+# Copyright (c) 2011-2015 Rusty Wagner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import hashlib
+import tempfile
+import zlib
+import cPickle
+
+
+ANALYSIS_DATABASE_VERSION = 3
+
+# Seconds between writes of the whole database while analysis results keep changing
+DATABASE_SAVE_INTERVAL = 30
+
+# Files are keyed by their size and this many blocks spread evenly through them
+SAMPLE_COUNT = 16
+SAMPLE_SIZE = 0x10000
+
+
+def analysis_database_dir():
+	return os.path.join(os.path.expanduser("~"), ".binaryninja", "analysis")
+
+def analysis_database_path(key):
+	return os.path.join(analysis_database_dir(), key + ".db")
+
+def symbol_delta_path(key):
+	return os.path.join(analysis_database_dir(), key + ".symbols")
+
+def decode_table_path(name):
+	return os.path.join(analysis_database_dir(), name + ".table")
+
+def hash_contents(data):
+	# Full hash of the contents, stored in the database to tell apart files with the same key
+	h = hashlib.sha1()
+	ofs = 0
+	size = len(data)
+	while ofs < size:
+		block = data.view(ofs, min(size - ofs, 0x100000))
+		if len(block) == 0:
+			break
+		h.update(block)
+		ofs += len(block)
+	return h.hexdigest()
+
+def hash_file(path):
+	try:
+		f = open(path, "rb")
+		try:
+			h = hashlib.sha1()
+			while True:
+				block = f.read(0x100000)
+				if len(block) == 0:
+					break
+				h.update(block)
+			return h.hexdigest()
+		finally:
+			f.close()
+	except EnvironmentError:
+		return None
+
+def sample_contents(data):
+	# Databases are keyed by the contents of the file, not its name.  Only the size and a sample of
+	# the contents are hashed, so that opening a large file doesn't read all of it.
+	size = len(data)
+	if size <= (SAMPLE_COUNT * SAMPLE_SIZE):
+		return hash_contents(data)
+	h = hashlib.sha1()
+	h.update(str(size))
+	for i in xrange(0, SAMPLE_COUNT):
+		h.update(data.view(((size - SAMPLE_SIZE) * i) / (SAMPLE_COUNT - 1), SAMPLE_SIZE))
+	return h.hexdigest()
+
+def file_stamp(path):
+	# Identifies an unchanged file on disk, so that a database matched by its sampled contents can be
+	# used without hashing the whole file again
+	try:
+		info = os.stat(path)
+	except EnvironmentError:
+		return None
+	return (os.path.normcase(os.path.realpath(path)), info.st_size, info.st_mtime)
+
+def read_database_file(path):
+	try:
+		f = open(path, "rb")
+		try:
+			return cPickle.loads(zlib.decompress(f.read()))
+		finally:
+			f.close()
+	except (EnvironmentError, EOFError, zlib.error, cPickle.UnpicklingError, AttributeError, ImportError,
+		ValueError, IndexError, TypeError):
+		return None
+
+def write_database_file(path, contents):
+	# Write to a temporary file first so that a partially written database is never loaded
+	temp_name = None
+	try:
+		if not os.path.exists(analysis_database_dir()):
+			os.makedirs(analysis_database_dir())
+		fd, temp_name = tempfile.mkstemp(dir = analysis_database_dir())
+		f = os.fdopen(fd, "wb")
+		try:
+			f.write(zlib.compress(cPickle.dumps(contents, 2), 1))
+		finally:
+			f.close()
+		if (os.name == "nt") and os.path.exists(path):
+			os.remove(path)
+		os.rename(temp_name, path)
+		temp_name = None
+	except (EnvironmentError, cPickle.PicklingError):
+		return False
+	finally:
+		if (temp_name is not None) and os.path.exists(temp_name):
+			os.remove(temp_name)
+	return True
+
+def load_analysis_database(key):
+	db = read_database_file(analysis_database_path(key))
+	if (type(db) != dict) or (db.get("version") != ANALYSIS_DATABASE_VERSION):
+		return None
+	return db
+
+def save_analysis_database(key, db):
+	# The database holds the user's symbols too, so any separately saved changes to them are replaced
+	db["version"] = ANALYSIS_DATABASE_VERSION
+	if not write_database_file(analysis_database_path(key), db):
+		return False
+	try:
+		if os.path.exists(symbol_delta_path(key)):
+			os.remove(symbol_delta_path(key))
+	except EnvironmentError:
+		pass
+	return True
+
+def load_symbol_delta(key):
+	# Symbols and edits made since the database was last written
+	delta = read_database_file(symbol_delta_path(key))
+	if (type(delta) != dict) or (delta.get("version") != ANALYSIS_DATABASE_VERSION):
+		return None
+	return delta
+
+def save_symbol_delta(key, delta):
+	delta["version"] = ANALYSIS_DATABASE_VERSION
+	return write_database_file(symbol_delta_path(key), delta)
+
+def load_decode_table(name):
+	# Decoder lookup tables are shared by every file of the same architecture
+	return read_database_file(decode_table_path(name))
+
+def save_decode_table(name, table):
+	return write_database_file(decode_table_path(name), table)
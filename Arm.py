@@ -18,6 +18,10 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 
+import struct
+from InstructionRange import *
+from FormatString import *
+
 Registers = ["r%d" % i for i in xrange(0, 13)] + ["sp", "lr", "pc"]
 
 ConditionalSuffix = [".eq", ".ne", ".cs", ".cc", ".mi", ".pl", ".vs", ".vc", ".hi", ".ls", ".ge", ".lt", ".gt", ".le", "", ""]
@@ -61,7 +65,7 @@ def reg_shift_reg(basereg, typecode, shiftreg, neg = False):
 		return [prefix + Registers[basereg], "asr", Registers[shiftreg]]
 	return [prefix + Registers[basereg], "ror", Registers[shiftreg]]
 
-def arm_unconditional_instr(instr, opcode):
+def arm_unconditional_instr(instr, opcode, addr):
 	op1 = (opcode >> 20) & 0xff
 
 	if (op1 & 0b11100000) == 0b10100000:
@@ -72,610 +76,556 @@ def arm_unconditional_instr(instr, opcode):
 		else:
 			instr.operands = [(addr + 8 + (imm24 << 2) + ((opcode >> 23) & 2) + 1) & 0xffffffff]
 
-def arm_data_processing_instr(instr, opcode, addr):
-	op = (opcode >> 25) & 1
+def arm_multiply_instr(instr, opcode, addr):
 	op1 = (opcode >> 20) & 0x1f
-	op2 = (opcode >> 4) & 0xf
 	rn = (opcode >> 16) & 0xf
 	rd = (opcode >> 12) & 0xf
 	imm5 = (opcode >> 7) & 0x1f
-	typecode = (opcode >> 5) & 3
 	rm = opcode & 0xf
-	if op == 0:
-		if op2 == 0b1001:
-			if (op1 & 0b11110) == 0b00000:
-				instr.operation = "mul"
-				if op1 & 1:
-					instr.operation += "s"
-				instr.operands = [Registers[rn], Registers[rm], Registers[imm5 >> 1]]
-			elif (op1 & 0b11110) == 0b00010:
-				instr.operation = "mla"
-				if op1 & 1:
-					instr.operation += "s"
-				instr.operands = [Registers[rn], Registers[rm], Registers[imm5 >> 1], Registers[rd]]
-			elif op1 == 0b00100:
-				instr.operation = "umaal"
-				instr.operands = [Registers[rd], Registers[rn], Registers[rm], Registers[imm5 >> 1]]
-			elif op1 == 0b00110:
-				instr.operation = "mls"
-				instr.operands = [Registers[rn], Registers[rm], Registers[imm5 >> 1], Registers[rd]]
-			if (op1 & 0b11110) == 0b01000:
-				instr.operation = "umull"
-				if op1 & 1:
-					instr.operation += "s"
-				instr.operands = [Registers[rd], Registers[rn], Registers[rm], Registers[imm5 >> 1]]
-			elif (op1 & 0b11110) == 0b01010:
-				instr.operation = "umlal"
-				if op1 & 1:
-					instr.operation += "s"
-				instr.operands = [Registers[rd], Registers[rn], Registers[rm], Registers[imm5 >> 1]]
-			if (op1 & 0b11110) == 0b01100:
-				instr.operation = "smull"
-				if op1 & 1:
-					instr.operation += "s"
-				instr.operands = [Registers[rd], Registers[rn], Registers[rm], Registers[imm5 >> 1]]
-			elif (op1 & 0b11110) == 0b01110:
-				instr.operation = "smlal"
-				if op1 & 1:
-					instr.operation += "s"
-				instr.operands = [Registers[rd], Registers[rn], Registers[rm], Registers[imm5 >> 1]]
-			elif op1 == 0b10000:
-				instr.operation = "swp"
-				instr.operands = [Registers[rd], Registers[rm], MemoryOperand([Registers[rn]], False)]
-			elif op1 == 0b10100:
-				instr.operation = "swpb"
-				instr.operands = [Registers[rd], Registers[rm], MemoryOperand([Registers[rn]], False)]
-			elif op1 == 0b11000:
-				instr.operation = "strex"
-				instr.operands = [Registers[rd], Registers[rm], MemoryOperand([Registers[rn]], False)]
-			elif op1 == 0b11001:
-				instr.operation = "ldrex"
-				instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False)]
-			elif op1 == 0b11010:
-				instr.operation = "strexd"
-				instr.operands = [Registers[rd], Registers[rm], Registers[(rm + 1) & 0xf], MemoryOperand([Registers[rn]], False)]
-			elif op1 == 0b11011:
-				instr.operation = "ldrexd"
-				instr.operands = [Registers[rd], Registers[(rd + 1) & 0xf], MemoryOperand([Registers[rn]], False)]
-			elif op1 == 0b11100:
-				instr.operation = "strexb"
-				instr.operands = [Registers[rd], Registers[rm], MemoryOperand([Registers[rn]], False)]
-			elif op1 == 0b11101:
-				instr.operation = "ldrexb"
-				instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False)]
-			elif op1 == 0b11110:
-				instr.operation = "strexh"
-				instr.operands = [Registers[rd], Registers[rm], MemoryOperand([Registers[rn]], False)]
-			elif op1 == 0b11111:
-				instr.operation = "ldrexh"
-				instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False)]
-		elif (op2 & 0b1001) == 0b1001:
-			if (op1 & 0b10010) == 0b00010:
-				if op2 == 0b1011:
-					if op1 & 1:
-						instr.operation = "ldrht"
-					else:
-						instr.operation = "strht"
-					instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False)]
-					if op1 & 4:
-						if op1 & 8:
-							instr.operands.append(((opcode >> 4) & 0xf0) | (opcode & 0xf))
-						else:
-							instr.operands.append(-(((opcode >> 4) & 0xf0) | (opcode & 0xf)))
-					else:
-						if op1 & 8:
-							instr.operands.append(Registers[rm])
-						else:
-							instr.operands.append("-" + Registers[rm])
-				elif op2 == 0b1101:
-					instr.operation = "ldrsbt"
-					instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False)]
-					if op1 & 4:
-						if op1 & 8:
-							instr.operands.append(((opcode >> 4) & 0xf0) | (opcode & 0xf))
-						else:
-							instr.operands.append(-(((opcode >> 4) & 0xf0) | (opcode & 0xf)))
-					else:
-						if op1 & 8:
-							instr.operands.append(Registers[rm])
-						else:
-							instr.operands.append("-" + Registers[rm])
-				elif op2 == 0b1101:
-					instr.operation = "ldrsht"
-					instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False)]
-					if op1 & 4:
-						if op1 & 8:
-							instr.operands.append(((opcode >> 4) & 0xf0) | (opcode & 0xf))
-						else:
-							instr.operands.append(-(((opcode >> 4) & 0xf0) | (opcode & 0xf)))
-					else:
-						if op1 & 8:
-							instr.operands.append(Registers[rm])
-						else:
-							instr.operands.append("-" + Registers[rm])
-			elif op2 == 0b1011:
-				if (op1 & 0b00101) == 0b00000:
-					instr.operation = "strh"
-					if op1 & 2:
-						if op1 & 0x10:
-							if op1 & 8:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn], Registers[rm]], True)]
-							else:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn], "-" + Registers[rm]], True)]
-						else:
-							if op1 & 8:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), Registers[rm]]
-							else:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), "-" + Registers[rm]]
-					else:
-						if op1 & 8:
-							instr.operands = [Registers[rd], MemoryOperand([Registers[rn], Registers[rm]], False)]
-						else:
-							instr.operands = [Registers[rd], MemoryOperand([Registers[rn], "-" + Registers[rm]], False)]
-				elif (op1 & 0b00101) == 0b00001:
-					instr.operation = "ldrh"
-					if op1 & 2:
-						if op1 & 0x10:
-							if op1 & 8:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn], Registers[rm]], True)]
-							else:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn], "-" + Registers[rm]], True)]
-						else:
-							if op1 & 8:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), Registers[rm]]
-							else:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), "-" + Registers[rm]]
-					else:
-						if op1 & 8:
-							instr.operands = [Registers[rd], MemoryOperand([Registers[rn], Registers[rm]], False)]
-						else:
-							instr.operands = [Registers[rd], MemoryOperand([Registers[rn], "-" + Registers[rm]], False)]
-				elif (op1 & 0b00101) == 0b00100:
-					instr.operation = "strh"
-					imm8 = ((opcode >> 4) & 0xf0) | (opcode & 0xf)
-					if op1 & 2:
-						if op1 & 0x10:
-							if op1 & 8:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn], imm8], True)]
-							else:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn], -imm8], True)]
-						else:
-							if op1 & 8:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), imm8]
-							else:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), -imm8]
-					else:
-						if op1 & 8:
-							instr.operands = [Registers[rd], MemoryOperand([Registers[rn], imm8], False)]
-						else:
-							instr.operands = [Registers[rd], MemoryOperand([Registers[rn], -imm8], False)]
-				elif (op1 & 0b00101) == 0b00101:
-					instr.operation = "ldrh"
-					imm8 = ((opcode >> 4) & 0xf0) | (opcode & 0xf)
-					if op1 & 2:
-						if op1 & 0x10:
-							if op1 & 8:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn], imm8], True)]
-							else:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn], -imm8], True)]
-						else:
-							if op1 & 8:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), imm8]
-							else:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), -imm8]
-					else:
-						if op1 & 8:
-							instr.operands = [Registers[rd], MemoryOperand([Registers[rn], imm8], False)]
-						else:
-							instr.operands = [Registers[rd], MemoryOperand([Registers[rn], -imm8], False)]
-			elif (op2 == 0b1101) or (op2 == 0b1111):
-				if (op1 & 0b00101) == 0b00000:
-					if op == 0b1101:
-						instr.operation = "ldrd"
-					else:
-						instr.operation = "strd"
-					instr.operands = [Registers[rd], Registers[(rd + 1) & 0xf]]
-					if op1 & 2:
-						if op1 & 0x10:
-							if op1 & 8:
-								instr.operands += [MemoryOperand([Registers[rn], Registers[rm]], True)]
-							else:
-								instr.operands += [MemoryOperand([Registers[rn], "-" + Registers[rm]], True)]
-						else:
-							if op1 & 8:
-								instr.operands += [MemoryOperand([Registers[rn]], False), Registers[rm]]
-							else:
-								instr.operands += [MemoryOperand([Registers[rn]], False), "-" + Registers[rm]]
-					else:
-						if op1 & 8:
-							instr.operands += [MemoryOperand([Registers[rn], Registers[rm]], False)]
-						else:
-							instr.operands += [MemoryOperand([Registers[rn], "-" + Registers[rm]], False)]
-				elif (op1 & 0b00101) == 0b00001:
-					if op2 == 0b1101:
-						instr.operation = "ldrsb"
-					else:
-						instr.operation = "ldrsh"
-					if op1 & 2:
-						if op1 & 0x10:
-							if op1 & 8:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn], Registers[rm]], True)]
-							else:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn], "-" + Registers[rm]], True)]
-						else:
-							if op1 & 8:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), Registers[rm]]
-							else:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), "-" + Registers[rm]]
-					else:
-						if op1 & 8:
-							instr.operands = [Registers[rd], MemoryOperand([Registers[rn], Registers[rm]], False)]
-						else:
-							instr.operands = [Registers[rd], MemoryOperand([Registers[rn], "-" + Registers[rm]], False)]
-				elif (op1 & 0b00101) == 0b00100:
-					if op2 == 0b1101:
-						instr.operation = "ldrd"
-					else:
-						instr.operation = "strd"
-					instr.operands = [Registers[rd], Registers[(rd + 1) & 0xf]]
-					if op1 & 2:
-						if op1 & 0x10:
-							if op1 & 8:
-								instr.operands += [MemoryOperand([Registers[rn], imm8], True)]
-							else:
-								instr.operands += [MemoryOperand([Registers[rn], -imm8], True)]
-						else:
-							if op1 & 8:
-								instr.operands += [MemoryOperand([Registers[rn]], False), imm8]
-							else:
-								instr.operands += [MemoryOperand([Registers[rn]], False), -imm8]
-					else:
-						if op1 & 8:
-							instr.operands += [MemoryOperand([Registers[rn], imm8], False)]
-						else:
-							instr.operands += [MemoryOperand([Registers[rn], -imm8], False)]
-				elif (op1 & 0b00101) == 0b00101:
-					if op2 == 0b1101:
-						instr.operation = "ldrsb"
-					else:
-						instr.operation = "ldrsh"
-					imm8 = ((opcode >> 4) & 0xf0) | (opcode & 0xf)
-					if op1 & 2:
-						if op1 & 0x10:
-							if op1 & 8:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn], imm8], True)]
-							else:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn], -imm8], True)]
-						else:
-							if op1 & 8:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), imm8]
-							else:
-								instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), -imm8]
-					else:
-						if op1 & 8:
-							instr.operands = [Registers[rd], MemoryOperand([Registers[rn], imm8], False)]
-						else:
-							instr.operands = [Registers[rd], MemoryOperand([Registers[rn], -imm8], False)]
-		elif (op1 & 0b11001) == 0b10000:
-			if op2 == 0b0000:
-				if (op1 & 2) == 0:
-					instr.operation = "mrs"
-					instr.operands = [Registers[rd], "apsr"]
-				else:
-					instr.operation = "msr"
-					instr.operands = ["apsr_" + ["", "g", "nzcvq", "nzcvqg"][(rn >> 2) & 3], Registers[rm]]
-			elif op2 == 0b0001:
-				if op1 == 0b10010:
-					instr.operation = "bx"
-					instr.operands = [Registers[rm]]
-				elif op1 == 0b10110:
-					instr.operation = "clz"
-					instr.operands = [Registers[rd], Registers[rm]]
-			elif op2 == 0b0010:
-				if op1 == 0b10010:
-					instr.operation = "bxj"
-					instr.operands = [Registers[rm]]
-			elif op2 == 0b0011:
-				if op1 == 0b10010:
-					instr.operation = "blx"
-					instr.operands = [Registers[rm]]
-			elif op2 == 0b0101:
-				instr.operation = ["qadd", "qsub", "qdadd", "qdsub"][(op1 >> 1) & 3]
-				instr.operands = [Registers[rd], Registers[rm], Registers[rn]]
-			elif op2 == 0b0111:
-				if op1 == 0b10010:
-					instr.operation = "bkpt"
-					instr.operands = [((opcode >> 4) & 0xfff0) | (opcode & 0xf)]
-				elif op1 == 0b10110:
-					instr.operation = "smc"
-					instr.operands = [opcode & 0xf]
-			elif op1 == 0b10000:
-				instr.operation = "smla" + ["b", "t"][(op2 >> 1) & 1] + ["b", "t"][(op2 >> 2) & 1]
-				instr.operands = [Registers[rn], Registers[rm], Registers[imm5 >> 1], Registers[rd]]
-			elif op1 == 0b10010:
-				if op2 & 2:
-					instr.operation = "smulw" + ["b", "t"][(op2 >> 2) & 1]
-					instr.operands = [Registers[rn], Registers[rm], Registers[imm5 >> 1]]
-				else:
-					instr.operation = "smlaw" + ["b", "t"][(op2 >> 2) & 1]
-					instr.operands = [Registers[rn], Registers[rm], Registers[imm5 >> 1], Registers[rd]]
-			elif op1 == 0b10100:
-				instr.operation = "smlal" + ["b", "t"][(op2 >> 1) & 1] + ["b", "t"][(op2 >> 2) & 1]
-				instr.operands = [Registers[rd], Registers[rn], Registers[rm], Registers[imm5 >> 1]]
-			elif op1 == 0b10110:
-				instr.operation = "smul" + ["b", "t"][(op2 >> 1) & 1] + ["b", "t"][(op2 >> 2) & 1]
-				instr.operands = [Registers[rn], Registers[rm], Registers[imm5 >> 1]]
-		elif (op2 & 1) == 0:
-			if (op1 & 0b11110) == 0b11010:
-				if imm5 == 0:
-					if typecode == 3:
-						instr.operation = "rrx"
-					else:
-						instr.operation = "mov"
-					if op1 & 1:
-						instr.operation += "s"
-					instr.operands = [Registers[rd], Registers[rm]]
-				else:
-					instr.operation = ["lsl", "lsr", "asr", "ror"][typecode]
-					if op1 & 1:
-						instr.operation += "s"
-					instr.operands = [Registers[rd], Registers[rm], imm5]
-			elif (op1 & 0b11000) == 0b10000:
-				instr.operation = ["tst", "teq", "cmp", "cmpn"][(op1 >> 1) & 3]
-				instr.operands = [Registers[rn], reg_shift_immed(rm, typecode, imm5)]
-			elif (op1 & 0b11110) == 0b11110:
-				instr.operation = "mvn"
-				if op1 & 1:
-					instr.operation += "s"
-				instr.operands = [Registers[rd], reg_shift_immed(rm, typecode, imm5)]
-			else:
-				instr.operation = ["and", "eor", "sub", "rsb", "add", "adc", "sbc", "rsc", None, None,
-					None, None, "orr", None, "bic", None][op1 >> 1]
-				if op1 & 1:
-					instr.operation += "s"
-				instr.operands = [Registers[rd], Registers[rn], reg_shift_immed(rm, typecode, imm5)]
-		elif (op2 & 0b1001) == 0b0001:
-			if (op1 & 0b11110) == 0b11010:
-				instr.operation = ["lsl", "lsr", "asr", "ror"][typecode]
-				if op1 & 1:
-					instr.operation += "s"
-				instr.operands = [Registers[rd], Registers[rm], Registers[imm5 >> 1]]
-			elif (op1 & 0b11000) == 0b10000:
-				instr.operation = ["tst", "teq", "cmp", "cmpn"][(op1 >> 1) & 3]
-				instr.operands = [Registers[rn], reg_shift_reg(rm, typecode, imm5 >> 1)]
-			elif (op1 & 0b11110) == 0b11110:
-				instr.operation = "mvn"
-				if op1 & 1:
-					instr.operation += "s"
-				instr.operands = [Registers[rd], reg_shift_reg(rm, typecode, imm5 >> 1)]
-			else:
-				instr.operation = ["and", "eor", "sub", "rsb", "add", "adc", "sbc", "rsc", None, None,
-					None, None, "orr", None, "bic", None][op1 >> 1]
-				if op1 & 1:
-					instr.operation += "s"
-				instr.operands = [Registers[rd], Registers[rn], reg_shift_reg(rm, typecode, imm5 >> 1)]
+
+	if (op1 & 0b11110) == 0b00000:
+		instr.operation = "mul"
+		if op1 & 1:
+			instr.operation += "s"
+		instr.operands = [Registers[rn], Registers[rm], Registers[imm5 >> 1]]
+	elif (op1 & 0b11110) == 0b00010:
+		instr.operation = "mla"
+		if op1 & 1:
+			instr.operation += "s"
+		instr.operands = [Registers[rn], Registers[rm], Registers[imm5 >> 1], Registers[rd]]
+	elif op1 == 0b00100:
+		instr.operation = "umaal"
+		instr.operands = [Registers[rd], Registers[rn], Registers[rm], Registers[imm5 >> 1]]
+	elif op1 == 0b00110:
+		instr.operation = "mls"
+		instr.operands = [Registers[rn], Registers[rm], Registers[imm5 >> 1], Registers[rd]]
+	if (op1 & 0b11110) == 0b01000:
+		instr.operation = "umull"
+		if op1 & 1:
+			instr.operation += "s"
+		instr.operands = [Registers[rd], Registers[rn], Registers[rm], Registers[imm5 >> 1]]
+	elif (op1 & 0b11110) == 0b01010:
+		instr.operation = "umlal"
+		if op1 & 1:
+			instr.operation += "s"
+		instr.operands = [Registers[rd], Registers[rn], Registers[rm], Registers[imm5 >> 1]]
+	if (op1 & 0b11110) == 0b01100:
+		instr.operation = "smull"
+		if op1 & 1:
+			instr.operation += "s"
+		instr.operands = [Registers[rd], Registers[rn], Registers[rm], Registers[imm5 >> 1]]
+	elif (op1 & 0b11110) == 0b01110:
+		instr.operation = "smlal"
+		if op1 & 1:
+			instr.operation += "s"
+		instr.operands = [Registers[rd], Registers[rn], Registers[rm], Registers[imm5 >> 1]]
 	elif op1 == 0b10000:
-		instr.operation = "movw"
-		instr.operands = [Registers[rd], ((opcode >> 4) & 0xf000) | (opcode & 0xfff)]
+		instr.operation = "swp"
+		instr.operands = [Registers[rd], Registers[rm], MemoryOperand([Registers[rn]], False)]
 	elif op1 == 0b10100:
-		instr.operation = "movt"
-		instr.operands = [Registers[rd], ((opcode >> 4) & 0xf000) | (opcode & 0xfff)]
-	elif op1 == 0b10010:
-		if rn == 0:
-			if (opcode & 0xff) == 0:
-				instr.operation = "nop"
-			elif (opcode & 0xff) == 1:
-				instr.operation = "yield"
-			elif (opcode & 0xff) == 2:
-				instr.operation = "wfe"
-			elif (opcode & 0xff) == 3:
-				instr.operation = "wfi"
-			elif (opcode & 0xff) == 4:
-				instr.operation = "sev"
-			elif (opcode & 0xf0) == 0xf0:
-				instr.operation = "dbg"
-				instr.operands = [opcode & 0xf]
-		else:
-			instr.operation = "msr"
-			instr.operands = ["apsr_" + ["", "g", "nzcvq", "nzcvqg"][(rn >> 2) & 3], opcode & 0xfff]
-	elif op1 == 0b10110:
-		instr.operation = "msr"
-		instr.operands = ["apsr_" + ["", "g", "nzcvq", "nzcvqg"][(rn >> 2) & 3], opcode & 0xfff]
-	elif (op1 & 0b11001) != 0b10000:
-		if (op1 & 0b11000) == 0b10000:
-			instr.operation = ["tst", "teq", "cmp", "cmpn"][(op1 >> 1) & 3]
-			instr.operands = [Registers[rn], opcode & 0xfff]
-		elif (op1 & 0b11110) == 0b11010:
-			instr.operation = "mov"
-			if op1 & 1:
-				instr.operation += "s"
-			instr.operands = [Registers[rd], opcode & 0xfff]
-		elif (op1 & 0b11110) == 0b11110:
-			instr.operation = "mov"
-			if op1 & 1:
-				instr.operation += "s"
-			instr.operands = [Registers[rd], (~(opcode & 0xfff)) & 0xffffffff]
-		else:
-			instr.operation = ["and", "eor", "sub", "rsb", "add", "adc", "sbc", "rsc", None, None,
-				None, None, "orr", None, "bic", None][op1 >> 1]
-			if op1 & 1:
-				instr.operation += "s"
-			instr.operands = [Registers[rd], Registers[rn], opcode & 0xfff]
+		instr.operation = "swpb"
+		instr.operands = [Registers[rd], Registers[rm], MemoryOperand([Registers[rn]], False)]
+	elif op1 == 0b11000:
+		instr.operation = "strex"
+		instr.operands = [Registers[rd], Registers[rm], MemoryOperand([Registers[rn]], False)]
+	elif op1 == 0b11001:
+		instr.operation = "ldrex"
+		instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False)]
+	elif op1 == 0b11010:
+		instr.operation = "strexd"
+		instr.operands = [Registers[rd], Registers[rm], Registers[(rm + 1) & 0xf], MemoryOperand([Registers[rn]], False)]
+	elif op1 == 0b11011:
+		instr.operation = "ldrexd"
+		instr.operands = [Registers[rd], Registers[(rd + 1) & 0xf], MemoryOperand([Registers[rn]], False)]
+	elif op1 == 0b11100:
+		instr.operation = "strexb"
+		instr.operands = [Registers[rd], Registers[rm], MemoryOperand([Registers[rn]], False)]
+	elif op1 == 0b11101:
+		instr.operation = "ldrexb"
+		instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False)]
+	elif op1 == 0b11110:
+		instr.operation = "strexh"
+		instr.operands = [Registers[rd], Registers[rm], MemoryOperand([Registers[rn]], False)]
+	elif op1 == 0b11111:
+		instr.operation = "ldrexh"
+		instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False)]
 
-def arm_load_store_instr(instr, opcode):
+def arm_extra_load_store_instr(instr, opcode, addr):
+	op = (opcode >> 25) & 1
 	op1 = (opcode >> 20) & 0x1f
-	a = (opcode >> 25) & 1
+	op2 = (opcode >> 4) & 0xf
 	rn = (opcode >> 16) & 0xf
-	rt = (opcode >> 12) & 0xf
-	imm5 = (opcode >> 7) & 0xf
-	typecode = (opcode >> 5) & 3
+	rd = (opcode >> 12) & 0xf
 	rm = opcode & 0xf
-	imm12 = opcode & 0xfff
 
-	if a == 0:
-		if (op1 & 0b10111) == 0b00010:
-			instr.operation = "strt"
-			if op1 & 8:
-				instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), imm12]
+	if (op1 & 0b10010) == 0b00010:
+		if op2 == 0b1011:
+			if op1 & 1:
+				instr.operation = "ldrht"
 			else:
-				instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), -imm12]
-		elif (op1 & 0b10111) == 0b00011:
-			instr.operation = "ldrt"
-			if op1 & 8:
-				instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), imm12]
+				instr.operation = "strht"
+			instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False)]
+			if op1 & 4:
+				if op1 & 8:
+					instr.operands.append(((opcode >> 4) & 0xf0) | (opcode & 0xf))
+				else:
+					instr.operands.append(-(((opcode >> 4) & 0xf0) | (opcode & 0xf)))
 			else:
-				instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), -imm12]
-		elif (op1 & 0b10111) == 0b00110:
-			instr.operation = "strbt"
-			if op1 & 8:
-				instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), imm12]
+				if op1 & 8:
+					instr.operands.append(Registers[rm])
+				else:
+					instr.operands.append("-" + Registers[rm])
+		elif op2 == 0b1101:
+			instr.operation = "ldrsbt"
+			instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False)]
+			if op1 & 4:
+				if op1 & 8:
+					instr.operands.append(((opcode >> 4) & 0xf0) | (opcode & 0xf))
+				else:
+					instr.operands.append(-(((opcode >> 4) & 0xf0) | (opcode & 0xf)))
 			else:
-				instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), -imm12]
-		elif (op1 & 0b10111) == 0b00111:
-			instr.operation = "ldrbt"
-			if op1 & 8:
-				instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), imm12]
+				if op1 & 8:
+					instr.operands.append(Registers[rm])
+				else:
+					instr.operands.append("-" + Registers[rm])
+		elif op2 == 0b1101:
+			instr.operation = "ldrsht"
+			instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False)]
+			if op1 & 4:
+				if op1 & 8:
+					instr.operands.append(((opcode >> 4) & 0xf0) | (opcode & 0xf))
+				else:
+					instr.operands.append(-(((opcode >> 4) & 0xf0) | (opcode & 0xf)))
 			else:
-				instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), -imm12]
-		elif (op1 & 0b00101) == 0b00000:
-			instr.operation = "str"
+				if op1 & 8:
+					instr.operands.append(Registers[rm])
+				else:
+					instr.operands.append("-" + Registers[rm])
+	elif op2 == 0b1011:
+		if (op1 & 0b00101) == 0b00000:
+			instr.operation = "strh"
 			if op1 & 2:
 				if op1 & 0x10:
 					if op1 & 8:
-						instr.operands = [Registers[rt], MemoryOperand([Registers[rn], imm12], True)]
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn], Registers[rm]], True)]
 					else:
-						instr.operands = [Registers[rt], MemoryOperand([Registers[rn], -imm12], True)]
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn], "-" + Registers[rm]], True)]
 				else:
 					if op1 & 8:
-						instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), imm12]
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), Registers[rm]]
 					else:
-						instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), -imm12]
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), "-" + Registers[rm]]
 			else:
 				if op1 & 8:
-					instr.operands = [Registers[rt], MemoryOperand([Registers[rn], imm12], False)]
+					instr.operands = [Registers[rd], MemoryOperand([Registers[rn], Registers[rm]], False)]
 				else:
-					instr.operands = [Registers[rt], MemoryOperand([Registers[rn], -imm12], False)]
+					instr.operands = [Registers[rd], MemoryOperand([Registers[rn], "-" + Registers[rm]], False)]
 		elif (op1 & 0b00101) == 0b00001:
-			instr.operation = "ldr"
+			instr.operation = "ldrh"
 			if op1 & 2:
 				if op1 & 0x10:
 					if op1 & 8:
-						instr.operands = [Registers[rt], MemoryOperand([Registers[rn], imm12], True)]
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn], Registers[rm]], True)]
 					else:
-						instr.operands = [Registers[rt], MemoryOperand([Registers[rn], -imm12], True)]
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn], "-" + Registers[rm]], True)]
 				else:
 					if op1 & 8:
-						instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), imm12]
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), Registers[rm]]
 					else:
-						instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), -imm12]
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), "-" + Registers[rm]]
 			else:
 				if op1 & 8:
-					instr.operands = [Registers[rt], MemoryOperand([Registers[rn], imm12], False)]
+					instr.operands = [Registers[rd], MemoryOperand([Registers[rn], Registers[rm]], False)]
 				else:
-					instr.operands = [Registers[rt], MemoryOperand([Registers[rn], -imm12], False)]
+					instr.operands = [Registers[rd], MemoryOperand([Registers[rn], "-" + Registers[rm]], False)]
 		elif (op1 & 0b00101) == 0b00100:
-			instr.operation = "strb"
+			instr.operation = "strh"
+			imm8 = ((opcode >> 4) & 0xf0) | (opcode & 0xf)
 			if op1 & 2:
 				if op1 & 0x10:
 					if op1 & 8:
-						instr.operands = [Registers[rt], MemoryOperand([Registers[rn], imm12], True)]
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn], imm8], True)]
 					else:
-						instr.operands = [Registers[rt], MemoryOperand([Registers[rn], -imm12], True)]
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn], -imm8], True)]
 				else:
 					if op1 & 8:
-						instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), imm12]
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), imm8]
 					else:
-						instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), -imm12]
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), -imm8]
 			else:
 				if op1 & 8:
-					instr.operands = [Registers[rt], MemoryOperand([Registers[rn], imm12], False)]
+					instr.operands = [Registers[rd], MemoryOperand([Registers[rn], imm8], False)]
 				else:
-					instr.operands = [Registers[rt], MemoryOperand([Registers[rn], -imm12], False)]
+					instr.operands = [Registers[rd], MemoryOperand([Registers[rn], -imm8], False)]
 		elif (op1 & 0b00101) == 0b00101:
-			instr.operation = "ldrb"
+			instr.operation = "ldrh"
+			imm8 = ((opcode >> 4) & 0xf0) | (opcode & 0xf)
 			if op1 & 2:
 				if op1 & 0x10:
 					if op1 & 8:
-						instr.operands = [Registers[rt], MemoryOperand([Registers[rn], imm12], True)]
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn], imm8], True)]
 					else:
-						instr.operands = [Registers[rt], MemoryOperand([Registers[rn], -imm12], True)]
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn], -imm8], True)]
 				else:
 					if op1 & 8:
-						instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), imm12]
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), imm8]
 					else:
-						instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), -imm12]
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), -imm8]
 			else:
 				if op1 & 8:
-					instr.operands = [Registers[rt], MemoryOperand([Registers[rn], imm12], False)]
+					instr.operands = [Registers[rd], MemoryOperand([Registers[rn], imm8], False)]
 				else:
-					instr.operands = [Registers[rt], MemoryOperand([Registers[rn], -imm12], False)]
-	else:
-		if (op1 & 0b10111) == 0b00010:
-			instr.operation = "strt"
-			instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), reg_shift_immed(rm, typecode,
-				imm5, (op1 & 8) == 0)]
-		elif (op1 & 0b10111) == 0b00011:
-			instr.operation = "ldrt"
-			instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), reg_shift_immed(rm, typecode,
-				imm5, (op1 & 8) == 0)]
-		elif (op1 & 0b10111) == 0b00110:
-			instr.operation = "strbt"
-			instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), reg_shift_immed(rm, typecode,
-				imm5, (op1 & 8) == 0)]
-		elif (op1 & 0b10111) == 0b00111:
-			instr.operation = "ldrbt"
-			instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), reg_shift_immed(rm, typecode,
-				imm5, (op1 & 8) == 0)]
-		elif (op1 & 0b00101) == 0b00000:
-			instr.operation = "str"
+					instr.operands = [Registers[rd], MemoryOperand([Registers[rn], -imm8], False)]
+	elif (op2 == 0b1101) or (op2 == 0b1111):
+		if (op1 & 0b00101) == 0b00000:
+			if op == 0b1101:
+				instr.operation = "ldrd"
+			else:
+				instr.operation = "strd"
+			instr.operands = [Registers[rd], Registers[(rd + 1) & 0xf]]
 			if op1 & 2:
 				if op1 & 0x10:
-					instr.operands = [Registers[rt], MemoryOperand([Registers[rn], reg_shift_immed(rm, typecode,
-						imm5, (op1 & 8) == 0)], True)]
+					if op1 & 8:
+						instr.operands += [MemoryOperand([Registers[rn], Registers[rm]], True)]
+					else:
+						instr.operands += [MemoryOperand([Registers[rn], "-" + Registers[rm]], True)]
 				else:
-					instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), reg_shift_immed(rm, typecode,
-						imm5, (op1 & 8) == 0)]
+					if op1 & 8:
+						instr.operands += [MemoryOperand([Registers[rn]], False), Registers[rm]]
+					else:
+						instr.operands += [MemoryOperand([Registers[rn]], False), "-" + Registers[rm]]
 			else:
-				instr.operands = [Registers[rt], MemoryOperand([Registers[rn], reg_shift_immed(rm, typecode,
-					imm5, (op1 & 8) == 0)], False)]
+				if op1 & 8:
+					instr.operands += [MemoryOperand([Registers[rn], Registers[rm]], False)]
+				else:
+					instr.operands += [MemoryOperand([Registers[rn], "-" + Registers[rm]], False)]
 		elif (op1 & 0b00101) == 0b00001:
-			instr.operation = "ldr"
+			if op2 == 0b1101:
+				instr.operation = "ldrsb"
+			else:
+				instr.operation = "ldrsh"
 			if op1 & 2:
 				if op1 & 0x10:
-					instr.operands = [Registers[rt], MemoryOperand([Registers[rn], reg_shift_immed(rm, typecode,
-						imm5, (op1 & 8) == 0)], True)]
+					if op1 & 8:
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn], Registers[rm]], True)]
+					else:
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn], "-" + Registers[rm]], True)]
 				else:
-					instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), reg_shift_immed(rm, typecode,
-						imm5, (op1 & 8) == 0)]
+					if op1 & 8:
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), Registers[rm]]
+					else:
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), "-" + Registers[rm]]
 			else:
-				instr.operands = [Registers[rt], MemoryOperand([Registers[rn], reg_shift_immed(rm, typecode,
-					imm5, (op1 & 8) == 0)], False)]
+				if op1 & 8:
+					instr.operands = [Registers[rd], MemoryOperand([Registers[rn], Registers[rm]], False)]
+				else:
+					instr.operands = [Registers[rd], MemoryOperand([Registers[rn], "-" + Registers[rm]], False)]
 		elif (op1 & 0b00101) == 0b00100:
-			instr.operation = "strb"
+			if op2 == 0b1101:
+				instr.operation = "ldrd"
+			else:
+				instr.operation = "strd"
+			instr.operands = [Registers[rd], Registers[(rd + 1) & 0xf]]
 			if op1 & 2:
 				if op1 & 0x10:
-					instr.operands = [Registers[rt], MemoryOperand([Registers[rn], reg_shift_immed(rm, typecode,
-						imm5, (op1 & 8) == 0)], True)]
+					if op1 & 8:
+						instr.operands += [MemoryOperand([Registers[rn], imm8], True)]
+					else:
+						instr.operands += [MemoryOperand([Registers[rn], -imm8], True)]
 				else:
-					instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), reg_shift_immed(rm, typecode,
-						imm5, (op1 & 8) == 0)]
+					if op1 & 8:
+						instr.operands += [MemoryOperand([Registers[rn]], False), imm8]
+					else:
+						instr.operands += [MemoryOperand([Registers[rn]], False), -imm8]
 			else:
-				instr.operands = [Registers[rt], MemoryOperand([Registers[rn], reg_shift_immed(rm, typecode,
-					imm5, (op1 & 8) == 0)], False)]
+				if op1 & 8:
+					instr.operands += [MemoryOperand([Registers[rn], imm8], False)]
+				else:
+					instr.operands += [MemoryOperand([Registers[rn], -imm8], False)]
 		elif (op1 & 0b00101) == 0b00101:
-			instr.operation = "ldrb"
+			if op2 == 0b1101:
+				instr.operation = "ldrsb"
+			else:
+				instr.operation = "ldrsh"
+			imm8 = ((opcode >> 4) & 0xf0) | (opcode & 0xf)
 			if op1 & 2:
 				if op1 & 0x10:
-					instr.operands = [Registers[rt], MemoryOperand([Registers[rn], reg_shift_immed(rm, typecode,
-						imm5, (op1 & 8) == 0)], True)]
+					if op1 & 8:
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn], imm8], True)]
+					else:
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn], -imm8], True)]
 				else:
-					instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), reg_shift_immed(rm, typecode,
-						imm5, (op1 & 8) == 0)]
+					if op1 & 8:
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), imm8]
+					else:
+						instr.operands = [Registers[rd], MemoryOperand([Registers[rn]], False), -imm8]
 			else:
-				instr.operands = [Registers[rt], MemoryOperand([Registers[rn], reg_shift_immed(rm, typecode,
-					imm5, (op1 & 8) == 0)], False)]
+				if op1 & 8:
+					instr.operands = [Registers[rd], MemoryOperand([Registers[rn], imm8], False)]
+				else:
+					instr.operands = [Registers[rd], MemoryOperand([Registers[rn], -imm8], False)]
 
-def arm_media_instr(instr, opcode):
+def arm_misc_instr(instr, opcode, addr):
+	op1 = (opcode >> 20) & 0x1f
+	op2 = (opcode >> 4) & 0xf
+	rn = (opcode >> 16) & 0xf
+	rd = (opcode >> 12) & 0xf
+	imm5 = (opcode >> 7) & 0x1f
+	rm = opcode & 0xf
+
+	if op2 == 0b0000:
+		if (op1 & 2) == 0:
+			instr.operation = "mrs"
+			instr.operands = [Registers[rd], "apsr"]
+		else:
+			instr.operation = "msr"
+			instr.operands = ["apsr_" + ["", "g", "nzcvq", "nzcvqg"][(rn >> 2) & 3], Registers[rm]]
+	elif op2 == 0b0001:
+		if op1 == 0b10010:
+			instr.operation = "bx"
+			instr.operands = [Registers[rm]]
+		elif op1 == 0b10110:
+			instr.operation = "clz"
+			instr.operands = [Registers[rd], Registers[rm]]
+	elif op2 == 0b0010:
+		if op1 == 0b10010:
+			instr.operation = "bxj"
+			instr.operands = [Registers[rm]]
+	elif op2 == 0b0011:
+		if op1 == 0b10010:
+			instr.operation = "blx"
+			instr.operands = [Registers[rm]]
+	elif op2 == 0b0101:
+		instr.operation = ["qadd", "qsub", "qdadd", "qdsub"][(op1 >> 1) & 3]
+		instr.operands = [Registers[rd], Registers[rm], Registers[rn]]
+	elif op2 == 0b0111:
+		if op1 == 0b10010:
+			instr.operation = "bkpt"
+			instr.operands = [((opcode >> 4) & 0xfff0) | (opcode & 0xf)]
+		elif op1 == 0b10110:
+			instr.operation = "smc"
+			instr.operands = [opcode & 0xf]
+	elif op1 == 0b10000:
+		instr.operation = "smla" + ["b", "t"][(op2 >> 1) & 1] + ["b", "t"][(op2 >> 2) & 1]
+		instr.operands = [Registers[rn], Registers[rm], Registers[imm5 >> 1], Registers[rd]]
+	elif op1 == 0b10010:
+		if op2 & 2:
+			instr.operation = "smulw" + ["b", "t"][(op2 >> 2) & 1]
+			instr.operands = [Registers[rn], Registers[rm], Registers[imm5 >> 1]]
+		else:
+			instr.operation = "smlaw" + ["b", "t"][(op2 >> 2) & 1]
+			instr.operands = [Registers[rn], Registers[rm], Registers[imm5 >> 1], Registers[rd]]
+	elif op1 == 0b10100:
+		instr.operation = "smlal" + ["b", "t"][(op2 >> 1) & 1] + ["b", "t"][(op2 >> 2) & 1]
+		instr.operands = [Registers[rd], Registers[rn], Registers[rm], Registers[imm5 >> 1]]
+	elif op1 == 0b10110:
+		instr.operation = "smul" + ["b", "t"][(op2 >> 1) & 1] + ["b", "t"][(op2 >> 2) & 1]
+		instr.operands = [Registers[rn], Registers[rm], Registers[imm5 >> 1]]
+
+def arm_data_processing_reg_instr(instr, opcode, addr):
+	op1 = (opcode >> 20) & 0x1f
+	rn = (opcode >> 16) & 0xf
+	rd = (opcode >> 12) & 0xf
+	imm5 = (opcode >> 7) & 0x1f
+	typecode = (opcode >> 5) & 3
+	rm = opcode & 0xf
+
+	if (op1 & 0b11110) == 0b11010:
+		if imm5 == 0:
+			if typecode == 3:
+				instr.operation = "rrx"
+			else:
+				instr.operation = "mov"
+			if op1 & 1:
+				instr.operation += "s"
+			instr.operands = [Registers[rd], Registers[rm]]
+		else:
+			instr.operation = ["lsl", "lsr", "asr", "ror"][typecode]
+			if op1 & 1:
+				instr.operation += "s"
+			instr.operands = [Registers[rd], Registers[rm], imm5]
+	elif (op1 & 0b11000) == 0b10000:
+		instr.operation = ["tst", "teq", "cmp", "cmpn"][(op1 >> 1) & 3]
+		instr.operands = [Registers[rn], reg_shift_immed(rm, typecode, imm5)]
+	elif (op1 & 0b11110) == 0b11110:
+		instr.operation = "mvn"
+		if op1 & 1:
+			instr.operation += "s"
+		instr.operands = [Registers[rd], reg_shift_immed(rm, typecode, imm5)]
+	else:
+		instr.operation = ["and", "eor", "sub", "rsb", "add", "adc", "sbc", "rsc", None, None,
+			None, None, "orr", None, "bic", None][op1 >> 1]
+		if op1 & 1:
+			instr.operation += "s"
+		instr.operands = [Registers[rd], Registers[rn], reg_shift_immed(rm, typecode, imm5)]
+
+def arm_data_processing_shifted_reg_instr(instr, opcode, addr):
+	op1 = (opcode >> 20) & 0x1f
+	rn = (opcode >> 16) & 0xf
+	rd = (opcode >> 12) & 0xf
+	imm5 = (opcode >> 7) & 0x1f
+	typecode = (opcode >> 5) & 3
+	rm = opcode & 0xf
+
+	if (op1 & 0b11110) == 0b11010:
+		instr.operation = ["lsl", "lsr", "asr", "ror"][typecode]
+		if op1 & 1:
+			instr.operation += "s"
+		instr.operands = [Registers[rd], Registers[rm], Registers[imm5 >> 1]]
+	elif (op1 & 0b11000) == 0b10000:
+		instr.operation = ["tst", "teq", "cmp", "cmpn"][(op1 >> 1) & 3]
+		instr.operands = [Registers[rn], reg_shift_reg(rm, typecode, imm5 >> 1)]
+	elif (op1 & 0b11110) == 0b11110:
+		instr.operation = "mvn"
+		if op1 & 1:
+			instr.operation += "s"
+		instr.operands = [Registers[rd], reg_shift_reg(rm, typecode, imm5 >> 1)]
+	else:
+		instr.operation = ["and", "eor", "sub", "rsb", "add", "adc", "sbc", "rsc", None, None,
+			None, None, "orr", None, "bic", None][op1 >> 1]
+		if op1 & 1:
+			instr.operation += "s"
+		instr.operands = [Registers[rd], Registers[rn], reg_shift_reg(rm, typecode, imm5 >> 1)]
+
+def arm_movw_instr(instr, opcode, addr):
+	rd = (opcode >> 12) & 0xf
+
+	instr.operation = "movw"
+	instr.operands = [Registers[rd], ((opcode >> 4) & 0xf000) | (opcode & 0xfff)]
+
+def arm_movt_instr(instr, opcode, addr):
+	rd = (opcode >> 12) & 0xf
+
+	instr.operation = "movt"
+	instr.operands = [Registers[rd], ((opcode >> 4) & 0xf000) | (opcode & 0xfff)]
+
+def arm_hint_instr(instr, opcode, addr):
+	rn = (opcode >> 16) & 0xf
+
+	if rn == 0:
+		if (opcode & 0xff) == 0:
+			instr.operation = "nop"
+		elif (opcode & 0xff) == 1:
+			instr.operation = "yield"
+		elif (opcode & 0xff) == 2:
+			instr.operation = "wfe"
+		elif (opcode & 0xff) == 3:
+			instr.operation = "wfi"
+		elif (opcode & 0xff) == 4:
+			instr.operation = "sev"
+		elif (opcode & 0xf0) == 0xf0:
+			instr.operation = "dbg"
+			instr.operands = [opcode & 0xf]
+	else:
+		instr.operation = "msr"
+		instr.operands = ["apsr_" + ["", "g", "nzcvq", "nzcvqg"][(rn >> 2) & 3], opcode & 0xfff]
+
+def arm_msr_immed_instr(instr, opcode, addr):
+	rn = (opcode >> 16) & 0xf
+
+	instr.operation = "msr"
+	instr.operands = ["apsr_" + ["", "g", "nzcvq", "nzcvqg"][(rn >> 2) & 3], opcode & 0xfff]
+
+def arm_data_processing_immed_instr(instr, opcode, addr):
+	op1 = (opcode >> 20) & 0x1f
+	rn = (opcode >> 16) & 0xf
+	rd = (opcode >> 12) & 0xf
+
+	if (op1 & 0b11000) == 0b10000:
+		instr.operation = ["tst", "teq", "cmp", "cmpn"][(op1 >> 1) & 3]
+		instr.operands = [Registers[rn], opcode & 0xfff]
+	elif (op1 & 0b11110) == 0b11010:
+		instr.operation = "mov"
+		if op1 & 1:
+			instr.operation += "s"
+		instr.operands = [Registers[rd], opcode & 0xfff]
+	elif (op1 & 0b11110) == 0b11110:
+		instr.operation = "mov"
+		if op1 & 1:
+			instr.operation += "s"
+		instr.operands = [Registers[rd], (~(opcode & 0xfff)) & 0xffffffff]
+	else:
+		instr.operation = ["and", "eor", "sub", "rsb", "add", "adc", "sbc", "rsc", None, None,
+			None, None, "orr", None, "bic", None][op1 >> 1]
+		if op1 & 1:
+			instr.operation += "s"
+		instr.operands = [Registers[rd], Registers[rn], opcode & 0xfff]
+
+def arm_data_processing_class(op, op1, op2):
+	if op == 0:
+		if op2 == 0b1001:
+			return arm_multiply_instr
+		elif (op2 & 0b1001) == 0b1001:
+			return arm_extra_load_store_instr
+		elif (op1 & 0b11001) == 0b10000:
+			return arm_misc_instr
+		elif (op2 & 1) == 0:
+			return arm_data_processing_reg_instr
+		elif (op2 & 0b1001) == 0b0001:
+			return arm_data_processing_shifted_reg_instr
+	elif op1 == 0b10000:
+		return arm_movw_instr
+	elif op1 == 0b10100:
+		return arm_movt_instr
+	elif op1 == 0b10010:
+		return arm_hint_instr
+	elif op1 == 0b10110:
+		return arm_msr_immed_instr
+	elif (op1 & 0b11001) != 0b10000:
+		return arm_data_processing_immed_instr
+	return None
+
+# Handlers for the data processing space, indexed by the op bit, op1 and op2 fields
+ArmDataProcessingTable = [arm_data_processing_class(i >> 9, (i >> 4) & 0x1f, i & 0xf) for i in xrange(0, 0x400)]
+
+def arm_data_processing_instr(instr, opcode, addr):
+	handler = ArmDataProcessingTable[((opcode >> 16) & 0x3f0) | ((opcode >> 4) & 0xf)]
+	if handler is not None:
+		handler(instr, opcode, addr)
+
+
+def arm_load_store_class(a, op1):
+	# Returns the operation and addressing form.  The unprivileged forms use post-indexed addressing.
+	if (op1 & 0b10111) == 0b00010:
+		return ("strt", "post")
+	elif (op1 & 0b10111) == 0b00011:
+		return ("ldrt", "post")
+	elif (op1 & 0b10111) == 0b00110:
+		return ("strbt", "post")
+	elif (op1 & 0b10111) == 0b00111:
+		return ("ldrbt", "post")
+
+	operation = ["str", "ldr", None, None, "strb", "ldrb", None, None][op1 & 0b00101]
+	if op1 & 2:
+		if op1 & 0x10:
+			return (operation, "pre")
+		return (operation, "post")
+	return (operation, "offset")
+
+# Operation and addressing form for each load/store encoding, indexed by the A bit and op1
+ArmLoadStoreTable = [arm_load_store_class(i >> 5, i & 0x1f) for i in xrange(0, 0x40)]
+
+def arm_load_store_instr(instr, opcode, addr):
+	rn = (opcode >> 16) & 0xf
+	rt = (opcode >> 12) & 0xf
+
+	operation, form = ArmLoadStoreTable[(opcode >> 20) & 0x3f]
+	if opcode & (1 << 25):
+		offset = reg_shift_immed(opcode & 0xf, (opcode >> 5) & 3, (opcode >> 7) & 0xf, (opcode & (1 << 23)) == 0)
+	elif opcode & (1 << 23):
+		offset = opcode & 0xfff
+	else:
+		offset = -(opcode & 0xfff)
+
+	instr.operation = operation
+	if form == "pre":
+		instr.operands = [Registers[rt], MemoryOperand([Registers[rn], offset], True)]
+	elif form == "post":
+		instr.operands = [Registers[rt], MemoryOperand([Registers[rn]], False), offset]
+	else:
+		instr.operands = [Registers[rt], MemoryOperand([Registers[rn], offset], False)]
+
+def arm_media_instr(instr, opcode, addr):
 	pass
 
 def arm_branch_instr(instr, opcode, addr):
@@ -731,7 +681,7 @@ def arm_branch_instr(instr, opcode, addr):
 			if opcode & (1 << i):
 				instr.operands.append(Registers[i])
 
-def arm_supervisor_instr(instr, opcode):
+def arm_supervisor_instr(instr, opcode, addr):
 	op1 = (opcode >> 20) & 0x3f
 
 	if (op1 & 0b110000) == 0b110000:
@@ -811,7 +761,7 @@ def thumb_16_if_then(instr, opcode):
 
 	if mask == 0:
 		if firstcond < 5:
-			instr.operation = ["nop", "yield", "wfe", "wfi", "sev"]
+			instr.operation = ["nop", "yield", "wfe", "wfi", "sev"][firstcond]
 	elif mask & 1:
 		instr.operation = ["ite", "itt"][((mask >> 3) & 1) ^ (firstcond & 1)]
 		instr.operation += ["e", "t"][((mask >> 2) & 1) ^ (firstcond & 1)]
@@ -919,7 +869,7 @@ def thumb_16(instr, opcode, addr):
 			instr.operands = [Registers[rd], Registers[rm], Registers[rd]]
 		else:
 			instr.operation = ["and", "eor", "lsl", "lsr", "asr", "adc", "sbc", "ror", "tst", None,
-				"cmp", "cmn", "orr", None, "bic", "mvn"]
+				"cmp", "cmn", "orr", None, "bic", "mvn"][op2]
 			instr.operands = [Registers[rd], Registers[rm]]
 	elif op == 0b010001:
 		if (op2 & 0b1100) == 0:
@@ -1010,13 +960,147 @@ def thumb_32_branch(instr, opcode, addr):
 			ofs |= ~0x1ffffff
 		instr.operands = [(((addr + 4) & (~3)) + ofs + 1) & 0xffffffff]
 
+def thumb_32_class(op1, op):
+	if (op1 == 0b10) and (op == 1):
+		return thumb_32_branch
+	return None
+
+# Handlers for 32-bit Thumb encodings, indexed by the op1 and op fields
+Thumb32Table = [thumb_32_class(i >> 1, i & 1) for i in xrange(0, 8)]
+
 def thumb_32(instr, opcode, addr):
-	op1 = (opcode >> 11) & 3
-	op2 = (opcode >> 4) & 0x7f
-	op = (opcode >> 31) & 1
+	handler = Thumb32Table[((opcode >> 10) & 6) | ((opcode >> 31) & 1)]
+	if handler is not None:
+		handler(instr, opcode, addr)
 
-	if (op1 == 0b10) and (op == 1):
-		thumb_32_branch(instr, opcode, addr)
+class PCRelative:
+	# Operand of a cached Thumb instruction that is relative to the word aligned address
+	def __init__(self, value):
+		self.value = value
+
+def thumb_16_operand_template(first, second):
+	# Compares an operand decoded at addresses 1 and 5.  Values that moved with the address are
+	# relative to the pc.  Returns None if the operand cannot be cached.
+	if (type(first) in [int, long]) and (type(second) in [int, long]):
+		if first == second:
+			return first
+		if ((second - first) & 0xffffffff) == 4:
+			return PCRelative(first)
+		return None
+	if (type(first) == str) and (first == second):
+		return first
+	if (first.__class__ == MemoryOperand) and (second.__class__ == MemoryOperand) and (first.writeback == second.writeback):
+		if len(first.components) != len(second.components):
+			return None
+		components = []
+		for a, b in zip(first.components, second.components):
+			component = thumb_16_operand_template(a, b)
+			if (component is None) or (component.__class__ == MemoryOperand):
+				return None
+			components.append(component)
+		return MemoryOperand(components, first.writeback)
+	return None
+
+def compile_thumb_16_entry(opcode):
+	# Returns the operation, the operands, the operands that must be created for each instruction
+	# as (index, template, has pc relative components) tuples, and the range flags and target.
+	# Encodings that can not be cached are False, and are always passed to the decoder.
+	first = Instruction()
+	thumb_16(first, opcode, 1)
+	second = Instruction()
+	thumb_16(second, opcode, 5)
+	if (set(first.__dict__.keys()) != set(["operation", "operands", "length"])) or (type(first.operation) not in [str, type(None)]):
+		return False
+	if (first.operation != second.operation) or (len(first.operands) != len(second.operands)):
+		return False
+	operands = []
+	fixups = []
+	for a, b in zip(first.operands, second.operands):
+		operand = thumb_16_operand_template(a, b)
+		if operand is None:
+			return False
+		if operand.__class__ == PCRelative:
+			fixups.append((len(operands), operand, True))
+		elif operand.__class__ == MemoryOperand:
+			relative = len([i for i in operand.components if i.__class__ == PCRelative]) > 0
+			fixups.append((len(operands), operand, relative))
+		operands.append(operand)
+
+	target = None
+	if first.operation is not None:
+		target = get_range_target(first)
+	flags = get_range_flags(first, target)
+	if target is not None:
+		target = operands[0]
+	return (first.operation, operands, fixups, flags, target)
+
+def thumb_16_component(template, base):
+	if template.__class__ == PCRelative:
+		return (base + template.value) & 0xffffffff
+	return template
+
+# Decoded form of each 16-bit Thumb encoding, filled in as encodings are first seen.  Entries are
+# None until compiled.
+THUMB_16_TABLE_VERSION = 1
+Thumb16Table = [None] * 0x10000
+
+def thumb_16_entry(opcode):
+	entry = Thumb16Table[opcode]
+	if entry is None:
+		entry = compile_thumb_16_entry(opcode)
+		Thumb16Table[opcode] = entry
+	return entry
+
+def thumb_16_lookup(instr, opcode, addr):
+	entry = thumb_16_entry(opcode)
+	if entry is False:
+		thumb_16(instr, opcode, addr)
+		return
+	instr.length = 2
+	instr.operation = entry[0]
+	instr.operands = list(entry[1])
+	for i, template, relative in entry[2]:
+		if template.__class__ == PCRelative:
+			instr.operands[i] = ((addr & (~3)) + template.value) & 0xffffffff
+		elif relative:
+			instr.operands[i] = MemoryOperand([thumb_16_component(c, addr & (~3)) for c in template.components], template.writeback)
+		else:
+			instr.operands[i] = MemoryOperand(list(template.components), template.writeback)
+
+def build_thumb_16_table():
+	for i in xrange(0, 0x10000):
+		if Thumb16Table[i] is None:
+			Thumb16Table[i] = compile_thumb_16_entry(i)
+
+def thumb_16_table_size():
+	return len(Thumb16Table) - Thumb16Table.count(None)
+
+def get_thumb_16_table():
+	return {"version": THUMB_16_TABLE_VERSION, "entries": Thumb16Table}
+
+def set_thumb_16_table(table):
+	# Accepts a table saved by an earlier run, if it was built by the same version of the decoder
+	global Thumb16Table
+	if (type(table) != dict) or (table.get("version") != THUMB_16_TABLE_VERSION):
+		return False
+	if (type(table.get("entries")) != list) or (len(table["entries"]) != 0x10000):
+		return False
+	Thumb16Table = table["entries"]
+	return True
+
+def arm_class(op1, op):
+	if (op1 & 0b110) == 0b000:
+		return arm_data_processing_instr
+	elif ((op1 & 0b110) == 0b010) or ((op1 == 0b011) and (op == 0)):
+		return arm_load_store_instr
+	elif (op1 == 0b011) and (op == 1):
+		return arm_media_instr
+	elif (op1 & 0b110) == 0b100:
+		return arm_branch_instr
+	return arm_supervisor_instr
+
+# Handlers for conditional Arm encodings, indexed by the op1 and op fields
+ArmTable = [arm_class(i >> 1, i & 1) for i in xrange(0, 0x10)]
 
 def disassemble(opcode, addr):
 	global Registers, ConditionalSuffix
@@ -1028,24 +1112,13 @@ def disassemble(opcode, addr):
 		if (op == 0b11101) or (op == 0b11110) or (op == 0b11111):
 			thumb_32(instr, opcode, addr)
 		else:
-			thumb_16(instr, opcode & 0xffff, addr)
+			thumb_16_lookup(instr, opcode & 0xffff, addr)
 	else: # Arm mode
 		cc = (opcode >> 28) & 15
-		op1 = (opcode >> 25) & 7
-		op = (opcode >> 4) & 1
-
 		if cc == 0b1111:
-			arm_unconditional_instr(instr, opcode)
-		elif (op1 & 0b110) == 0b000:
-			arm_data_processing_instr(instr, opcode, addr)
-		elif ((op1 & 0b110) == 0b010) or ((op1 == 0b011) and (op == 0)):
-			arm_load_store_instr(instr, opcode)
-		elif (op1 == 0b011) and (op == 1):
-			arm_media_instr(instr, opcode)
-		elif (op1 & 0b110) == 0b100:
-			arm_branch_instr(instr, opcode, addr)
-		elif (op1 & 0b110) == 0b110:
-			arm_supervisor_instr(instr, opcode)
+			arm_unconditional_instr(instr, opcode, addr)
+		else:
+			ArmTable[((opcode >> 24) & 0xe) | ((opcode >> 4) & 1)](instr, opcode, addr)
 
 		# Convert [pc, imm] to final destination
 		for i in xrange(0, len(instr.operands)):
@@ -1058,81 +1131,135 @@ def disassemble(opcode, addr):
 
 	return instr
 
-def format_instruction_string(fmt, opcode, addr, instr):
-	result = ""
-	i = 0
-	while i < len(fmt):
-		if fmt[i] == '%':
-			width = 0
-			i += 1
-			while i < len(fmt):
-				if fmt[i] == 'a':
-					if width == 0:
-						width = 8
-					result += ("%%.%dx" % width) % addr
-					break
-				elif fmt[i] == 'b':
-					result += "%.8x" % opcode
-					break
-				elif fmt[i] == 'i':
-					operation = instr.operation.replace(".", "")
-					for j in range(len(operation), width):
-						operation += " "
-					result += operation
-					break
-				elif fmt[i] == 'o':
-					for j in range(0, len(instr.operands)):
-						if j != 0:
-							result += ", "
-						if type(instr.operands[j]) == list:
-							if len(instr.operands[j]) == 2:
-								result += instr.operands[j][0] + " " + instr.operands[j][1]
-							elif type(instr.operands[j][2]) == str:
-								result += instr.operands[j][0] + (" %s %s" % (instr.operands[j][1], instr.operands[j][2]))
-							else:
-								result += instr.operands[j][0] + (" %s %d" % (instr.operands[j][1], instr.operands[j][2]))
-						elif type(instr.operands[j]) == MemoryOperand:
-							result += "["
-							for k in range(0, len(instr.operands[j].components)):
-								if k != 0:
-									result += ", "
-								if type(instr.operands[j].components[k]) == str:
-									result += instr.operands[j].components[k]
-								elif type(instr.operands[j].components[k]) == list:
-									if len(instr.operands[j].components[k]) == 2:
-										result += instr.operands[j].components[k][0] + " " + instr.operands[j].components[k][1]
-									elif type(instr.operands[j].components[k][2]) == str:
-										result += instr.operands[j].components[k][0] + (" %s %s" % (instr.operands[j].components[k][1],
-											instr.operands[j].components[k][2]))
-									else:
-										result += instr.operands[j].components[k][0] + (" %s %d" % (instr.operands[j].components[k][1],
-											instr.operands[j].components[k][2]))
-								elif instr.operands[j].components[k] < 0:
-									result += "-0x%x" % -instr.operands[j].components[k]
-								else:
-									result += "0x%x" % instr.operands[j].components[k]
-							result += "]"
-							if instr.operands[j].writeback:
-								result += "!"
-						elif type(instr.operands[j]) != str:
-							if instr.operands[j] < 0:
-								result += "-0x%x" % -instr.operands[j]
-							else:
-								result += "0x%x" % instr.operands[j]
-						else:
-							result += instr.operands[j]
-					break
-				elif (fmt[i] >= '0') and (fmt[i] <= '9'):
-					width = (width * 10) + (ord(fmt[i]) - 0x30)
-				else:
-					result += fmt[i]
-					break
-				i += 1
-		else:
-			result += fmt[i]
-		i += 1
+def get_range_target(instr):
+	operation = instr.operation
+	if (operation in ["b", "bx", "bl", "blx"]) or (operation[0:2] == "b.") or (operation[0:3] in ["bx.", "bl."]) or (operation[0:4] == "blx."):
+		if type(instr.operands[0]) != str:
+			return instr.operands[0]
+	return None
+
+def get_range_flags(instr, target):
+	operation = instr.operation
+	if operation is None:
+		return RANGE_FLAG_INVALID
+	flags = 0
+	if (target is not None) and ((operation[0:2] == "b.") or (operation[0:3] == "bx.")):
+		flags |= RANGE_FLAG_JUMP | RANGE_FLAG_CONDITIONAL | RANGE_FLAG_BLOCK_ENDING
+	if (target is not None) and ((operation == "b") or (operation == "bx")):
+		flags |= RANGE_FLAG_JUMP
+	if (operation == "bl") or (operation == "blx") or (operation[0:3] == "bl.") or (operation[0:4] == "blx."):
+		flags |= RANGE_FLAG_CALL
+	if (operation == "b") or (operation == "bx"):
+		flags |= RANGE_FLAG_BLOCK_ENDING
+	elif (operation[0:3] == "ldm") and ("pc" in instr.operands[1:]):
+		flags |= RANGE_FLAG_BLOCK_ENDING
+	elif (operation == "ldr") and (instr.operands[0] == "pc"):
+		flags |= RANGE_FLAG_BLOCK_ENDING
+	elif (operation == "pop") and ("pc" in instr.operands):
+		flags |= RANGE_FLAG_BLOCK_ENDING
+	return flags
+
+def disassemble_range(buf, base_addr, instrs = False):
+	# Decodes instructions back to back from the start of the buffer, which holds the bytes at
+	# base_addr with the Thumb bit cleared.  Decoding stops when fewer than four bytes are left.
+	# Words that can't be decoded are recorded as invalid instructions.
+	result = InstructionRange(base_addr, 4, instrs)
+	ofs = 0
+	while (ofs + 4) <= len(buf):
+		if (base_addr & 1) and (not instrs):
+			# Most Thumb instructions are filled in straight from the lookup table
+			opcode = struct.unpack_from("<H", buf, ofs)[0]
+			if ((opcode >> 11) & 0x1f) < 0b11101:
+				entry = thumb_16_entry(opcode)
+				if entry is not False:
+					target = entry[4]
+					if target.__class__ == PCRelative:
+						target = (((base_addr + ofs) & (~3)) + target.value) & 0xffffffff
+					result.add(ofs, 2, entry[0], entry[3], target, None)
+					ofs += 2
+					continue
+
+		try:
+			instr = disassemble(struct.unpack_from("<I", buf, ofs)[0], base_addr + ofs)
+		except:
+			# Some encodings make the decoder raise, record them as invalid and continue after them
+			instr = Instruction()
+			if base_addr & 1:
+				instr.length = 2
+		target = None
+		if instr.operation is not None:
+			target = get_range_target(instr)
+		result.add(ofs, instr.length, instr.operation, get_range_flags(instr, target), target, instr)
+		ofs += instr.length
 	return result
 
+def get_shift_string(shift):
+	if len(shift) == 2:
+		return shift[0] + " " + shift[1]
+	elif type(shift[2]) == str:
+		return shift[0] + (" %s %s" % (shift[1], shift[2]))
+	return shift[0] + (" %s %d" % (shift[1], shift[2]))
+
+def get_immediate_string(value):
+	if value < 0:
+		return "-0x%x" % -value
+	return "0x%x" % value
+
+def get_memory_operand_string(operand):
+	result = []
+	for component in operand.components:
+		if type(component) == str:
+			result.append(component)
+		elif type(component) == list:
+			result.append(get_shift_string(component))
+		else:
+			result.append(get_immediate_string(component))
+	if operand.writeback:
+		return "[" + ", ".join(result) + "]!"
+	return "[" + ", ".join(result) + "]"
+
+def get_operands_string(instr):
+	result = []
+	for operand in instr.operands:
+		if type(operand) == str:
+			result.append(operand)
+		elif type(operand) == list:
+			result.append(get_shift_string(operand))
+		elif operand.__class__ == MemoryOperand:
+			result.append(get_memory_operand_string(operand))
+		else:
+			result.append(get_immediate_string(operand))
+	return ", ".join(result)
+
+def format_compiled(result, ops, opcode, addr, instr):
+	# Appends the pieces of an instruction's text to result, following a compiled format
+	for code, value in ops:
+		if code is None:
+			result.append(value)
+		elif code == 'a':
+			result.append("%.*x" % (value, addr))
+		elif code == 'b':
+			result.append("%.8x" % opcode)
+		elif code == 'i':
+			result.append(instr.operation.replace(".", "").ljust(value))
+		elif code == 'o':
+			result.append(get_operands_string(instr))
+
+def format_instruction_string(fmt, opcode, addr, instr):
+	result = []
+	format_compiled(result, get_compiled_format(fmt), opcode, addr, instr)
+	return "".join(result)
+
+def format_many(fmt, instrs):
+	# Formats a sequence of (opcode, addr, instr) tuples, returning one string per instruction
+	ops = get_compiled_format(fmt)
+	lines = []
+	for opcode, addr, instr in instrs:
+		result = []
+		format_compiled(result, ops, opcode, addr, instr)
+		lines.append("".join(result))
+	return lines
+
 def disassemble_to_string(fmt, opcode, addr):
 	instr = disassemble(opcode, addr)
 	return format_instruction_string(fmt, opcode, addr, instr)
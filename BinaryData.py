@@ -14,14 +14,29 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import struct
+import array
+import sys
 import io
+import os
+import mmap
+import shutil
+import tempfile
+import random
 import thread
 import Threads
 
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
 DATA_ORIGINAL = 0
 DATA_CHANGED = 1
 DATA_INSERTED = 2
 
+# Priorities for segment tree nodes, kept separate so edits don't disturb the global random state
+segment_priority = random.Random()
+
 
 class BinaryAccessor:
 	def read_uint8(self, ofs):
@@ -144,6 +159,61 @@ class BinaryAccessor:
 	def write_int64_be(self, ofs, val):
 		return self.write(ofs, struct.pack('>q', val)) == 8
 
+	def span(self, ofs, size):
+		# Accessors that can locate a range in a single backing buffer return (buffer, offset)
+		return None
+
+	def view(self, ofs, size):
+		# Returns a read-only view of the range without copying when it is contiguous in the
+		# backing store, falling back to a copy of the data when it is not
+		span = self.span(ofs, size)
+		if span is not None:
+			return buffer_view(span[0], span[1], size)
+		return memoryview(self.read(ofs, size))
+
+	def read_array(self, ofs, count, fmt, endian = '<'):
+		# Reads count values of the struct type fmt (for example 'I' or 'Q') with a single read.
+		# Returns a NumPy array when NumPy is installed, otherwise an array.array, or a list for
+		# types that array.array can't hold at the requested size.
+		size = struct.calcsize(endian + fmt)
+		data = self.read(ofs, count * size)
+		count = len(data) / size
+		data = data[0:count * size]
+
+		if numpy is not None:
+			dtype = numpy.dtype(endian + fmt)
+			if dtype.itemsize == size:
+				return numpy.frombuffer(data, dtype)
+
+		for typecode in array_typecodes(fmt):
+			result = array.array(typecode)
+			if result.itemsize != size:
+				continue
+			result.fromstring(data)
+			if ((endian in ['<', '>', '!']) and ((endian == '<') != (sys.byteorder == 'little'))):
+				result.byteswap()
+			return result
+
+		return list(struct.unpack(endian + (fmt * count), data))
+
+	def read_struct_array(self, ofs, count, struct_def):
+		# Reads count consecutive records with a single read and returns a list of tuples.  The record
+		# is a struct format string or struct.Struct, little endian unless the format says otherwise.
+		if not isinstance(struct_def, struct.Struct):
+			if struct_def[0] not in "<>!=@":
+				struct_def = '<' + struct_def
+			struct_def = struct.Struct(struct_def)
+		endian = struct_def.format[0]
+		fields = struct_def.format[1:]
+
+		data = self.read(ofs, count * struct_def.size)
+		count = len(data) / struct_def.size
+		if count == 0:
+			return []
+		values = struct.unpack(endian + (fields * count), data[0:count * struct_def.size])
+		field_count = len(values) / count
+		return [values[i:i + field_count] for i in xrange(0, len(values), field_count)]
+
 	def end(self):
 		return self.start() + len(self)
 
@@ -234,6 +304,276 @@ class BinaryAccessor:
 				raise IndexError
 
 
+def buffer_view(data, ofs, size):
+	# Mapped files only support the old buffer interface on Python 2, so views of them are
+	# buffer objects rather than memoryviews
+	try:
+		return memoryview(data)[ofs:ofs + size]
+	except TypeError:
+		return buffer(data, ofs, size)
+
+def array_typecodes(fmt):
+	# array.array typecodes that may hold the struct type fmt, depending on the platform's sizes
+	if fmt in ['b', 'h', 'i', 'l', 'q']:
+		return ['b', 'h', 'i', 'l']
+	if fmt in ['B', 'H', 'I', 'L', 'Q']:
+		return ['B', 'H', 'I', 'L']
+	if fmt in ['f', 'd']:
+		return [fmt]
+	return []
+
+
+class DataSegment:
+	# Node of a SegmentTree, covering a contiguous run of bytes.  Subclasses provide split(ofs),
+	# which truncates the segment to ofs bytes and returns a new segment for the rest.
+	def __init__(self, length, priority = None):
+		self.length = length
+		self.total = length
+		self.left = None
+		self.right = None
+		if priority is None:
+			priority = segment_priority.random()
+		self.priority = priority
+
+	def update(self):
+		self.total = self.length
+		if self.left is not None:
+			self.total += self.left.total
+		if self.right is not None:
+			self.total += self.right.total
+
+class Piece(DataSegment):
+	def __init__(self, buffer, start, length, priority = None):
+		DataSegment.__init__(self, length, priority)
+		self.buffer = buffer
+		self.start = start
+
+	def split(self, ofs):
+		result = Piece(self.buffer, self.start + ofs, self.length - ofs, self.priority)
+		self.length = ofs
+		return result
+
+	def read(self, begin, end):
+		return self.buffer[self.start + begin:self.start + end]
+
+
+class SegmentTree:
+	# Sequence of segments stored as a treap keyed on byte offset, so that locating, inserting
+	# and removing a range costs O(log n) in the number of segments
+	def __init__(self):
+		self.root = None
+
+	def __len__(self):
+		if self.root is None:
+			return 0
+		return self.root.total
+
+	def split(self, node, ofs):
+		# Split a subtree into the first ofs bytes and everything after them
+		if node is None:
+			return (None, None)
+		left_total = 0
+		if node.left is not None:
+			left_total = node.left.total
+		if ofs <= left_total:
+			left, right = self.split(node.left, ofs)
+			node.left = right
+			node.update()
+			return (left, node)
+		if ofs >= (left_total + node.length):
+			left, right = self.split(node.right, ofs - (left_total + node.length))
+			node.right = left
+			node.update()
+			return (node, right)
+
+		# Split point is inside this segment
+		rest = node.split(ofs - left_total)
+		rest.right = node.right
+		rest.update()
+		node.right = None
+		node.update()
+		return (node, rest)
+
+	def merge(self, left, right):
+		if left is None:
+			return right
+		if right is None:
+			return left
+		if left.priority > right.priority:
+			left.right = self.merge(left.right, right)
+			left.update()
+			return left
+		right.left = self.merge(left, right.left)
+		right.update()
+		return right
+
+	def insert_segments(self, ofs, segments):
+		middle = None
+		for segment in segments:
+			if segment.length > 0:
+				middle = self.merge(middle, segment)
+		if middle is None:
+			return
+		left, right = self.split(self.root, ofs)
+		self.root = self.merge(self.merge(left, middle), right)
+
+	def remove_segments(self, ofs, size):
+		# Detach a range from the tree and return the removed subtree
+		left, rest = self.split(self.root, ofs)
+		middle, right = self.split(rest, size)
+		self.root = self.merge(left, right)
+		return middle
+
+	def segments(self, ofs, size):
+		# Generate (segment, begin, end) for each segment overlapping the range, where begin and
+		# end are relative to the start of the segment
+		end = ofs + size
+		stack = []
+		node = self.root
+		base = 0
+		while True:
+			while node is not None:
+				left_total = 0
+				if node.left is not None:
+					left_total = node.left.total
+				stack.append((node, base + left_total))
+				if ofs < (base + left_total):
+					node = node.left
+				else:
+					node = None
+
+			if len(stack) == 0:
+				return
+			node, node_start = stack.pop()
+			if node_start >= end:
+				return
+			begin = max(ofs - node_start, 0)
+			finish = min(end - node_start, node.length)
+			if begin < finish:
+				yield (node, begin, finish)
+			if end <= (node_start + node.length):
+				return
+			base = node_start + node.length
+			node = node.right
+
+class PieceTable(SegmentTree):
+	# Byte storage made of pieces referencing the original buffer and the buffers of each edit
+	def __init__(self, data = ""):
+		SegmentTree.__init__(self)
+		if len(data) > 0:
+			self.root = Piece(data, 0, len(data))
+
+	def read(self, ofs, size):
+		if (ofs < 0) or (size <= 0):
+			return ""
+		parts = []
+		for piece, begin, end in self.segments(ofs, size):
+			parts.append(piece.read(begin, end))
+		if len(parts) == 1:
+			return parts[0]
+		return "".join(parts)
+
+	def write(self, ofs, data):
+		self.remove_segments(ofs, len(data))
+		self.insert(ofs, data)
+
+	def insert(self, ofs, data):
+		self.insert_segments(ofs, [Piece(data, 0, len(data))])
+
+	def remove(self, ofs, size):
+		self.remove_segments(ofs, size)
+
+	def span(self, ofs, size):
+		# Returns (buffer, offset) if the range lies within a single piece, else None
+		for piece, begin, end in self.segments(ofs, size):
+			if (end - begin) != size:
+				return None
+			return (piece.buffer, piece.start + begin)
+		return None
+
+	def contiguous_buffer(self):
+		# Returns the backing buffer if the contents are exactly one unedited buffer, else None
+		if (self.root is None) or (self.root.left is not None) or (self.root.right is not None):
+			return None
+		if (self.root.start != 0) or (self.root.length != len(self.root.buffer)):
+			return None
+		return self.root.buffer
+
+	def replace_buffer(self, old, new):
+		# Point pieces referencing one buffer at another holding the same contents
+		for piece, begin, end in self.segments(0, len(self)):
+			if piece.buffer is old:
+				piece.buffer = new
+
+	def chunks(self, block_size = 0x100000):
+		# Generate the contents in bounded blocks without assembling the whole buffer
+		for piece, begin, end in self.segments(0, len(self)):
+			while begin < end:
+				size = min(end - begin, block_size)
+				yield piece.read(begin, begin + size)
+				begin += size
+
+
+class ModificationRun(DataSegment):
+	def __init__(self, value, length, priority = None):
+		DataSegment.__init__(self, length, priority)
+		self.value = value
+
+	def split(self, ofs):
+		result = ModificationRun(self.value, self.length - ofs, self.priority)
+		self.length = ofs
+		return result
+
+class ModificationMap(SegmentTree):
+	# Run-length map of the modification state of each byte, one run per edited range
+	def __init__(self, length = 0):
+		SegmentTree.__init__(self)
+		self.reset(length)
+
+	def reset(self, length):
+		self.root = None
+		if length > 0:
+			self.root = ModificationRun(DATA_ORIGINAL, length)
+
+	def get(self, ofs, size):
+		result = []
+		for run, begin, end in self.segments(ofs, size):
+			result += [run.value] * (end - begin)
+		return result
+
+	def get_runs(self, ofs, size):
+		result = []
+		for run, begin, end in self.segments(ofs, size):
+			if (len(result) > 0) and (result[-1][0] == run.value):
+				result[-1][1] += end - begin
+			else:
+				result.append([run.value, end - begin])
+		return result
+
+	def insert_runs(self, ofs, runs):
+		self.insert_segments(ofs, [ModificationRun(value, length) for value, length in runs])
+
+	def replace_runs(self, ofs, runs):
+		size = 0
+		for value, length in runs:
+			size += length
+		self.remove_segments(ofs, size)
+		self.insert_runs(ofs, runs)
+
+	def insert(self, ofs, size):
+		self.insert_runs(ofs, [[DATA_INSERTED, size]])
+
+	def remove(self, ofs, size):
+		self.remove_segments(ofs, size)
+
+	def mark_changed(self, ofs, size):
+		runs = self.get_runs(ofs, size)
+		for run in runs:
+			if run[0] == DATA_ORIGINAL:
+				run[0] = DATA_CHANGED
+		self.replace_runs(ofs, runs)
+
+
 class WriteUndoEntry:
 	def __init__(self, data, offset, old_contents, new_contents, old_mod):
 		self.data = data
@@ -258,8 +598,8 @@ class RemoveUndoEntry:
 
 class BinaryData(BinaryAccessor):
 	def __init__(self, data = ""):
-		self.data = data
-		self.modification = [DATA_ORIGINAL] * len(data)
+		self.pieces = PieceTable(data)
+		self.modification = ModificationMap(len(data))
 		self.modified = False
 		self.callbacks = []
 		self.undo_buffer = []
@@ -271,46 +611,48 @@ class BinaryData(BinaryAccessor):
 		self.default_arch = None
 
 	def read(self, ofs, size):
-		return self.data[ofs:(ofs + size)]
+		return self.pieces.read(ofs, size)
+
+	def span(self, ofs, size):
+		return self.pieces.span(ofs, size)
 
 	def write(self, ofs, data):
 		if len(data) == 0:
 			return 0
-		if ofs == len(self.data):
-			return self.insert(len(self.data), data)
-		if ofs >= len(self.data):
+		if ofs == len(self.pieces):
+			return self.insert(len(self.pieces), data)
+		if ofs >= len(self.pieces):
 			return 0
 		append = ""
-		if (ofs + len(data)) > len(self.data):
-			append = data[len(self.data)-ofs:]
-			data = data[0:len(self.data)-ofs]
+		if (ofs + len(data)) > len(self.pieces):
+			append = data[len(self.pieces)-ofs:]
+			data = data[0:len(self.pieces)-ofs]
 
-		undo_entry = WriteUndoEntry(self, ofs, self.data[ofs:ofs+len(data)], data, self.modification[ofs:ofs+len(data)])
+		undo_entry = WriteUndoEntry(self, ofs, self.pieces.read(ofs, len(data)), data,
+			self.modification.get_runs(ofs, len(data)))
 		self.insert_undo_entry(undo_entry, self.undo_write, self.redo_write)
 
-		self.data = self.data[0:ofs] + data + self.data[ofs+len(data):]
-		for i in xrange(ofs, ofs + len(data)):
-			if self.modification[i] == DATA_ORIGINAL:
-				self.modification[i] = DATA_CHANGED
+		self.pieces.write(ofs, data)
+		self.modification.mark_changed(ofs, len(data))
 		for cb in self.callbacks:
 			if hasattr(cb, "notify_data_write"):
 				cb.notify_data_write(self, ofs, data)
 		self.modified = True
 		if len(append) > 0:
-			return len(data) + self.insert(len(self.data), append)
+			return len(data) + self.insert(len(self.pieces), append)
 		return len(data)
 
 	def insert(self, ofs, data):
 		if len(data) == 0:
 			return 0
-		if ofs > len(self.data):
+		if ofs > len(self.pieces):
 			return 0
 
 		undo_entry = InsertUndoEntry(self, ofs, data)
 		self.insert_undo_entry(undo_entry, self.undo_insert, self.redo_insert)
 
-		self.data = self.data[0:ofs] + data + self.data[ofs:]
-		self.modification[ofs:ofs] = [DATA_INSERTED] * len(data)
+		self.pieces.insert(ofs, data)
+		self.modification.insert(ofs, len(data))
 		for cb in self.callbacks:
 			if hasattr(cb, "notify_data_insert"):
 				cb.notify_data_insert(self, ofs, data)
@@ -320,16 +662,16 @@ class BinaryData(BinaryAccessor):
 	def remove(self, ofs, size):
 		if size == 0:
 			return 0
-		if ofs >= len(self.data):
+		if ofs >= len(self.pieces):
 			return 0
-		if (ofs + size) > len(self.data):
-			size = len(self.data) - ofs
+		if (ofs + size) > len(self.pieces):
+			size = len(self.pieces) - ofs
 
-		undo_entry = RemoveUndoEntry(self, ofs, self.data[ofs:ofs+size], self.modification[ofs:ofs+size])
+		undo_entry = RemoveUndoEntry(self, ofs, self.pieces.read(ofs, size), self.modification.get_runs(ofs, size))
 		self.insert_undo_entry(undo_entry, self.undo_remove, self.redo_remove)
 
-		self.data = self.data[0:ofs] + self.data[ofs+size:]
-		del self.modification[ofs:ofs+size]
+		self.pieces.remove(ofs, size)
+		self.modification.remove(ofs, size)
 		for cb in self.callbacks:
 			if hasattr(cb, "notify_data_remove"):
 				cb.notify_data_remove(self, ofs, size)
@@ -337,7 +679,7 @@ class BinaryData(BinaryAccessor):
 		return size
 
 	def get_modification(self, ofs, size):
-		return self.modification[ofs:ofs+size]
+		return self.modification.get(ofs, size)
 
 	def add_callback(self, cb):
 		self.callbacks.append(cb)
@@ -347,9 +689,10 @@ class BinaryData(BinaryAccessor):
 
 	def save(self, filename):
 		f = io.open(filename, 'wb')
-		f.write(self.data)
+		for chunk in self.pieces.chunks():
+			f.write(chunk)
 		f.close()
-		self.modification = [DATA_ORIGINAL] * len(self.data)
+		self.modification.reset(len(self.pieces))
 		self.modified = False
 		self.unmodified_undo_index = len(self.undo_buffer)
 
@@ -357,13 +700,16 @@ class BinaryData(BinaryAccessor):
 		return 0
 
 	def __len__(self):
-		return len(self.data)
+		return len(self.pieces)
 
 	def is_modified(self):
 		return self.modified
 
 	def find(self, regex, addr):
-		match = regex.search(self.data, addr)
+		data = self.pieces.contiguous_buffer()
+		if data is None:
+			data = self.pieces.read(0, len(self.pieces))
+		match = regex.search(data, addr)
 		if match == None:
 			return -1
 		return match.start()
@@ -382,47 +728,45 @@ class BinaryData(BinaryAccessor):
 		self.temp_undo_buffer.append([data, undo_func, redo_func])
 
 	def undo_write(self, entry):
-		self.data = self.data[0:entry.offset] + entry.old_contents + self.data[entry.offset + len(entry.old_contents):]
-		self.modification = self.modification[0:entry.offset] + entry.old_mod + self.modification[entry.offset + len(entry.old_mod):]
+		self.pieces.write(entry.offset, entry.old_contents)
+		self.modification.replace_runs(entry.offset, entry.old_mod)
 		for cb in self.callbacks:
 			if hasattr(cb, "notify_data_write"):
 				cb.notify_data_write(self, entry.offset, entry.old_contents)
 
 	def redo_write(self, entry):
-		self.data = self.data[0:entry.offset] + entry.new_contents + self.data[entry.offset + len(entry.new_contents):]
-		for i in xrange(entry.offset, entry.offset + len(entry.new_contents)):
-			if self.modification[i] == DATA_ORIGINAL:
-				self.modification[i] = DATA_CHANGED
+		self.pieces.write(entry.offset, entry.new_contents)
+		self.modification.mark_changed(entry.offset, len(entry.new_contents))
 		for cb in self.callbacks:
 			if hasattr(cb, "notify_data_write"):
 				cb.notify_data_write(self, entry.offset, entry.new_contents)
 		self.modified = True
 
 	def undo_insert(self, entry):
-		self.data = self.data[0:entry.offset] + self.data[entry.offset + len(entry.contents):]
-		self.modification = self.modification[0:entry.offset] + self.modification[entry.offset + len(entry.contents):]
+		self.pieces.remove(entry.offset, len(entry.contents))
+		self.modification.remove(entry.offset, len(entry.contents))
 		for cb in self.callbacks:
 			if hasattr(cb, "notify_data_remove"):
 				cb.notify_data_remove(self, entry.offset, len(entry.contents))
 
 	def redo_insert(self, entry):
-		self.data = self.data[0:entry.offset] + entry.contents + self.data[entry.offset:]
-		self.modification[entry.offset:entry.offset] = [DATA_INSERTED] * len(entry.contents)
+		self.pieces.insert(entry.offset, entry.contents)
+		self.modification.insert(entry.offset, len(entry.contents))
 		for cb in self.callbacks:
 			if hasattr(cb, "notify_data_insert"):
 				cb.notify_data_insert(self, entry.offset, entry.contents)
 		self.modified = True
 
 	def undo_remove(self, entry):
-		self.data = self.data[0:entry.offset] + entry.old_contents + self.data[entry.offset:]
-		self.modification = self.modification[0:entry.offset] + entry.old_mod + self.modification[entry.offset:]
+		self.pieces.insert(entry.offset, entry.old_contents)
+		self.modification.insert_runs(entry.offset, entry.old_mod)
 		for cb in self.callbacks:
 			if hasattr(cb, "notify_data_insert"):
 				cb.notify_data_insert(self, entry.offset, entry.old_contents)
 
 	def redo_remove(self, entry):
-		self.data = self.data[0:entry.offset] + self.data[entry.offset + len(entry.old_contents):]
-		self.modification = self.modification[0:entry.offset] + self.modification[entry.offset + len(entry.old_contents):]
+		self.pieces.remove(entry.offset, len(entry.old_contents))
+		self.modification.remove(entry.offset, len(entry.old_contents))
 		for cb in self.callbacks:
 			if hasattr(cb, "notify_data_remove"):
 				cb.notify_data_remove(self, entry.offset, len(entry.old_contents))
@@ -459,9 +803,93 @@ class BinaryData(BinaryAccessor):
 
 
 class BinaryFile(BinaryData):
-	def __init__(self, filename):
-		f = io.open(filename, 'rb')
-		data = f.read()
-		f.close()
+	def __init__(self, filename, mapped = True):
+		self.filename = filename
+		self.mapping = None
+		data = self.map_file(filename, mapped)
 		BinaryData.__init__(self, data)
 
+	def map_file(self, filename, mapped):
+		# Map the file so that the original contents stay on disk and only edited pieces are held in
+		# memory.  Files that cannot be mapped (empty files, pipes, devices) are read into memory.
+		f = io.open(filename, 'rb')
+		try:
+			if mapped:
+				try:
+					self.mapping = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+					return self.mapping
+				except (ValueError, EnvironmentError):
+					self.mapping = None
+			return f.read()
+		finally:
+			f.close()
+
+	def save(self, filename):
+		same_file = os.path.normcase(os.path.realpath(filename)) == os.path.normcase(os.path.realpath(self.filename))
+		if (self.mapping is None) or (not same_file) or (not os.path.exists(filename)):
+			BinaryData.save(self, filename)
+			return
+
+		# The mapped file is the source of the unmodified pieces, so it can't be overwritten in place.
+		# Write the new contents next to it, then replace the original and map the result.
+		temp_name = None
+		try:
+			fd, temp_name = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(filename)))
+			f = os.fdopen(fd, 'wb')
+			try:
+				for chunk in self.pieces.chunks():
+					f.write(chunk)
+			finally:
+				f.close()
+			shutil.copymode(filename, temp_name)
+
+			if os.name == "nt":
+				self.replace_mapped_file(temp_name, filename)
+			else:
+				os.rename(temp_name, filename)
+			temp_name = None
+		except OSError as e:
+			raise IOError(e.errno, e.strerror)
+		finally:
+			if (temp_name is not None) and os.path.exists(temp_name):
+				os.remove(temp_name)
+
+		# The old mapping is released once no views refer to it
+		self.filename = filename
+		self.pieces = PieceTable(self.map_file(filename, True))
+		self.modification.reset(len(self.pieces))
+		self.modified = False
+		self.unmodified_undo_index = len(self.undo_buffer)
+
+	def file_regions(self):
+		# Describes the contents as (offset, length) runs of the mapped file and strings of the
+		# bytes that differ from it, so that another process can rebuild them by mapping the file
+		regions = []
+		for piece, begin, end in self.pieces.segments(0, len(self.pieces)):
+			if (self.mapping is not None) and (piece.buffer is self.mapping):
+				regions.append((piece.start + begin, end - begin))
+			else:
+				regions.append(str(piece.read(begin, end)))
+		return regions
+
+	def replace_mapped_file(self, temp_name, filename):
+		# Windows can't replace a file that is still mapped.  The original is moved aside rather
+		# than removed, so that it can be put back and mapped again if the replace fails.
+		backup_name = temp_name + ".old"
+		old_mapping = self.mapping
+		old_mapping.close()
+		try:
+			os.rename(filename, backup_name)
+			try:
+				os.rename(temp_name, filename)
+			except OSError:
+				os.rename(backup_name, filename)
+				raise
+		except OSError:
+			self.pieces.replace_buffer(old_mapping, self.map_file(filename, True))
+			raise
+		try:
+			os.remove(backup_name)
+		except OSError:
+			pass
+
@@ -0,0 +1,215 @@
+# Copyright (c) 2011-2015 Rusty Wagner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import array
+
+
+class CallGraph:
+	# Calls between analyzed functions.  Edges are kept in sets for each function so that a
+	# function can be replaced when it is analyzed again, and are packed into adjacency arrays
+	# on demand for queries over the whole program.
+	def __init__(self):
+		self.callees = {}
+		self.callers = {}
+		self.compact_graph = None
+
+	def set_calls(self, entry, targets):
+		targets = set(targets)
+		if entry in self.callees:
+			old_targets = self.callees[entry]
+			if old_targets == targets:
+				return
+		else:
+			old_targets = set()
+
+		for target in old_targets - targets:
+			self.callers[target].discard(entry)
+			if len(self.callers[target]) == 0:
+				del self.callers[target]
+		for target in targets - old_targets:
+			if target in self.callers:
+				self.callers[target].add(entry)
+			else:
+				self.callers[target] = set([entry])
+		self.callees[entry] = targets
+		self.compact_graph = None
+
+	def get_callees(self, entry):
+		return sorted(self.callees.get(entry, []))
+
+	def get_callers(self, entry):
+		return sorted(self.callers.get(entry, []))
+
+	def compact(self):
+		# The packed graph is immutable, so it can be queried without holding the analysis lock
+		if self.compact_graph is None:
+			self.compact_graph = CompactCallGraph(self.callees)
+		return self.compact_graph
+
+
+class CompactCallGraph:
+	# Call graph with functions numbered in address order and edges stored in flat arrays.  The
+	# calls made by function i are targets[offsets[i]:offsets[i + 1]], and calls made to it are
+	# found the same way in the reverse arrays.
+	def __init__(self, callees):
+		addrs = set(callees.keys())
+		for targets in callees.values():
+			addrs.update(targets)
+		self.addrs = sorted(addrs)
+		self.index = dict((addr, i) for i, addr in enumerate(self.addrs))
+
+		forward = [[self.index[target] for target in callees.get(addr, [])] for addr in self.addrs]
+		reverse = [[] for addr in self.addrs]
+		for i in xrange(0, len(forward)):
+			for target in forward[i]:
+				reverse[target].append(i)
+
+		self.offsets, self.targets = self.pack(forward)
+		self.reverse_offsets, self.reverse_targets = self.pack(reverse)
+		self.components = None
+
+	def pack(self, edge_lists):
+		offsets = array.array('i', [0])
+		targets = array.array('i')
+		for edges in edge_lists:
+			targets.extend(sorted(edges))
+			offsets.append(len(targets))
+		return offsets, targets
+
+	def __len__(self):
+		return len(self.addrs)
+
+	def __contains__(self, addr):
+		return addr in self.index
+
+	def edge_count(self):
+		return len(self.targets)
+
+	def callees(self, addr):
+		if addr not in self.index:
+			return []
+		i = self.index[addr]
+		return [self.addrs[target] for target in self.targets[self.offsets[i]:self.offsets[i + 1]]]
+
+	def callers(self, addr):
+		if addr not in self.index:
+			return []
+		i = self.index[addr]
+		return [self.addrs[target] for target in self.reverse_targets[self.reverse_offsets[i]:self.reverse_offsets[i + 1]]]
+
+	def search(self, addrs, offsets, targets):
+		if type(addrs) in [int, long]:
+			addrs = [addrs]
+		found = bytearray(len(self.addrs))
+		queue = []
+		for addr in addrs:
+			if (addr in self.index) and (not found[self.index[addr]]):
+				found[self.index[addr]] = 1
+				queue.append(self.index[addr])
+		while len(queue) > 0:
+			i = queue.pop()
+			for target in targets[offsets[i]:offsets[i + 1]]:
+				if not found[target]:
+					found[target] = 1
+					queue.append(target)
+		return [self.addrs[i] for i in xrange(0, len(self.addrs)) if found[i]]
+
+	def reachable(self, addrs):
+		# Functions that can be reached through calls from any of the given functions, including
+		# the functions themselves
+		return self.search(addrs, self.offsets, self.targets)
+
+	def reaching(self, addrs):
+		# Functions from which any of the given functions can be reached
+		return self.search(addrs, self.reverse_offsets, self.reverse_targets)
+
+	def strongly_connected_components(self):
+		# Tarjan's algorithm, using an explicit stack so that deep call chains do not exceed the
+		# recursion limit.  Each component is listed after every component it calls.
+		if self.components is not None:
+			return self.components
+
+		count = len(self.addrs)
+		offsets = self.offsets
+		targets = self.targets
+		index = array.array('i', [-1]) * count
+		low = array.array('i', [0]) * count
+		on_stack = bytearray(count)
+		stack = []
+		components = []
+		next_index = 0
+
+		for root in xrange(0, count):
+			if index[root] != -1:
+				continue
+			index[root] = next_index
+			low[root] = next_index
+			next_index += 1
+			stack.append(root)
+			on_stack[root] = 1
+			path = [[root, offsets[root]]]
+
+			while len(path) > 0:
+				node, edge = path[-1]
+				if edge < offsets[node + 1]:
+					path[-1][1] = edge + 1
+					target = targets[edge]
+					if index[target] == -1:
+						index[target] = next_index
+						low[target] = next_index
+						next_index += 1
+						stack.append(target)
+						on_stack[target] = 1
+						path.append([target, offsets[target]])
+					elif on_stack[target] and (index[target] < low[node]):
+						low[node] = index[target]
+					continue
+
+				path.pop()
+				if (len(path) > 0) and (low[node] < low[path[-1][0]]):
+					low[path[-1][0]] = low[node]
+
+				if low[node] == index[node]:
+					component = []
+					while True:
+						member = stack.pop()
+						on_stack[member] = 0
+						component.append(self.addrs[member])
+						if member == node:
+							break
+					component.sort()
+					components.append(component)
+
+		self.components = components
+		return components
+
+	def topological_order(self):
+		# Callers are listed before the functions they call.  Functions in a cycle of calls are
+		# listed together in address order.
+		result = []
+		for component in reversed(self.strongly_connected_components()):
+			result += component
+		return result
+
+	def recursive_functions(self):
+		# Functions that can call themselves, directly or through other functions
+		result = []
+		for component in self.strongly_connected_components():
+			if len(component) > 1:
+				result += component
+			elif component[0] in self.callees(component[0]):
+				result += component
+		return sorted(result)
+
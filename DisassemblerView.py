@@ -19,6 +19,7 @@ from Fonts import *
 from View import *
 from FindDialog import *
 from ArchitectureDialog import *
+from XrefsDialog import *
 
 
 class DisassemblerBlock:
@@ -82,6 +83,8 @@ class DisassemblerView(QAbstractScrollArea):
 		self.highlight_token = None
 		self.cur_instr = None
 		self.scroll_mode = False
+		self.hover_target = None
+		self.prioritized = None
 		self.blocks = {}
 		self.show_il = False
 		self.simulation = None
@@ -105,6 +108,9 @@ class DisassemblerView(QAbstractScrollArea):
 		areaSize = self.viewport().size()
 		self.adjustSize(areaSize.width(), areaSize.height())
 
+		# Track the mouse so that hovered call targets can be analyzed first
+		self.viewport().setMouseTracking(True)
+
 		# Setup navigation
 		self.view.register_navigate("disassembler", self, self.navigate)
 		self.view.register_navigate("make_proc", self, self.make_proc)
@@ -453,9 +459,13 @@ class DisassemblerView(QAbstractScrollArea):
 		enter_name_action.setShortcut(QKeySequence(Qt.Key_N))
 		undefine_name_action = popup.addAction("&Undefine symbol", self.undefine_name)
 		undefine_name_action.setShortcut(QKeySequence(Qt.Key_U))
+		xrefs_action = popup.addAction("Show &references", self.show_xrefs)
+		xrefs_action.setShortcut(QKeySequence(Qt.Key_X))
 		show_address_action = popup.addAction("Show &address", self.show_address)
 		show_address_action.setCheckable(True)
 		show_address_action.setChecked("address" in self.analysis.options)
+		if not self.analysis.sweep_complete:
+			popup.addAction("Stop scanning for &functions", self.analysis.cancel_sweep)
 		popup.addSeparator()
 
 		patch = popup.addMenu("&Patch")
@@ -512,6 +522,13 @@ class DisassemblerView(QAbstractScrollArea):
 			self.scroll_base_y = event.y()
 			self.horizontalScrollBar().setValue(self.horizontalScrollBar().value() + x_delta)
 			self.verticalScrollBar().setValue(self.verticalScrollBar().value() + y_delta)
+			return
+
+		# Analyze the target under the mouse ahead of other queued functions
+		token = self.getTokenForMouseEvent(event)
+		if token and (token[2] == "ptr") and (token[3] != self.hover_target):
+			self.hover_target = token[3]
+			self.analysis.prioritize([token[3]])
 
 	def mouseReleaseEvent(self, event):
 		if event.button() != Qt.LeftButton:
@@ -591,6 +608,26 @@ class DisassemblerView(QAbstractScrollArea):
 		# Ask for new name
 		self.analysis.undefine_symbol(addr, name)
 
+	def show_xrefs(self):
+		# Show references to the selected symbol, or to the current function if there is none
+		if (self.highlight_token != None) and (self.highlight_token[0] == "ptr"):
+			addr = self.highlight_token[1]
+			name = self.highlight_token[2]
+		elif self.function is not None:
+			addr = self.function
+			func = self.analysis.functions.get(addr)
+			if func is not None:
+				name = func.name
+			else:
+				name = "sub_%.8x" % addr
+		else:
+			return
+
+		dlg = XrefsDialog(self.analysis, addr, name, self)
+		if dlg.exec_() == QDialog.Accepted:
+			self.view.add_history_entry()
+			self.navigate(dlg.result)
+
 	def navigate_for_find(self, addr):
 		func, instr = self.analysis.find_instr(addr, True)
 		if func != None:
@@ -678,6 +715,8 @@ class DisassemblerView(QAbstractScrollArea):
 			self.enter_name()
 		elif event.key() == Qt.Key_U:
 			self.undefine_name()
+		elif event.key() == Qt.Key_X:
+			self.show_xrefs()
 		elif event.key() == Qt.Key_Slash:
 			dlg = FindDialog(FindDialog.SEARCH_REGEX, self)
 			if dlg.exec_() == QDialog.Accepted:
@@ -867,9 +906,16 @@ class DisassemblerView(QAbstractScrollArea):
 		return edge
 
 	def renderFunction(self, func):
+		# Functions replace their block list when it changes, so take the version and the blocks
+		# once, in that order, and render from them without holding the analysis lock.  Text is
+		# formatted here, only for the blocks that are shown.
+		update_id = func.update_id
+		func_blocks = func.blocks
+		self.analysis.format_text(func, func_blocks)
+
 		# Create render nodes
 		self.blocks = {}
-		for block in func.blocks.values():
+		for block in func_blocks.values():
 			self.blocks[block.entry] = DisassemblerBlock(block)
 			self.prepareGraphNode(self.blocks[block.entry])
 
@@ -879,7 +925,7 @@ class DisassemblerView(QAbstractScrollArea):
 				self.blocks[edge].incoming += [block.block.entry]
 
 		# Construct acyclic graph where each node is used as an edge exactly once
-		block = func.blocks[func.entry]
+		block = func_blocks[func.entry]
 		visited = [func.entry]
 		queue = [self.blocks[func.entry]]
 		changed = True
@@ -1048,7 +1094,7 @@ class DisassemblerView(QAbstractScrollArea):
 			self.horizontalScrollBar().setValue(start_x - int(areaSize.width() / 2))
 			self.verticalScrollBar().setValue(0)
 
-		self.update_id = func.update_id
+		self.update_id = update_id
 		self.ready = True
 		self.viewport().update(0, 0, areaSize.width(), areaSize.height())
 
@@ -1061,21 +1107,32 @@ class DisassemblerView(QAbstractScrollArea):
 		if self.function is None:
 			return
 
+		# Published functions can be read without the analysis lock, so the view does not wait for
+		# the analysis of other functions
+		func = self.analysis.functions.get(self.function)
+
 		if self.ready:
 			# Check for updated code
-			self.analysis.lock.acquire()
-			if self.update_id != self.analysis.functions[self.function].update_id:
-				self.renderFunction(self.analysis.functions[self.function])
-			self.analysis.lock.release()
+			if self.update_id != func.update_id:
+				self.renderFunction(func)
 			return
 
 		# View not up to date, check to see if active function is ready
-		self.analysis.lock.acquire()
-		if self.analysis.functions.has_key(self.function):
-			if self.analysis.functions[self.function].ready:
-				# Active function now ready, generate graph
-				self.renderFunction(self.analysis.functions[self.function])
-		self.analysis.lock.release()
+		calls = None
+		if (func is not None) and func.ready:
+			# Active function now ready, generate graph
+			self.renderFunction(func)
+			calls = func.findCalls()
+
+		# Analyze the active function, or the functions it calls once it is shown, before others.
+		# Only send the request when it changes, not on every tick.
+		if calls is None:
+			addrs = [self.function]
+		else:
+			addrs = calls
+		if addrs != self.prioritized:
+			self.prioritized = addrs
+			self.analysis.prioritize(addrs)
 
 	def show_cur_instr(self):
 		for block in self.blocks.values():
@@ -1125,10 +1182,7 @@ class DisassemblerView(QAbstractScrollArea):
 				return False
 			self.data.default_arch = arch_dlg.result
 
-		self.analysis.lock.acquire()
-		if addr not in self.analysis.functions:
-			self.analysis.queue.append(addr)
-		self.analysis.lock.release()
+		self.analysis.request_function(addr)
 
 		self.function = addr
 		self.cur_instr = None
@@ -1154,9 +1208,7 @@ class DisassemblerView(QAbstractScrollArea):
 
 		if self.ready:
 			# Rerender function to update layout
-			self.analysis.lock.acquire()
 			self.renderFunction(self.analysis.functions[self.function])
-			self.analysis.lock.release()
 
 	def getPriority(data, ext):
 		if Analysis.isPreferredForFile(data):
@@ -14,12 +14,30 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from BinaryData import *
+from AddressMap import *
 from Structure import *
 from HexEditor import *
 from View import *
 
 
 class ElfFile(BinaryAccessor):
+	symbol_layout_32 = [("uint32", 4, "name_offset"), ("uint32", 4, "value"), ("uint32", 4, "size"),
+		("uint8", 1, "info"), ("uint8", 1, "other"), ("uint16", 2, "section")]
+	symbol_layout_64 = [("uint32", 4, "name_offset"), ("uint8", 1, "info"), ("uint8", 1, "other"),
+		("uint16", 2, "section"), ("uint64", 8, "value"), ("uint64", 8, "size")]
+	section_layout_32 = [("uint32", 4, "name"), ("uint32", 4, "type"), ("uint32", 4, "flags"),
+		("uint32", 4, "addr"), ("uint32", 4, "offset"), ("uint32", 4, "size"), ("uint32", 4, "link"),
+		("uint32", 4, "info"), ("uint32", 4, "align"), ("uint32", 4, "entry_size")]
+	section_layout_64 = [("uint32", 4, "name"), ("uint32", 4, "type"), ("uint64", 8, "flags"),
+		("uint64", 8, "addr"), ("uint64", 8, "offset"), ("uint64", 8, "size"), ("uint32", 4, "link"),
+		("uint32", 4, "info"), ("uint64", 8, "align"), ("uint64", 8, "entry_size")]
+	program_header_layout_32 = [("uint32", 4, "type"), ("uint32", 4, "offset"), ("uint32", 4, "virtual_addr"),
+		("uint32", 4, "physical_addr"), ("uint32", 4, "file_size"), ("uint32", 4, "memory_size"),
+		("uint32", 4, "flags"), ("uint32", 4, "align")]
+	program_header_layout_64 = [("uint32", 4, "type"), ("uint32", 4, "flags"), ("uint64", 8, "offset"),
+		("uint64", 8, "virtual_addr"), ("uint64", 8, "physical_addr"), ("uint64", 8, "file_size"),
+		("uint64", 8, "memory_size"), ("uint64", 8, "align")]
+
 	def __init__(self, data):
 		self.data = data
 		self.valid = False
@@ -63,20 +81,10 @@ class ElfFile(BinaryAccessor):
 
 				try:
 					self.sections = self.tree.array(self.header.section_header_count, "sections")
-					for i in range(0, self.header.section_header_count):
-						section = self.sections[i]
-						section.seek(self.header.section_header_offset + (i * 40))
-						section.uint32("name")
-						section.uint32("type")
-						section.uint32("flags")
-						section.uint32("addr")
-						section.uint32("offset")
-						section.uint32("size")
-						section.uint32("link")
-						section.uint32("info")
-						section.uint32("align")
-						section.uint32("entry_size")
-
+					entries = self.data.read_struct_array(self.header.section_header_offset,
+						self.header.section_header_count, "<IIIIIIIIII")
+					self.sections.fields(self.header.section_header_offset, 40, ElfFile.section_layout_32, entries)
+					for section in self.sections:
 						if section.type == 2:
 							self.symbol_table_section = section
 						elif section.type == 11:
@@ -87,17 +95,9 @@ class ElfFile(BinaryAccessor):
 					pass
 
 				self.program_headers = self.tree.array(self.header.program_header_count, "programHeaders")
-				for i in range(0, self.header.program_header_count):
-					header = self.program_headers[i]
-					header.seek(self.header.program_header_offset + (i * 32))
-					header.uint32("type")
-					header.uint32("offset")
-					header.uint32("virtual_addr")
-					header.uint32("physical_addr")
-					header.uint32("file_size")
-					header.uint32("memory_size")
-					header.uint32("flags")
-					header.uint32("align")
+				entries = self.data.read_struct_array(self.header.program_header_offset,
+					self.header.program_header_count, "<IIIIIIII")
+				self.program_headers.fields(self.header.program_header_offset, 32, ElfFile.program_header_layout_32, entries)
 
 				# Parse symbol tables
 				self.symbols_by_name["_start"] = self.entry()
@@ -136,20 +136,10 @@ class ElfFile(BinaryAccessor):
 
 				try:
 					self.sections = self.tree.array(self.header.section_header_count, "sections")
-					for i in range(0, self.header.section_header_count):
-						section = self.sections[i]
-						section.seek(self.header.section_header_offset + (i * 64))
-						section.uint32("name")
-						section.uint32("type")
-						section.uint64("flags")
-						section.uint64("addr")
-						section.uint64("offset")
-						section.uint64("size")
-						section.uint32("link")
-						section.uint32("info")
-						section.uint64("align")
-						section.uint64("entry_size")
-
+					entries = self.data.read_struct_array(self.header.section_header_offset,
+						self.header.section_header_count, "<IIQQQQIIQQ")
+					self.sections.fields(self.header.section_header_offset, 64, ElfFile.section_layout_64, entries)
+					for section in self.sections:
 						if section.type == 2:
 							self.symbol_table_section = section
 						elif section.type == 11:
@@ -160,17 +150,9 @@ class ElfFile(BinaryAccessor):
 					pass
 
 				self.program_headers = self.tree.array(self.header.program_header_count, "program_headers")
-				for i in range(0, self.header.program_header_count):
-					header = self.program_headers[i]
-					header.seek(self.header.program_header_offset + (i * 56))
-					header.uint32("type")
-					header.uint32("flags")
-					header.uint64("offset")
-					header.uint64("virtual_addr")
-					header.uint64("physical_addr")
-					header.uint64("file_size")
-					header.uint64("memory_size")
-					header.uint64("align")
+				entries = self.data.read_struct_array(self.header.program_header_offset,
+					self.header.program_header_count, "<IIQQQQQQ")
+				self.program_headers.fields(self.header.program_header_offset, 56, ElfFile.program_header_layout_64, entries)
 
 				# Parse symbol tables
 				self.symbols_by_name["_start"] = self.entry()
@@ -196,6 +178,8 @@ class ElfFile(BinaryAccessor):
 					elif section.type == 4:
 						self.parse_reloca_64(section)
 
+			self.address_map = AddressMap([(i.virtual_addr, i.memory_size, i.offset, i.file_size) for i in self.program_headers])
+
 			self.tree.complete()
 			self.valid = True
 		except:
@@ -210,14 +194,10 @@ class ElfFile(BinaryAccessor):
 
 	def parse_symbol_table_32(self, table, section, string_table):
 		strings = self.data.read(string_table.offset, string_table.size)
-		for i in range(0, section.size / 16):
+		entries = self.data.read_struct_array(section.offset, section.size / 16, "<IIIBBH")
+		for i in range(0, len(entries)):
 			table[i].seek(section.offset + (i * 16))
-			table[i].uint32("name_offset")
-			table[i].uint32("value")
-			table[i].uint32("size")
-			table[i].uint8("info")
-			table[i].uint8("other")
-			table[i].uint16("section")
+			table[i].fields(ElfFile.symbol_layout_32, entries[i])
 			table[i].name = self.read_string_table(strings, table[i].name_offset)
 
 			if len(table[i].name) > 0:
@@ -226,14 +206,10 @@ class ElfFile(BinaryAccessor):
 
 	def parse_symbol_table_64(self, table, section, string_table):
 		strings = self.data.read(string_table.offset, string_table.size)
-		for i in range(0, section.size / 24):
+		entries = self.data.read_struct_array(section.offset, section.size / 24, "<IBBHQQ")
+		for i in range(0, len(entries)):
 			table[i].seek(section.offset + (i * 24))
-			table[i].uint32("name_offset")
-			table[i].uint8("info")
-			table[i].uint8("other")
-			table[i].uint16("section")
-			table[i].uint64("value")
-			table[i].uint64("size")
+			table[i].fields(ElfFile.symbol_layout_64, entries[i])
 			table[i].name = self.read_string_table(strings, table[i].name_offset)
 
 			if len(table[i].name) > 0:
@@ -241,9 +217,7 @@ class ElfFile(BinaryAccessor):
 				self.symbols_by_addr[table[i].value] = table[i].name
 
 	def parse_reloc_32(self, section):
-		for i in range(0, section.size / 8):
-			ofs = self.data.read_uint32(section.offset + (i * 8))
-			info = self.data.read_uint32(section.offset + (i * 8) + 4)
+		for ofs, info in self.data.read_struct_array(section.offset, section.size / 8, "<II"):
 			sym = info >> 8
 			reloc_type = info & 0xff
 			if reloc_type == 7: # R_386_JUMP_SLOT
@@ -252,9 +226,7 @@ class ElfFile(BinaryAccessor):
 				self.symbols_by_addr[ofs] = self.decorate_plt_name(self.dynamic_symbol_table[sym].name)
 
 	def parse_reloca_32(self, section):
-		for i in range(0, section.size / 12):
-			ofs = self.data.read_uint32(section.offset + (i * 12))
-			info = self.data.read_uint32(section.offset + (i * 12) + 4)
+		for ofs, info, addend in self.data.read_struct_array(section.offset, section.size / 12, "<IIi"):
 			sym = info >> 8
 			reloc_type = info & 0xff
 			if reloc_type == 7: # R_386_JUMP_SLOT
@@ -263,9 +235,7 @@ class ElfFile(BinaryAccessor):
 				self.symbols_by_addr[ofs] = self.decorate_plt_name(self.dynamic_symbol_table[sym].name)
 
 	def parse_reloc_64(self, section):
-		for i in range(0, section.size / 16):
-			ofs = self.data.read_uint64(section.offset + (i * 16))
-			info = self.data.read_uint64(section.offset + (i * 16) + 8)
+		for ofs, info in self.data.read_struct_array(section.offset, section.size / 16, "<QQ"):
 			sym = info >> 32
 			reloc_type = info & 0xff
 			if reloc_type == 7: # R_X86_64_JUMP_SLOT
@@ -274,9 +244,7 @@ class ElfFile(BinaryAccessor):
 				self.symbols_by_addr[ofs] = self.decorate_plt_name(self.dynamic_symbol_table[sym].name)
 
 	def parse_reloca_64(self, section):
-		for i in range(0, section.size / 24):
-			ofs = self.data.read_uint64(section.offset + (i * 24))
-			info = self.data.read_uint64(section.offset + (i * 24) + 8)
+		for ofs, info, addend in self.data.read_struct_array(section.offset, section.size / 24, "<QQq"):
 			sym = info >> 32
 			reloc_type = info & 0xff
 			if reloc_type == 7: # R_X86_64_JUMP_SLOT
@@ -285,98 +253,29 @@ class ElfFile(BinaryAccessor):
 				self.symbols_by_addr[ofs] = self.decorate_plt_name(self.dynamic_symbol_table[sym].name)
 
 	def read(self, ofs, len):
-		result = ""
-		while len > 0:
-			cur = None
-			for i in self.program_headers:
-				if ((ofs >= i.virtual_addr) and (ofs < (i.virtual_addr + i.memory_size))) and (i.memory_size != 0):
-					cur = i
-			if cur == None:
-				break
-
-			prog_ofs = ofs - cur.virtual_addr
-			mem_len = cur.memory_size - prog_ofs
-			file_len = cur.file_size - prog_ofs
-			if mem_len > len:
-				mem_len = len
-			if file_len > len:
-				file_len = len
-
-			if file_len <= 0:
-				result += "\x00" * mem_len
-				len -= mem_len
-				ofs += mem_len
-				continue
-
-			result += self.data.read(cur.offset + prog_ofs, file_len)
-			len -= file_len
-			ofs += file_len
-
-		return result
+		return self.address_map.read(self.data, ofs, len)
+
+	def span(self, ofs, len):
+		return self.address_map.span(self.data, ofs, len)
 
 	def next_valid_addr(self, ofs):
-		result = -1
-		for i in self.program_headers:
-			if (i.virtual_addr >= ofs) and (i.memory_size != 0) and ((result == -1) or (i.virtual_addr < result)):
-				result = i.virtual_addr
-		return result
+		return self.address_map.next_valid_addr(ofs)
+
+	def code_ranges(self):
+		# Loaded segments that are executable, as (start, end) address pairs
+		return [(i.virtual_addr, i.virtual_addr + i.memory_size) for i in self.program_headers
+			if (i.type == 1) and ((i.flags & 1) != 0)]
+
+	def data_ranges(self):
+		# Loaded segments that are not executable, limited to the part backed by the file
+		return [(i.virtual_addr, i.virtual_addr + i.file_size) for i in self.program_headers
+			if (i.type == 1) and ((i.flags & 1) == 0)]
 
 	def get_modification(self, ofs, len):
-		result = []
-		while len > 0:
-			cur = None
-			for i in self.program_headers:
-				if ((ofs >= i.virtual_addr) and (ofs < (i.virtual_addr + i.memory_size))) and (i.memory_size != 0):
-					cur = i
-			if cur == None:
-				break
-
-			prog_ofs = ofs - cur.virtual_addr
-			mem_len = cur.memory_size - prog_ofs
-			file_len = cur.file_size - prog_ofs
-			if mem_len > len:
-				mem_len = len
-			if file_len > len:
-				file_len = len
-
-			if file_len <= 0:
-				result += [DATA_ORIGINAL] * mem_len
-				len -= mem_len
-				ofs += mem_len
-				continue
-
-			result += self.data.get_modification(cur.offset + prog_ofs, file_len)
-			len -= file_len
-			ofs += file_len
-
-		return result
+		return self.address_map.get_modification(self.data, ofs, len)
 
 	def write(self, ofs, data):
-		result = 0
-		while len(data) > 0:
-			cur = None
-			for i in self.program_headers:
-				if ((ofs >= i.virtual_addr) and (ofs < (i.virtual_addr + i.memory_size))) and (i.memory_size != 0):
-					cur = i
-			if cur == None:
-				break
-
-			prog_ofs = ofs - cur.virtual_addr
-			mem_len = cur.memory_size - prog_ofs
-			file_len = cur.file_size - prog_ofs
-			if mem_len > len:
-				mem_len = len
-			if file_len > len:
-				file_len = len
-
-			if file_len <= 0:
-				break
-
-			result += self.data.write(cur.offset + prog_ofs, data[0:file_len])
-			data = data[file_len:]
-			ofs += file_len
-
-		return result
+		return self.address_map.write(self.data, ofs, data)
 
 	def insert(self, ofs, data):
 		return 0
@@ -410,21 +309,13 @@ class ElfFile(BinaryAccessor):
 		self.data.save(filename)
 
 	def start(self):
-		result = None
-		for i in self.program_headers:
-			if ((result == None) or (i.virtual_addr < result)) and (i.memory_size != 0):
-				result = i.virtual_addr
-		return result
+		return self.address_map.start()
 
 	def entry(self):
 		return self.header.entry
 
 	def __len__(self):
-		max = None
-		for i in self.program_headers:
-			if ((max == None) or ((i.virtual_addr + i.memory_size) > max)) and (i.memory_size != 0):
-				max = i.virtual_addr + i.memory_size
-		return max - self.start()
+		return self.address_map.end() - self.start()
 
 	def is_elf(self):
 		return self.data.read(0, 4) == "\x7fELF"
@@ -0,0 +1,58 @@
+# Copyright (c) 2011-2015 Rusty Wagner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# Compiled form of each format string used so far
+CompiledFormats = {}
+
+
+def compile_format(fmt):
+	# Splits a format string into (code, width) operations for %a, %b, %i and %o, with a code of
+	# None for literal text.  A '%' followed by any other character is replaced by that character.
+	ops = []
+	text = ""
+	i = 0
+	while i < len(fmt):
+		if fmt[i] == '%':
+			width = 0
+			i += 1
+			while i < len(fmt):
+				if fmt[i] in ['a', 'b', 'i', 'o']:
+					if len(text) > 0:
+						ops.append((None, text))
+						text = ""
+					if (fmt[i] == 'a') and (width == 0):
+						width = 8
+					ops.append((fmt[i], width))
+					break
+				elif (fmt[i] >= '0') and (fmt[i] <= '9'):
+					width = (width * 10) + (ord(fmt[i]) - 0x30)
+				else:
+					text += fmt[i]
+					break
+				i += 1
+		else:
+			text += fmt[i]
+		i += 1
+	if len(text) > 0:
+		ops.append((None, text))
+	return ops
+
+def get_compiled_format(fmt):
+	ops = CompiledFormats.get(fmt)
+	if ops is None:
+		ops = compile_format(fmt)
+		CompiledFormats[fmt] = ops
+	return ops
@@ -0,0 +1,96 @@
+# Copyright (c) 2011-2015 Rusty Wagner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import array
+import bisect
+
+
+RANGE_FLAG_INVALID = 1
+RANGE_FLAG_JUMP = 2
+RANGE_FLAG_CONDITIONAL = 4
+RANGE_FLAG_CALL = 8
+RANGE_FLAG_BLOCK_ENDING = 16
+RANGE_FLAG_TARGET = 32
+
+
+def address_array(addr_size):
+	# Python 2 arrays only have a 64-bit type on platforms where long is 64 bits
+	if array.array('L').itemsize >= addr_size:
+		return array.array('L')
+	return []
+
+
+class InstructionRange:
+	# Instructions decoded from a single buffer, stored as parallel arrays instead of an object
+	# for each instruction.  Operations are indices into operation_names, and targets are only
+	# meaningful for instructions with RANGE_FLAG_TARGET set.  The decoder's instruction objects
+	# are kept in instrs only when they were requested.
+	def __init__(self, base_addr, addr_size, keep_instrs = False):
+		self.base_addr = base_addr
+		self.end_addr = base_addr
+		self.offsets = array.array('I')
+		self.lengths = array.array('B')
+		self.operations = array.array('H')
+		self.flags = array.array('B')
+		self.targets = address_array(addr_size)
+		self.addr_mask = (1 << (addr_size * 8)) - 1
+		self.operation_names = [None]
+		self.operation_index = {None: 0}
+		if keep_instrs:
+			self.instrs = []
+		else:
+			self.instrs = None
+
+	def add(self, offset, length, operation, flags, target, instr):
+		index = self.operation_index.get(operation)
+		if index is None:
+			index = len(self.operation_names)
+			self.operation_index[operation] = index
+			self.operation_names.append(operation)
+		if target is None:
+			target = 0
+		else:
+			target &= self.addr_mask
+			flags |= RANGE_FLAG_TARGET
+		self.offsets.append(offset)
+		self.lengths.append(length)
+		self.operations.append(index)
+		self.flags.append(flags)
+		self.targets.append(target)
+		if self.instrs is not None:
+			self.instrs.append(instr)
+		self.end_addr = self.base_addr + offset + length
+
+	def __len__(self):
+		return len(self.offsets)
+
+	def addr(self, i):
+		return self.base_addr + self.offsets[i]
+
+	def operation(self, i):
+		return self.operation_names[self.operations[i]]
+
+	def target(self, i):
+		if self.flags[i] & RANGE_FLAG_TARGET:
+			return self.targets[i]
+		return None
+
+	def find(self, addr):
+		# Returns the index of the instruction starting at the given address, or None
+		offset = addr - self.base_addr
+		i = bisect.bisect_left(self.offsets, offset)
+		if (i < len(self.offsets)) and (self.offsets[i] == offset):
+			return i
+		return None
@@ -0,0 +1,103 @@
+# Copyright (c) 2011-2015 Rusty Wagner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import struct
+import bisect
+
+
+# Instruction sequences commonly found at the start of a function, with the required alignment
+PROLOGUES = {
+	"x86": [("\x55\x89\xe5", 1), ("\x55\x8b\xec", 1), ("\xf3\x0f\x1e\xfb", 1)], # push ebp; mov ebp, esp and endbr32
+	"x86_64": [("\x55\x48\x89\xe5", 1), ("\x55\x48\x8b\xec", 1), ("\xf3\x0f\x1e\xfa", 1)], # push rbp; mov rbp, rsp and endbr64
+	"arm": [("[\x00-\xff][\x40-\x7f\xc0-\xff]\x2d\xe9", 4)], # push {..., lr}
+	"ppc": [("\x94\x21[\x80-\xff]", 4)] # stwu r1, -n(r1)
+}
+
+# Matches are zero width so that overlapping candidates at different alignments are all found
+PROLOGUE_PATTERNS = {}
+for arch, prologues in PROLOGUES.items():
+	PROLOGUE_PATTERNS[arch] = [(re.compile("(?=" + pattern + ")"), align) for pattern, align in prologues]
+
+SWEEP_CHUNK_SIZE = 0x40000
+
+
+def create_sweep_chunks(exe):
+	# Splits the executable into pieces that can be scanned independently.  Code is searched
+	# for prologues, and everything else for pointers into code.
+	chunks = []
+	for start, end in exe.code_ranges():
+		for ofs in xrange(start, end, SWEEP_CHUNK_SIZE):
+			chunks.append(("code", ofs, min(ofs + SWEEP_CHUNK_SIZE, end)))
+	for start, end in exe.data_ranges():
+		for ofs in xrange(start, end, SWEEP_CHUNK_SIZE):
+			chunks.append(("data", ofs, min(ofs + SWEEP_CHUNK_SIZE, end)))
+	return chunks
+
+def sweep_chunk(exe, chunk):
+	kind, start, end = chunk
+	if kind == "code":
+		return find_prologues(exe, start, end)
+	return find_code_pointers(exe, start, end)
+
+def find_prologues(exe, start, end):
+	if exe.architecture() not in PROLOGUE_PATTERNS:
+		return []
+
+	# Read past the end of the chunk so that prologues crossing into the next chunk are found
+	data = exe.read(start, (end - start) + 3)
+	result = []
+	for pattern, align in PROLOGUE_PATTERNS[exe.architecture()]:
+		for match in pattern.finditer(data):
+			addr = start + match.start()
+			if addr >= end:
+				break
+			if (addr % align) == 0:
+				result.append(addr)
+	return result
+
+def find_code_pointers(exe, start, end):
+	if exe.architecture() == "x86_64":
+		size = 8
+		fmt = "<%dQ"
+	elif exe.architecture() == "ppc":
+		size = 4
+		fmt = ">%dI"
+	else:
+		size = 4
+		fmt = "<%dI"
+
+	code_ranges = sorted(exe.code_ranges())
+	if len(code_ranges) == 0:
+		return []
+	range_starts = [r[0] for r in code_ranges]
+	code_start = code_ranges[0][0]
+	code_end = max([r[1] for r in code_ranges])
+
+	# Pointers are assumed to be naturally aligned
+	start = (start + size - 1) & ~(size - 1)
+	if start >= end:
+		return []
+	data = exe.read(start, end - start)
+	count = len(data) / size
+	result = []
+	for value in struct.unpack(fmt % count, data[0:count * size]):
+		if (value < code_start) or (value >= code_end):
+			continue
+		i = bisect.bisect_right(range_starts, value) - 1
+		if value < code_ranges[i][1]:
+			result.append(value)
+	return result
+
@@ -14,12 +14,16 @@
 # WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE.
 
 from BinaryData import *
+from AddressMap import *
 from Structure import *
 from HexEditor import *
 from View import *
 
 
 class MachOFile(BinaryAccessor):
+	reloc_layout_le = [("uint32_le", 4, "addr"), ("uint32_le", 4, "value")]
+	reloc_layout_be = [("uint32_be", 4, "addr"), ("uint32_be", 4, "value")]
+
 	def __init__(self, data):
 		self.data = data
 		self.valid = False
@@ -134,15 +138,12 @@ class MachOFile(BinaryAccessor):
 					for i in xrange(0, cmd.nsects):
 						section = cmd.sections[i]
 						section.array(section.nreloc, "relocs")
-						for j in xrange(0, section.nreloc):
-							reloc = section.relocs[j]
-							reloc.seek(section.reloff + (j * 8))
-							if self.big_endian:
-								reloc.uint32_be("addr")
-								reloc.uint32_be("value")
-							else:
-								reloc.uint32_le("addr")
-								reloc.uint32_le("value")
+						if self.big_endian:
+							entries = self.data.read_struct_array(section.reloff, section.nreloc, ">II")
+							section.relocs.fields(section.reloff, 8, MachOFile.reloc_layout_be, entries)
+						else:
+							entries = self.data.read_struct_array(section.reloff, section.nreloc, "<II")
+							section.relocs.fields(section.reloff, 8, MachOFile.reloc_layout_le, entries)
 				elif cmd.cmd == 25: # SEGMENT_64
 					cmd.bytes(16, "name")
 					if self.big_endian:
@@ -199,15 +200,12 @@ class MachOFile(BinaryAccessor):
 					for i in xrange(0, cmd.nsects):
 						section = cmd.sections[i]
 						section.array(section.nreloc, "relocs")
-						for j in xrange(0, section.nreloc):
-							reloc = section.relocs[j]
-							reloc.seek(section.reloff + (j * 8))
-							if self.big_endian:
-								reloc.uint32_be("addr")
-								reloc.uint32_be("value")
-							else:
-								reloc.uint32_le("addr")
-								reloc.uint32_le("value")
+						if self.big_endian:
+							entries = self.data.read_struct_array(section.reloff, section.nreloc, ">II")
+							section.relocs.fields(section.reloff, 8, MachOFile.reloc_layout_be, entries)
+						else:
+							entries = self.data.read_struct_array(section.reloff, section.nreloc, "<II")
+							section.relocs.fields(section.reloff, 8, MachOFile.reloc_layout_le, entries)
 				elif cmd.cmd == 5: # UNIX_THREAD
 					if self.header.cputype == 7: # x86
 						cmd.uint32_le("flavor")
@@ -258,37 +256,30 @@ class MachOFile(BinaryAccessor):
 					self.symbol_table = self.tree.array(cmd.nsyms, "symtab")
 					strings = self.data.read(cmd.stroff, cmd.strsize)
 
-					sym_offset = cmd.symoff
+					if self.big_endian:
+						endian = ">"
+						suffix = "_be"
+					else:
+						endian = "<"
+						suffix = "_le"
+					if self.bits == 32:
+						entry_size = 12
+						layout = [("uint32" + suffix, 4, "strx"), ("uint8", 1, "type"), ("uint8", 1, "sect"),
+							("uint16" + suffix, 2, "desc"), ("uint32" + suffix, 4, "value")]
+						entries = self.data.read_struct_array(cmd.symoff, cmd.nsyms, endian + "IBBHI")
+					else:
+						entry_size = 16
+						layout = [("uint32" + suffix, 4, "strx"), ("uint8", 1, "type"), ("uint8", 1, "sect"),
+							("uint16" + suffix, 2, "desc"), ("uint64" + suffix, 8, "value")]
+						entries = self.data.read_struct_array(cmd.symoff, cmd.nsyms, endian + "IBBHQ")
+
 					for j in xrange(0, cmd.nsyms):
 						entry = self.symbol_table[j]
-						entry.seek(sym_offset)
-
-						if self.big_endian:
-							entry.uint32_be("strx")
-							entry.uint8("type")
-							entry.uint8("sect")
-							entry.uint16_be("desc")
-							if self.bits == 32:
-								entry.uint32_be("value")
-							else:
-								entry.uint64_be("value")
-						else:
-							entry.uint32_le("strx")
-							entry.uint8("type")
-							entry.uint8("sect")
-							entry.uint16_le("desc")
-							if self.bits == 32:
-								entry.uint32_le("value")
-							else:
-								entry.uint64_le("value")
+						entry.seek(cmd.symoff + (j * entry_size))
+						entry.fields(layout, entries[j])
 
 						str_end = strings.find("\x00", entry.strx)
 						entry.name = strings[entry.strx:str_end]
-
-						if self.bits == 32:
-							sym_offset += 12
-						else:
-							sym_offset += 16
 				elif cmd.cmd == 11: # DYSYMTAB
 					if self.big_endian:
 						cmd.uint32_be("ilocalsym")
@@ -355,6 +346,8 @@ class MachOFile(BinaryAccessor):
 
 				offset += cmd.size
 
+			self.address_map = AddressMap([(i.vmaddr, i.vmsize, i.fileoff, i.filesize) for i in self.segments])
+
 			# Add symbols from symbol table
 			if self.symbol_table:
 				for i in xrange(0, len(self.symbol_table)):
@@ -453,98 +446,27 @@ class MachOFile(BinaryAccessor):
 						skip, i = self.read_leb128(opcodes, i)
 
 	def read(self, ofs, len):
-		result = ""
-		while len > 0:
-			cur = None
-			for i in self.segments:
-				if ((ofs >= i.vmaddr) and (ofs < (i.vmaddr + i.vmsize))) and (i.vmsize != 0):
-					cur = i
-			if cur == None:
-				break
+		return self.address_map.read(self.data, ofs, len)
 
-			prog_ofs = ofs - cur.vmaddr
-			mem_len = cur.vmsize - prog_ofs
-			file_len = cur.filesize - prog_ofs
-			if mem_len > len:
-				mem_len = len
-			if file_len > len:
-				file_len = len
-
-			if file_len <= 0:
-				result += "\x00" * mem_len
-				len -= mem_len
-				ofs += mem_len
-				continue
-
-			result += self.data.read(cur.fileoff + prog_ofs, file_len)
-			len -= file_len
-			ofs += file_len
-
-		return result
+	def span(self, ofs, len):
+		return self.address_map.span(self.data, ofs, len)
 
 	def next_valid_addr(self, ofs):
-		result = -1
-		for i in self.segments:
-			if (i.vmaddr >= ofs) and (i.vmsize != 0) and ((result == -1) or (i.vmaddr < result)):
-				result = i.vmaddr
-		return result
+		return self.address_map.next_valid_addr(ofs)
 
-	def get_modification(self, ofs, len):
-		result = []
-		while len > 0:
-			cur = None
-			for i in self.segments:
-				if ((ofs >= i.vmaddr) and (ofs < (i.vmaddr + i.vmsize))) and (i.vmsize != 0):
-					cur = i
-			if cur == None:
-				break
-
-			prog_ofs = ofs - cur.vmaddr
-			mem_len = cur.vmsize - prog_ofs
-			file_len = cur.filesize - prog_ofs
-			if mem_len > len:
-				mem_len = len
-			if file_len > len:
-				file_len = len
+	def code_ranges(self):
+		# Segments that are executable, as (start, end) address pairs
+		return [(i.vmaddr, i.vmaddr + i.vmsize) for i in self.segments if (i.initprot & 4) != 0]
 
-			if file_len <= 0:
-				result += [DATA_ORIGINAL] * mem_len
-				len -= mem_len
-				ofs += mem_len
-				continue
+	def data_ranges(self):
+		# Segments that are not executable, limited to the part backed by the file
+		return [(i.vmaddr, i.vmaddr + min(i.vmsize, i.filesize)) for i in self.segments if (i.initprot & 4) == 0]
 
-			result += self.data.get_modification(cur.fileoff + prog_ofs, file_len)
-			len -= file_len
-			ofs += file_len
-
-		return result
+	def get_modification(self, ofs, len):
+		return self.address_map.get_modification(self.data, ofs, len)
 
 	def write(self, ofs, data):
-		result = 0
-		while len(data) > 0:
-			cur = None
-			for i in self.segments:
-				if ((ofs >= i.vmaddr) and (ofs < (i.vmaddr + i.vmsize))) and (i.vmsize != 0):
-					cur = i
-			if cur == None:
-				break
-
-			prog_ofs = ofs - cur.vmaddr
-			mem_len = cur.vmsize - prog_ofs
-			file_len = cur.filesize - prog_ofs
-			if mem_len > len:
-				mem_len = len
-			if file_len > len:
-				file_len = len
-
-			if file_len <= 0:
-				break
-
-			result += self.data.write(cur.fileoff + prog_ofs, data[0:file_len])
-			data = data[file_len:]
-			ofs += file_len
-
-		return result
+		return self.address_map.write(self.data, ofs, data)
 
 	def insert(self, ofs, data):
 		return 0
@@ -578,11 +500,7 @@ class MachOFile(BinaryAccessor):
 		self.data.save(filename)
 
 	def start(self):
-		result = None
-		for i in self.segments:
-			if ((result == None) or (i.vmaddr < result)) and (i.vmsize != 0):
-				result = i.vmaddr
-		return result
+		return self.address_map.start()
 
 	def entry(self):
 		if not hasattr(self, "entry_addr"):
@@ -590,11 +508,7 @@ class MachOFile(BinaryAccessor):
 		return self.entry_addr
 
 	def __len__(self):
-		max = None
-		for i in self.segments:
-			if ((max == None) or ((i.vmaddr + i.vmsize) > max)) and (i.vmsize != 0):
-				max = i.vmaddr + i.vmsize
-		return max - self.start()
+		return self.address_map.end() - self.start()
 
 	def is_macho(self):
 		if self.data.read(0, 4) == "\xfe\xed\xfa\xce":
@@ -14,6 +14,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from BinaryData import *
+from AddressMap import *
 from Structure import *
 from HexEditor import *
 from View import *
@@ -28,6 +29,13 @@ class PEFile(BinaryAccessor):
 			self.pointer_to_raw_data = None
 			self.characteristics = None
 
+	section_layout = [("bytes", 8, "name"), ("uint32", 4, "virtual_size"), ("uint32", 4, "virtual_address"),
+		("uint32", 4, "size_of_raw_data"), ("uint32", 4, "pointer_to_raw_data"), ("uint32", 4, "pointer_to_relocs"),
+		("uint32", 4, "pointer_to_line_numbers"), ("uint16", 2, "reloc_count"), ("uint16", 2, "line_number_count"),
+		("uint32", 4, "characteristics")]
+	import_layout = [("uint32", 4, "lookup"), ("uint32", 4, "timestamp"), ("uint32", 4, "forward_chain"),
+		("uint32", 4, "name"), ("uint32", 4, "iat")]
+
 	def __init__(self, data):
 		self.data = data
 		self.valid = False
@@ -149,20 +157,10 @@ class PEFile(BinaryAccessor):
 			self.sections.append(header_section_obj)
 
 			self.tree.array(self.header.section_count, "sections")
-			for i in xrange(0, self.header.section_count):
-				section = self.tree.sections[i]
-				section.seek(self.mz.pe_offset + self.header.optional_header_size + 24 + (i * 40))
-				section.bytes(8, "name")
-				section.uint32("virtual_size")
-				section.uint32("virtual_address")
-				section.uint32("size_of_raw_data")
-				section.uint32("pointer_to_raw_data")
-				section.uint32("pointer_to_relocs")
-				section.uint32("pointer_to_line_numbers")
-				section.uint16("reloc_count")
-				section.uint16("line_number_count")
-				section.uint32("characteristics")
-
+			table_ofs = self.mz.pe_offset + self.header.optional_header_size + 24
+			entries = self.data.read_struct_array(table_ofs, self.header.section_count, "<8sIIIIIIHHI")
+			self.tree.sections.fields(table_ofs, 40, PEFile.section_layout, entries)
+			for section in self.tree.sections:
 				section_obj = PEFile.SectionInfo()
 				section_obj.virtual_size = section.virtual_size
 				section_obj.virtual_address = section.virtual_address & ~(self.header.opt.section_align - 1)
@@ -171,24 +169,23 @@ class PEFile(BinaryAccessor):
 				section_obj.characteristics = section.characteristics
 				self.sections.append(section_obj)
 
+			self.address_map = AddressMap([(self.image_base + i.virtual_address, i.virtual_size,
+				i.pointer_to_raw_data, i.size_of_raw_data) for i in self.sections])
+
 			self.symbols_by_name["_start"] = self.entry()
 			self.symbols_by_addr[self.entry()] = "_start"
 
 			if self.header.opt.data_dir_count >= 2:
 				self.imports = self.tree.array(0, "imports")
-				for i in xrange(0, self.data_dirs[1].size / 20):
-					if self.read(self.image_base + self.data_dirs[1].virtual_address + (i * 20), 4) == "\0\0\0\0":
-						break
-					if self.read(self.image_base + self.data_dirs[1].virtual_address + (i * 20) + 16, 4) == "\0\0\0\0":
+				entries = self.read_struct_array(self.image_base + self.data_dirs[1].virtual_address,
+					self.data_dirs[1].size / 20, "<IIIII")
+				for i in xrange(0, len(entries)):
+					# The table ends with a null descriptor
+					if (entries[i][0] == 0) or (entries[i][4] == 0):
 						break
 					self.imports.append()
-					dll = self.imports[i]
-					dll.seek(self.virtual_address_to_file_offset(self.image_base + self.data_dirs[1].virtual_address) + (i * 20))
-					dll.uint32("lookup")
-					dll.uint32("timestamp")
-					dll.uint32("forward_chain")
-					dll.uint32("name")
-					dll.uint32("iat")
+				self.imports.fields(self.virtual_address_to_file_offset(self.image_base + self.data_dirs[1].virtual_address),
+					20, PEFile.import_layout, entries)
 
 				for dll in self.imports:
 					name = self.read_string(self.image_base + dll.name).split('.')
@@ -197,31 +194,39 @@ class PEFile(BinaryAccessor):
 					else:
 						name = name[0]
 
+					if self.bits == 32:
+						entry_type = "I"
+					else:
+						entry_type = "Q"
+					ordinal_flag = 1 << (self.bits - 1)
+
+					# Read the lookup table in chunks, as its length is only known by its null terminator
 					entry_ofs = self.image_base + dll.lookup
 					iat_ofs = self.image_base + dll.iat
-					while True:
-						if self.bits == 32:
-							entry = self.read_uint32(entry_ofs)
-							is_ordinal = (entry & 0x80000000) != 0
-							entry &= 0x7fffffff
-						else:
-							entry = self.read_uint64(entry_ofs)
-							is_ordinal = (entry & 0x8000000000000000) != 0
-							entry &= 0x7fffffffffffffff
-
-						if (not is_ordinal) and (entry == 0):
+					done = False
+					while not done:
+						entries = self.read_array(entry_ofs, 64, entry_type)
+						if len(entries) == 0:
 							break
+						for entry in entries:
+							entry = long(entry)
+							is_ordinal = (entry & ordinal_flag) != 0
+							entry &= ordinal_flag - 1
 
-						if is_ordinal:
-							func = name + "!Ordinal%d" % (entry & 0xffff)
-						else:
-							func = name + "!" + self.read_string(self.image_base + entry + 2)
+							if (not is_ordinal) and (entry == 0):
+								done = True
+								break
 
-						self.symbols_by_name[func] = iat_ofs
-						self.symbols_by_addr[iat_ofs] = func
+							if is_ordinal:
+								func = name + "!Ordinal%d" % (entry & 0xffff)
+							else:
+								func = name + "!" + self.read_string(self.image_base + entry + 2)
 
-						entry_ofs += self.bits / 8
-						iat_ofs += self.bits / 8
+							self.symbols_by_name[func] = iat_ofs
+							self.symbols_by_addr[iat_ofs] = func
+
+							iat_ofs += self.bits / 8
+						entry_ofs += len(entries) * (self.bits / 8)
 
 			if (self.header.opt.data_dir_count >= 1) and (self.data_dirs[0].size >= 40):
 				self.exports = self.tree.struct("Export directory", "exports")
@@ -239,19 +244,25 @@ class PEFile(BinaryAccessor):
 				self.exports.uint32("address_of_name_ordinals")
 
 				self.exports.array(self.exports.function_count, "functions")
+				table_ofs = self.virtual_address_to_file_offset(self.image_base + self.exports.address_of_functions)
+				entries = self.data.read_struct_array(table_ofs, self.exports.function_count, "<I")
 				for i in xrange(0, self.exports.function_count):
-					self.exports.functions[i].seek(self.virtual_address_to_file_offset(self.image_base + self.exports.address_of_functions) + (i * 4))
-					self.exports.functions[i].uint32("address")
+					self.exports.functions[i].seek(table_ofs + (i * 4))
+					self.exports.functions[i].fields([("uint32", 4, "address")], entries[i])
 
 				self.exports.array(self.exports.name_count, "names")
+				table_ofs = self.virtual_address_to_file_offset(self.image_base + self.exports.address_of_names)
+				entries = self.data.read_struct_array(table_ofs, self.exports.name_count, "<I")
 				for i in xrange(0, self.exports.name_count):
-					self.exports.names[i].seek(self.virtual_address_to_file_offset(self.image_base + self.exports.address_of_names) + (i * 4))
-					self.exports.names[i].uint32("address_of_name")
+					self.exports.names[i].seek(table_ofs + (i * 4))
+					self.exports.names[i].fields([("uint32", 4, "address_of_name")], entries[i])
 
 				self.exports.array(self.exports.name_count, "name_ordinals")
+				table_ofs = self.virtual_address_to_file_offset(self.image_base + self.exports.address_of_name_ordinals)
+				entries = self.data.read_struct_array(table_ofs, self.exports.name_count, "<H")
 				for i in xrange(0, self.exports.name_count):
-					self.exports.name_ordinals[i].seek(self.virtual_address_to_file_offset(self.image_base + self.exports.address_of_name_ordinals) + (i * 2))
-					self.exports.name_ordinals[i].uint16("ordinal")
+					self.exports.name_ordinals[i].seek(table_ofs + (i * 2))
+					self.exports.name_ordinals[i].fields([("uint16", 2, "ordinal")], entries[i])
 
 				for i in xrange(0, self.exports.name_count):
 					function_index = self.exports.name_ordinals[i].ordinal - self.exports.base
@@ -272,115 +283,42 @@ class PEFile(BinaryAccessor):
 	def read_string(self, addr):
 		result = ""
 		while True:
-			ch = self.read(addr, 1)
-			addr += 1
-			if (len(ch) == 0) or (ch == '\0'):
-				break
-			result += ch
-		return result
+			data = self.read(addr, 64)
+			end = data.find('\0')
+			if end != -1:
+				return result + data[0:end]
+			result += data
+			addr += len(data)
+			if len(data) == 0:
+				return result
 
 	def virtual_address_to_file_offset(self, addr):
-		for i in self.sections:
-			if ((addr >= (self.image_base + i.virtual_address)) and (addr < (self.image_base + i.virtual_address + i.virtual_size))) and (i.virtual_size != 0):
-				cur = i
-		if cur == None:
-			return None
-		ofs = addr - (self.image_base + cur.virtual_address)
-		return cur.pointer_to_raw_data + ofs
+		return self.address_map.file_offset(addr)
 
 	def read(self, ofs, len):
-		result = ""
-		while len > 0:
-			cur = None
-			for i in self.sections:
-				if ((ofs >= (self.image_base + i.virtual_address)) and (ofs < (self.image_base + i.virtual_address + i.virtual_size))) and (i.virtual_size != 0):
-					cur = i
-			if cur == None:
-				break
-
-			prog_ofs = ofs - (self.image_base + cur.virtual_address)
-			mem_len = cur.virtual_size - prog_ofs
-			file_len = cur.size_of_raw_data - prog_ofs
-			if mem_len > len:
-				mem_len = len
-			if file_len > len:
-				file_len = len
-
-			if file_len <= 0:
-				result += "\x00" * mem_len
-				len -= mem_len
-				ofs += mem_len
-				continue
-
-			result += self.data.read(cur.pointer_to_raw_data + prog_ofs, file_len)
-			len -= file_len
-			ofs += file_len
-
-		return result
+		return self.address_map.read(self.data, ofs, len)
+
+	def span(self, ofs, len):
+		return self.address_map.span(self.data, ofs, len)
 
 	def next_valid_addr(self, ofs):
-		result = -1
-		for i in self.sections:
-			if ((self.image_base + i.virtual_address) >= ofs) and (i.virtual_size != 0) and ((result == -1) or ((self.image_base + i.virtual_address) < result)):
-				result = self.image_base + i.virtual_address
-		return result
+		return self.address_map.next_valid_addr(ofs)
+
+	def code_ranges(self):
+		# Sections that are executable, as (start, end) address pairs
+		return [(self.image_base + i.virtual_address, self.image_base + i.virtual_address + i.virtual_size)
+			for i in self.sections[1:] if (i.characteristics & 0x20000000) != 0]
+
+	def data_ranges(self):
+		# Sections that are not executable, limited to the part backed by the file
+		return [(self.image_base + i.virtual_address, self.image_base + i.virtual_address + min(i.virtual_size, i.size_of_raw_data))
+			for i in self.sections[1:] if (i.characteristics & 0x20000000) == 0]
 
 	def get_modification(self, ofs, len):
-		result = []
-		while len > 0:
-			cur = None
-			for i in self.sections:
-				if ((ofs >= (self.image_base + i.virtual_address)) and (ofs < (self.image_base + i.virtual_address + i.virtual_size))) and (i.virtual_size != 0):
-					cur = i
-			if cur == None:
-				break
-
-			prog_ofs = ofs - (self.image_base + cur.virtual_address)
-			mem_len = cur.virtual_size - prog_ofs
-			file_len = cur.size_of_raw_data - prog_ofs
-			if mem_len > len:
-				mem_len = len
-			if file_len > len:
-				file_len = len
-
-			if file_len <= 0:
-				result += [DATA_ORIGINAL] * mem_len
-				len -= mem_len
-				ofs += mem_len
-				continue
-
-			result += self.data.get_modification(cur.pointer_to_raw_data + prog_ofs, file_len)
-			len -= file_len
-			ofs += file_len
-
-		return result
+		return self.address_map.get_modification(self.data, ofs, len)
 
 	def write(self, ofs, data):
-		result = 0
-		while len(data) > 0:
-			cur = None
-			for i in self.sections:
-				if ((ofs >= (self.image_base + i.virtual_address)) and (ofs < (self.image_base + i.virtual_address + i.virtual_size))) and (i.virtual_size != 0):
-					cur = i
-			if cur == None:
-				break
-
-			prog_ofs = ofs - (self.image_base + cur.virtual_address)
-			mem_len = cur.virtual_size - prog_ofs
-			file_len = cur.size_of_raw_data - prog_ofs
-			if mem_len > len:
-				mem_len = len
-			if file_len > len:
-				file_len = len
-
-			if file_len <= 0:
-				break
-
-			result += self.data.write(cur.pointer_to_raw_data + prog_ofs, data[0:file_len])
-			data = data[file_len:]
-			ofs += file_len
-
-		return result
+		return self.address_map.write(self.data, ofs, data)
 
 	def insert(self, ofs, data):
 		return 0
@@ -420,11 +358,7 @@ class PEFile(BinaryAccessor):
 		return self.image_base + self.header.opt.address_of_entry
 
 	def __len__(self):
-		max = None
-		for i in self.sections:
-			if ((max == None) or ((self.image_base + i.virtual_address + i.virtual_size) > max)) and (i.virtual_size != 0):
-				max = self.image_base + i.virtual_address + i.virtual_size
-		return max - self.start()
+		return self.address_map.end() - self.start()
 
 	def is_pe(self):
 		if self.data.read(0, 2) != "MZ":
@@ -20,6 +20,10 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 
+import struct
+from InstructionRange import *
+from FormatString import *
+
 Registers = ["r%d" % i for i in xrange(0, 32)]
 RegisterOrZero = [0] + ["r%d" % i for i in xrange(1, 32)]
 FloatRegisters = ["f%d" % i for i in xrange(0, 32)]
@@ -169,18 +173,6 @@ def std(instr, opcode, addr):
 	instr.operands = [OperandDecode[i](opcode, addr) for i in ['rS', 'rA']]
 	instr.operands.append(sign_extend_16(opcode & 0xfffc))
 
-def group(group_map, ext_opcode, instr, opcode, addr):
-	op = group_map[ext_opcode]
-	if op is None:
-		return instr
-	if type(op) == list:
-		instr.operation = op[0]
-		instr.operands = [OperandDecode[i](opcode, addr) for i in op[1]]
-		if op[2]:
-			op[2](instr, opcode, addr)
-	else:
-		op(instr, opcode, addr)
-
 # Extended mnemonic handlers
 def crset(instr, opcode, addr):
 	if (instr.operands[0] == instr.operands[1]) and (instr.operands[1] == instr.operands[2]):
@@ -556,6 +548,8 @@ for i in xrange(0, 32):
 	Group63Map[30 + (i << 5)] = ["fnmsub", ['frT', 'frA', 'frC', 'frB'], cond_bit]
 	Group63Map[31 + (i << 5)] = ["fnmadd", ['frT', 'frA', 'frC', 'frB'], cond_bit]
 
+# Entries are instructions, functions that decode the instruction, or a (group map, shift, mask)
+# tuple for opcodes with an extended opcode field
 MainOpcodeMap = [
 	None, # 0
 	None, # 1
@@ -576,7 +570,7 @@ MainOpcodeMap = [
 	bc, # 16
 	["sc", ['LEV'], None], # 17
 	b, # 18
-	lambda instr, opcode, addr: group(Group19Map, (opcode >> 1) & 1023, instr, opcode, addr), # 19
+	(Group19Map, 1, 1023), # 19
 	["rlwimi", ['rS', 'rA', 'SH', 'MB', 'ME'], cond_bit], # 20
 	["rlwinm", ['rS', 'rA', 'SH', 'MB', 'ME'], rlwinm], # 21
 	None, # 22
@@ -587,8 +581,8 @@ MainOpcodeMap = [
 	["xoris", ['rS', 'rA', 'UI'], None], # 27
 	["andi", ['rS', 'rA', 'UI'], None], # 28
 	["andis", ['rS', 'rA', 'UI'], None], # 29
-	lambda instr, opcode, addr: group(Group30Map, (opcode >> 1) & 15, instr, opcode, addr), # 30
-	lambda instr, opcode, addr: group(Group31Map, (opcode >> 1) & 1023, instr, opcode, addr), # 31
+	(Group30Map, 1, 15), # 30
+	(Group31Map, 1, 1023), # 31
 	["lwz", ['rT', 'rA|0', 'SI'], None], # 32
 	["lwzu", ['rT', 'rA', 'SI'], None], # 33
 	["lbz", ['rT', 'rA|0', 'SI'], None], # 34
@@ -615,14 +609,39 @@ MainOpcodeMap = [
 	["stfdu", ['frS', 'rA', 'SI'], None], # 55
 	None, # 56
 	None, # 57
-	lambda instr, opcode, addr: group(Group58Map, opcode & 3, instr, opcode, addr), # 58
-	lambda instr, opcode, addr: group(Group59Map, (opcode >> 1) & 31, instr, opcode, addr), # 59
+	(Group58Map, 0, 3), # 58
+	(Group59Map, 1, 31), # 59
 	None, # 60
 	None, # 61
 	std, # 62
-	lambda instr, opcode, addr: group(Group63Map, (opcode >> 1) & 1023, instr, opcode, addr) # 63
+	(Group63Map, 1, 1023) # 63
 ]
 
+def compile_opcode_entry(op):
+	if type(op) == list:
+		return (op[0], [OperandDecode[i] for i in op[1]], op[2])
+	return op
+
+def compile_opcode_maps():
+	# Flattens the primary and extended opcode tables into a single map, keyed by the primary
+	# opcode and the extended opcode field of its group
+	fields = []
+	flat = {}
+	for primary in xrange(0, 64):
+		op = MainOpcodeMap[primary]
+		if type(op) == tuple:
+			group_map, shift, mask = op
+			fields.append((shift, mask))
+			for ext, ext_op in group_map.items():
+				flat[(primary << 11) | ext] = compile_opcode_entry(ext_op)
+		else:
+			fields.append((0, 0))
+			if op is not None:
+				flat[primary << 11] = compile_opcode_entry(op)
+	return fields, flat
+
+ExtendedOpcodeFields, FlatOpcodeMap = compile_opcode_maps()
+
 def ppc_load_reg(instr, i):
 	return il_load_reg(instr.operands[i], 8)
 
@@ -713,65 +732,146 @@ class Instruction:
 		self.operation = None
 		self.operands = []
 
-def disassemble(opcode, addr):
-	instr = Instruction()
-	op = MainOpcodeMap[(opcode >> 26) & 63]
+class DecodeCache:
+	# Bounded cache of decoded words, kept in two generations.  When the newer generation is full
+	# it replaces the older one, so words that were not used since the last swap are dropped.
+	def __init__(self, size):
+		self.size = size
+		self.recent = {}
+		self.old = {}
+
+	def get(self, key):
+		entry = self.recent.get(key)
+		if entry is None:
+			entry = self.old.get(key)
+			if entry is not None:
+				self.add(key, entry)
+		return entry
+
+	def add(self, key, entry):
+		if len(self.recent) >= self.size:
+			self.old = self.recent
+			self.recent = {}
+		self.recent[key] = entry
+
+	def clear(self):
+		self.recent = {}
+		self.old = {}
+
+DECODE_CACHE_SIZE = 0x4000
+DecodedWords = DecodeCache(DECODE_CACHE_SIZE)
+
+def decode(instr, opcode, addr):
+	primary = (opcode >> 26) & 63
+	shift, mask = ExtendedOpcodeFields[primary]
+	op = FlatOpcodeMap.get((primary << 11) | ((opcode >> shift) & mask))
 	if op is None:
-		return instr
-	if type(op) == list:
+		return
+	if type(op) == tuple:
 		instr.operation = op[0]
-		instr.operands = [OperandDecode[i](opcode, addr) for i in op[1]]
+		instr.operands = [i(opcode, addr) for i in op[1]]
 		if op[2]:
 			op[2](instr, opcode, addr)
 	else:
 		op(instr, opcode, addr)
+
+def decode_word(opcode):
+	# Returns the operation, the operands at address zero, and the index of the operand that is
+	# relative to the address of the instruction.  Only relative branches depend on the address.
+	instr = Instruction()
+	decode(instr, opcode, 0)
+	relative = None
+	if (((opcode >> 26) & 63) in [16, 18]) and ((opcode & 2) == 0) and (len(instr.operands) > 0):
+		relative = len(instr.operands) - 1
+	return (instr.operation, instr.operands, relative)
+
+def disassemble(opcode, addr):
+	# Check the newer generation directly, as that is where repeated words are found
+	entry = DecodedWords.recent.get(opcode)
+	if entry is None:
+		entry = DecodedWords.get(opcode)
+		if entry is None:
+			entry = decode_word(opcode)
+			DecodedWords.add(opcode, entry)
+	instr = Instruction()
+	instr.operation = entry[0]
+	instr.operands = list(entry[1])
+	if entry[2] is not None:
+		instr.operands[entry[2]] += addr
 	return instr
 
-def format_instruction_string(fmt, opcode, addr, instr):
-	result = ""
-	i = 0
-	while i < len(fmt):
-		if fmt[i] == '%':
-			width = 0
-			i += 1
-			while i < len(fmt):
-				if fmt[i] == 'a':
-					if width == 0:
-						width = 8
-					result += ("%%.%dx" % width) % addr
-					break
-				elif fmt[i] == 'b':
-					result += "%.8x" % opcode
-					break
-				elif fmt[i] == 'i':
-					operation = instr.operation
-					for j in range(len(operation), width):
-						operation += " "
-					result += operation
-					break
-				elif fmt[i] == 'o':
-					for j in range(0, len(instr.operands)):
-						if j != 0:
-							result += ", "
-						if type(instr.operands[j]) != str:
-							if instr.operands[j] < 0:
-								result += "-0x%x" % -instr.operands[j]
-							else:
-								result += "0x%x" % instr.operands[j]
-						else:
-							result += instr.operands[j]
-					break
-				elif (fmt[i] >= '0') and (fmt[i] <= '9'):
-					width = (width * 10) + (ord(fmt[i]) - 0x30)
-				else:
-					result += fmt[i]
-					break
-				i += 1
-		else:
-			result += fmt[i]
-		i += 1
+def get_range_flags(operation):
+	flags = 0
+	if operation is None:
+		flags |= RANGE_FLAG_INVALID
+	if (operation in ["b", "ba"]) or (operation in ConditionalBranches):
+		flags |= RANGE_FLAG_JUMP
+	if operation in ConditionalBranches:
+		flags |= RANGE_FLAG_CONDITIONAL
+	if operation in CallInstructions:
+		flags |= RANGE_FLAG_CALL
+	if (operation in BranchInstructions) or (operation == "trap") or (flags & RANGE_FLAG_JUMP):
+		flags |= RANGE_FLAG_BLOCK_ENDING
+	return flags
+
+RangeFlags = {}
+for operation in [None, "trap"] + BranchInstructions + CallInstructions:
+	RangeFlags[operation] = get_range_flags(operation)
+
+def disassemble_range(buf, base_addr, instrs = False):
+	# Decodes every whole instruction word in the buffer
+	count = len(buf) / 4
+	result = InstructionRange(base_addr, 4, instrs)
+	for i, opcode in enumerate(struct.unpack(">%dI" % count, buf[0:count * 4])):
+		ofs = i * 4
+		instr = disassemble(opcode, base_addr + ofs)
+		operation = instr.operation
+		target = None
+		if operation and (operation[0] == 'b') and (len(instr.operands) > 0) and (type(instr.operands[-1]) != str):
+			target = instr.operands[-1]
+		result.add(ofs, 4, operation, RangeFlags.get(operation, 0), target, instr)
 	return result
 
+def get_operands_string(instr):
+	result = []
+	for operand in instr.operands:
+		if type(operand) == str:
+			result.append(operand)
+		elif operand < 0:
+			result.append("-0x%x" % -operand)
+		else:
+			result.append("0x%x" % operand)
+	return ", ".join(result)
+
+def format_compiled(result, ops, opcode, addr, instr):
+	# Appends the pieces of an instruction's text to result, following a compiled format
+	for code, value in ops:
+		if code is None:
+			result.append(value)
+		elif code == 'a':
+			result.append("%.*x" % (value, addr))
+		elif code == 'b':
+			result.append("%.8x" % opcode)
+		elif code == 'i':
+			result.append(instr.operation.ljust(value))
+		elif code == 'o':
+			result.append(get_operands_string(instr))
+
+def format_instruction_string(fmt, opcode, addr, instr):
+	result = []
+	format_compiled(result, get_compiled_format(fmt), opcode, addr, instr)
+	return "".join(result)
+
+def format_many(fmt, instrs):
+	# Formats a sequence of (opcode, addr, instr) tuples, returning one string per instruction
+	ops = get_compiled_format(fmt)
+	lines = []
+	for opcode, addr, instr in instrs:
+		result = []
+		format_compiled(result, ops, opcode, addr, instr)
+		lines.append("".join(result))
+	return lines
+
 def disassemble_to_string(fmt, opcode, addr):
 	instr = disassemble(opcode, addr)
 	return format_instruction_string(fmt, opcode, addr, instr)
@@ -39,6 +39,12 @@ class PythonConsoleOutput():
 			else:
 				Threads.run_on_gui_thread(lambda: console.write_stdout(data))
 
+	def flush(self):
+		self.stdout.flush()
+
+	def close(self):
+		pass
+
 class PythonConsoleInput():
 	def __init__(self, orig):
 		self.stdin = orig
@@ -63,6 +69,10 @@ class PythonConsoleInput():
 		else:
 			return console.readline_stdin()
 
+	def close(self):
+		# Called by child processes, which do not read from the console
+		self.stdin.close()
+
 class PythonConsoleThread(threading.Thread):
 	def __init__(self, console):
 		threading.Thread.__init__(self)
@@ -87,6 +97,7 @@ class PythonConsoleThread(threading.Thread):
 		self.globals["current_view"] = Threads.GuiObjectProxy(lambda: self.console.view.view)
 		self.globals["change_view"] = Threads.GuiObjectProxy(lambda type: self.console.view.setViewType(type))
 		self.globals["navigate"] = Threads.GuiObjectProxy(lambda type, pos: self.console.view.navigate(type, pos))
+		self.globals["analysis"] = Threads.GuiObjectProxy(lambda: self.get_analysis())
 		self.globals["create_file"] = Threads.GuiObjectProxy(lambda data: Threads.create_file(data))
 
 		self.globals["cursor"] = Threads.GuiObjectProxy(lambda: self.console.view.view.get_cursor_pos())
@@ -106,6 +117,13 @@ class PythonConsoleThread(threading.Thread):
 		self.globals["clipboard"] = Threads.GuiObjectProxy(lambda: self.get_clipboard())
 
 	# Helper APIs
+	def get_analysis(self):
+		# Analysis results are owned by the disassembler view, if one has been opened
+		for view in self.console.view.cache.values():
+			if hasattr(view, "analysis"):
+				return view.analysis
+		return None
+
 	def get_selection(self):
 		data = self.console.view.view.data
 		range = self.console.view.view.get_selection_range()
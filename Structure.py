@@ -32,6 +32,17 @@ class Array:
 	def append(self):
 		self.elements.append(Structure(self._state.data, self._state))
 
+	def fields(self, ofs, stride, layout, entries):
+		# Fills the elements with records read by BinaryAccessor.read_struct_array, the first at ofs
+		# and each following one stride bytes later.  Records past the end of the data get None
+		# fields, as reading them one field at a time would.
+		for i in xrange(0, len(self.elements)):
+			self.elements[i].seek(ofs + (i * stride))
+			if i < len(entries):
+				self.elements[i].fields(layout, entries[i])
+			else:
+				self.elements[i].fields(layout, [None] * len(layout))
+
 	def getStart(self):
 		start = None
 		for i in self.elements:
@@ -240,6 +251,18 @@ class Structure:
 		self._state.offset += 8
 		return result
 
+	def fields(self, layout, values):
+		# Define consecutive fields from values that were already read, for example by
+		# BinaryAccessor.read_struct_array.  The layout is a list of (type, size, name) entries.
+		for (type, size, name), value in zip(layout, values):
+			self.__dict__[name] = value
+			self._names[name] = name
+			self._start[name] = self._state.offset
+			self._size[name] = size
+			self._type[name] = type
+			self._order += [name]
+			self._state.offset += size
+
 	def getStart(self):
 		self.complete()
 		start = None
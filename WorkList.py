@@ -0,0 +1,80 @@
+# Copyright (c) 2011-2015 Rusty Wagner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import itertools
+
+
+class WorkList:
+	# Stack of unique items.  Items that are already queued are not added again, and items given
+	# priority are taken before all others.  Moving an item ahead of the others leaves its old position
+	# in place, which is skipped when it is reached.  An item given priority again is moved to the top
+	# of the priority items, so that they only hold each item once.
+	def __init__(self, items = []):
+		self.items = []
+		self.priority_items = []
+		self.priority_members = set()
+		self.members = set()
+		for item in items:
+			self.add(item)
+
+	def add(self, item):
+		if item in self.members:
+			return False
+		self.members.add(item)
+		self.items.append(item)
+		return True
+
+	def add_priority(self, item):
+		if item in self.priority_members:
+			if self.priority_items[-1] == item:
+				return
+			self.priority_items.remove(item)
+		self.members.add(item)
+		self.priority_members.add(item)
+		self.priority_items.append(item)
+
+	def pop(self):
+		while True:
+			if len(self.priority_items) > 0:
+				item = self.priority_items.pop()
+				self.priority_members.remove(item)
+			else:
+				item = self.items.pop()
+			if item in self.members:
+				self.members.remove(item)
+				return item
+
+	def peek(self, count):
+		# Returns up to count items in the order they will be taken
+		return list(itertools.islice(iter(self), count))
+
+	def clear(self):
+		self.items = []
+		self.priority_items = []
+		self.priority_members = set()
+		self.members = set()
+
+	def __iter__(self):
+		found = set()
+		for item in itertools.chain(reversed(self.priority_items), reversed(self.items)):
+			if (item in self.members) and (item not in found):
+				found.add(item)
+				yield item
+
+	def __contains__(self, item):
+		return item in self.members
+
+	def __len__(self):
+		return len(self.members)
@@ -20,6 +20,10 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 
+import struct
+from InstructionRange import *
+from FormatString import *
+
 FLAG_LOCK = 1
 FLAG_REP = 2
 FLAG_REPNE = 4
@@ -597,19 +601,21 @@ RM16Components = [["bx", "si", "ds"], ["bx", "di", "ds"], ["bp", "si", "ss"], ["
 	["di", None, "ds"], ["bp", None, "ss"], ["bx", None, "ds"], [None, None, "ds"]]
 
 class InstructionOperand:
-	def __init__(self):
-		self.operand = None
+	def __init__(self, operand = None, size = 0, immediate = 0):
+		self.operand = operand
 		self.components = [None, None]
 		self.scale = 1
-		self.size = 0
-		self.immediate = 0
+		self.size = size
+		self.immediate = immediate
 		self.segment = None
 		self.rip_relative = False
 
 class Instruction:
-	def __init__(self):
-		self.operation = None
-		self.operands = [InstructionOperand(), InstructionOperand(), InstructionOperand()]
+	def __init__(self, operation = None, operands = None):
+		self.operation = operation
+		if operands is None:
+			operands = [InstructionOperand(), InstructionOperand(), InstructionOperand()]
+		self.operands = operands
 		self.flags = 0
 		self.segment = None
 		self.length = 0
@@ -664,29 +670,25 @@ def get_final_op_size(state):
 		return state.op_size
 
 def read8(state):
-	if len(state.opcode) < 1:
+	if state.opcode_offset >= state.orig_len:
 		# Read past end of buffer, returning 0xcc from now on will guarantee exit
 		state.invalid = True
 		state.insufficient_length = True
-		state.opcode = ""
 		return 0xcc
 
-	val = ord(state.opcode[0])
-	state.opcode = state.opcode[1:]
+	val = ord(state.opcode[state.opcode_offset])
 	state.prev_opcode = val
 	state.opcode_offset += 1
 	return val
 
 def peek8(state):
-	if len(state.opcode) < 1:
+	if state.opcode_offset >= state.orig_len:
 		# Read past end of buffer, returning 0xcc from now on will guarantee exit
 		state.invalid = True
 		state.insufficient_length = True
-		state.opcode = ""
 		return 0xcc
 
-	val = ord(state.opcode[0])
-	return val
+	return ord(state.opcode[state.opcode_offset])
 
 def read16(state):
 	val = read8(state)
@@ -1835,8 +1837,8 @@ def process_prefixes(state):
 			continue
 		else:
 			# Not a prefix, continue instruction processing
-			state.opcode = chr(prefix) + state.opcode
-			state.opcode_offset -= 1
+			if not state.insufficient_length:
+				state.opcode_offset -= 1
 			break
 
 		# Force ignore REX unless it is the last prefix
@@ -1873,6 +1875,357 @@ def finish_disassemble(state):
 		state.result.operation = None
 	state.result.finalize()
 
+# Fast path for the most common instructions.  Instructions without legacy prefixes that use one
+# of the simpler encodings are decoded straight from the opcode bytes, using decode plans compiled
+# from the opcode maps at import time, without building a DecodeState.  Anything else, including
+# any instruction that runs past the end of the buffer, is left to the full decoder.
+
+Signed8 = struct.Struct("<b")
+Signed32 = struct.Struct("<i")
+Unsigned32 = struct.Struct("<I")
+Unsigned64 = struct.Struct("<Q")
+
+def fast_op_size(flags, rex, using64):
+	if flags & DEC_FLAG_BYTE:
+		return 1
+	if using64 and (flags & DEC_FLAG_DEFAULT_TO_64BIT):
+		return 8
+	if rex & 8:
+		return 8
+	return 4
+
+def fast_reg_list(size, rex):
+	if size == 1:
+		if rex:
+			return Reg8List64
+		return Reg8List
+	if size == 2:
+		return Reg16List
+	if size == 4:
+		return Reg32List
+	return Reg64List
+
+def fast_read_imm(data, i, size, flags):
+	# Returns the immediate and the offset after it, or None if it runs past the end of the buffer
+	if (flags & DEC_FLAG_IMM_SX) or (size == 1):
+		if (i + 1) > len(data):
+			return None
+		if flags & DEC_FLAG_IMM_SX:
+			return Signed8.unpack_from(data, i)[0], i + 1
+		return ord(data[i]), i + 1
+	if (i + 4) > len(data):
+		return None
+	if size == 8:
+		return Signed32.unpack_from(data, i)[0], i + 4
+	return Unsigned32.unpack_from(data, i)[0], i + 4
+
+def fast_decode_rm(data, i, rex, using64, reg_list, size):
+	# Returns the r/m operand, the reg field and the offset after the operand, or None if the
+	# operand runs past the end of the buffer
+	n = len(data)
+	if i >= n:
+		return None
+	rm_byte = ord(data[i])
+	i += 1
+	mod = rm_byte >> 6
+	rm = rm_byte & 7
+	rm_reg1_offset = (rex & 1) << 3
+
+	if mod == 3:
+		return InstructionOperand(reg_list[rm + rm_reg1_offset], size), (rm_byte >> 3) & 7, i
+
+	if using64:
+		addr_reg_list = Reg64List
+	else:
+		addr_reg_list = Reg32List
+	oper = InstructionOperand("mem", size)
+	if rm == 4:
+		# SIB byte present
+		if i >= n:
+			return None
+		sib_byte = ord(data[i])
+		i += 1
+		base = sib_byte & 7
+		index = ((sib_byte >> 3) & 7) + ((rex & 2) << 2)
+		oper.scale = 1 << (sib_byte >> 6)
+		if (mod != 0) or (base != 5):
+			oper.components[0] = addr_reg_list[base + rm_reg1_offset]
+		if index != 4:
+			oper.components[1] = addr_reg_list[index]
+		if ((base + rm_reg1_offset) == 4) or ((base + rm_reg1_offset) == 5):
+			oper.segment = "ss"
+		else:
+			oper.segment = "ds"
+		disp32 = (mod == 2) or ((mod == 0) and (base == 5))
+	else:
+		if (mod == 0) and (rm == 5):
+			oper.rip_relative = using64
+		else:
+			oper.components[0] = addr_reg_list[rm + rm_reg1_offset]
+		if (mod != 0) and (rm == 5):
+			oper.segment = "ss"
+		else:
+			oper.segment = "ds"
+		disp32 = (mod == 2) or ((mod == 0) and (rm == 5))
+
+	if disp32:
+		if (i + 4) > n:
+			return None
+		oper.immediate = Signed32.unpack_from(data, i)[0]
+		i += 4
+	elif mod == 1:
+		if i >= n:
+			return None
+		oper.immediate = Signed8.unpack_from(data, i)[0]
+		i += 1
+	return oper, (rm_byte >> 3) & 7, i
+
+def fast_result(operation, operands, addr, length, using64):
+	result = Instruction(operation, operands)
+	for oper in operands:
+		if oper.rip_relative:
+			oper.immediate += addr + length
+			result.flags |= FLAG_64BIT_ADDRESS
+	result.length = length
+	if using64:
+		result.addr_size = 8
+	else:
+		result.addr_size = 4
+	return result
+
+def fast_no_operands(plan, data, i, addr, rex, using64):
+	if (plan[1] == "nop") and (rex & 1):
+		return None
+	return fast_result(plan[1], [], addr, i, using64)
+
+def fast_reg_rm(plan, data, i, addr, rex, using64):
+	flags = plan[2]
+	size = fast_op_size(flags, rex, using64)
+	reg_list = fast_reg_list(size, rex)
+	if flags & DEC_FLAG_REG_RM_SIZE_MASK:
+		rm_size = 0
+	else:
+		rm_size = size
+	decoded = fast_decode_rm(data, i, rex, using64, reg_list, rm_size)
+	if decoded is None:
+		return None
+	rm_oper, reg_field, i = decoded
+	if (rm_size != size) and (rm_oper.operand != "mem"):
+		return None
+	reg_oper = InstructionOperand(reg_list[reg_field + ((rex & 4) << 1)], size)
+	if flags & DEC_FLAG_FLIP_OPERANDS:
+		return fast_result(plan[1], [rm_oper, reg_oper], addr, i, using64)
+	return fast_result(plan[1], [reg_oper, rm_oper], addr, i, using64)
+
+def fast_mov_sx_zx(plan, data, i, addr, rex, using64):
+	size = fast_op_size(plan[2], rex, using64)
+	if plan[3] & 1:
+		decoded = fast_decode_rm(data, i, rex, using64, Reg16List, 2)
+	else:
+		decoded = fast_decode_rm(data, i, rex, using64, fast_reg_list(1, rex), 1)
+	if decoded is None:
+		return None
+	rm_oper, reg_field, i = decoded
+	reg_oper = InstructionOperand(fast_reg_list(size, rex)[reg_field + ((rex & 4) << 1)], size)
+	return fast_result(plan[1], [reg_oper, rm_oper], addr, i, using64)
+
+def fast_rm8(plan, data, i, addr, rex, using64):
+	decoded = fast_decode_rm(data, i, rex, using64, fast_reg_list(1, rex), 1)
+	if decoded is None:
+		return None
+	return fast_result(plan[1], [decoded[0]], addr, decoded[2], using64)
+
+def fast_eax_imm(plan, data, i, addr, rex, using64):
+	size = fast_op_size(plan[2], rex, using64)
+	imm = fast_read_imm(data, i, size, plan[2])
+	if imm is None:
+		return None
+	operands = [InstructionOperand(fast_reg_list(size, rex)[0], size), InstructionOperand("imm", size, imm[0])]
+	return fast_result(plan[1], operands, addr, imm[1], using64)
+
+def fast_op_reg(plan, data, i, addr, rex, using64):
+	size = fast_op_size(plan[2], rex, using64)
+	reg = fast_reg_list(size, rex)[(plan[3] & 7) + ((rex & 1) << 3)]
+	return fast_result(plan[1], [InstructionOperand(reg, size)], addr, i, using64)
+
+def fast_op_reg_imm(plan, data, i, addr, rex, using64):
+	size = fast_op_size(plan[2], rex, using64)
+	reg = fast_reg_list(size, rex)[(plan[3] & 7) + ((rex & 1) << 3)]
+	if size == 8:
+		if (i + 8) > len(data):
+			return None
+		imm = (Unsigned64.unpack_from(data, i)[0], i + 8)
+	else:
+		imm = fast_read_imm(data, i, size, plan[2])
+		if imm is None:
+			return None
+	operands = [InstructionOperand(reg, size), InstructionOperand("imm", size, imm[0])]
+	return fast_result(plan[1], operands, addr, imm[1], using64)
+
+def fast_rel_imm(plan, data, i, addr, rex, using64):
+	if plan[2] & DEC_FLAG_BYTE:
+		if (i + 1) > len(data):
+			return None
+		value = Signed8.unpack_from(data, i)[0]
+		i += 1
+	else:
+		if (i + 4) > len(data):
+			return None
+		value = Signed32.unpack_from(data, i)[0]
+		i += 4
+	if using64:
+		size = 8
+	else:
+		size = 4
+	return fast_result(plan[1], [InstructionOperand("imm", size, value + addr + i)], addr, i, using64)
+
+def fast_decode_group_rm(plan, data, i, rex, using64):
+	# Returns the operation, operand size, r/m operand and the offset after the operand
+	if i >= len(data):
+		return None
+	operation = GroupOperations[plan[1]][(ord(data[i]) >> 3) & 7]
+	if operation is None:
+		return None
+	size = fast_op_size(plan[2], rex, using64)
+	decoded = fast_decode_rm(data, i, rex, using64, fast_reg_list(size, rex), size)
+	if decoded is None:
+		return None
+	return operation, size, decoded[0], decoded[2]
+
+def fast_group_rm(plan, data, i, addr, rex, using64):
+	decoded = fast_decode_group_rm(plan, data, i, rex, using64)
+	if decoded is None:
+		return None
+	return fast_result(decoded[0], [decoded[2]], addr, decoded[3], using64)
+
+def fast_group_rm_imm(plan, data, i, addr, rex, using64):
+	decoded = fast_decode_group_rm(plan, data, i, rex, using64)
+	if decoded is None:
+		return None
+	operation, size, rm_oper, i = decoded
+	if (plan[0] == fast_group_f6_f7) and (operation != "test"):
+		return fast_result(operation, [rm_oper], addr, i, using64)
+	imm = fast_read_imm(data, i, size, plan[2])
+	if imm is None:
+		return None
+	return fast_result(operation, [rm_oper, InstructionOperand("imm", size, imm[0])], addr, imm[1], using64)
+
+def fast_group_f6_f7(plan, data, i, addr, rex, using64):
+	return fast_group_rm_imm(plan, data, i, addr, rex, using64)
+
+def fast_group_rm_imm8(plan, data, i, addr, rex, using64):
+	decoded = fast_decode_group_rm(plan, data, i, rex, using64)
+	if decoded is None:
+		return None
+	operation, size, rm_oper, i = decoded
+	if i >= len(data):
+		return None
+	return fast_result(operation, [rm_oper, InstructionOperand("imm", 1, ord(data[i]))], addr, i + 1, using64)
+
+def fast_group_rm_one(plan, data, i, addr, rex, using64):
+	decoded = fast_decode_group_rm(plan, data, i, rex, using64)
+	if decoded is None:
+		return None
+	operation, size, rm_oper, i = decoded
+	return fast_result(operation, [rm_oper, InstructionOperand("imm", 1, 1)], addr, i, using64)
+
+def fast_movsxd(plan, data, i, addr, rex, using64):
+	if not using64:
+		return None
+	size = fast_op_size(plan[2], rex, using64)
+	decoded = fast_decode_rm(data, i, rex, using64, Reg32List, 4)
+	if decoded is None:
+		return None
+	rm_oper, reg_field, i = decoded
+	reg_oper = InstructionOperand(fast_reg_list(size, rex)[reg_field + ((rex & 4) << 1)], size)
+	return fast_result("movsxd", [reg_oper, rm_oper], addr, i, using64)
+
+def fast_group_ff(plan, data, i, addr, rex, using64):
+	if i >= len(data):
+		return None
+	reg_field = (ord(data[i]) >> 3) & 7
+	operation = GroupOperations[plan[1]][reg_field]
+	if (operation is None) or (operation == "callf") or (operation == "jmpf"):
+		return None
+	if using64 and ((reg_field == 2) or (reg_field == 4) or (reg_field == 6)):
+		# Default to 64-bit for jumps and calls and pushes
+		size = 8
+	else:
+		size = fast_op_size(plan[2], rex, using64)
+	decoded = fast_decode_rm(data, i, rex, using64, fast_reg_list(size, rex), size)
+	if decoded is None:
+		return None
+	return fast_result(operation, [decoded[0]], addr, decoded[2], using64)
+
+def fast_two_byte(plan, data, i, addr, rex, using64):
+	if i >= len(data):
+		return None
+	if using64:
+		next_plan = FastTwoBytePlans64[ord(data[i])]
+	else:
+		next_plan = FastTwoBytePlans32[ord(data[i])]
+	if next_plan is None:
+		return None
+	return next_plan[0](next_plan, data, i + 1, addr, rex, using64)
+
+FastEncodings = {
+	"two_byte" : fast_two_byte, "no_operands" : fast_no_operands, "nop" : fast_no_operands,
+	"reg_rm_8" : fast_reg_rm, "rm_reg_8" : fast_reg_rm, "rm_reg_8_lock" : fast_reg_rm,
+	"reg_rm_v" : fast_reg_rm, "rm_reg_v" : fast_reg_rm, "rm_reg_v_lock" : fast_reg_rm, "reg_rm_0" : fast_reg_rm,
+	"movsxzx_8" : fast_mov_sx_zx, "movsxzx_16" : fast_mov_sx_zx, "rm_8" : fast_rm8,
+	"eax_imm_8" : fast_eax_imm, "eax_imm_v" : fast_eax_imm,
+	"op_reg_v" : fast_op_reg, "op_reg_v_def64" : fast_op_reg,
+	"op_reg_imm_8" : fast_op_reg_imm, "op_reg_imm_v" : fast_op_reg_imm,
+	"relimm_8_def64" : fast_rel_imm, "relimm_v_def64" : fast_rel_imm,
+	"group_rm_8_lock" : fast_group_rm, "group_rm_0" : fast_group_rm,
+	"group_rm_imm_8" : fast_group_rm_imm, "group_rm_imm_8_lock" : fast_group_rm_imm,
+	"group_rm_imm_8_no64_lock" : fast_group_rm_imm, "group_rm_imm_v" : fast_group_rm_imm,
+	"group_rm_imm_v_lock" : fast_group_rm_imm, "group_rm_immsx_v_lock" : fast_group_rm_imm,
+	"group_rm_imm8_v" : fast_group_rm_imm8, "group_rm_one_8" : fast_group_rm_one, "group_rm_one_v" : fast_group_rm_one,
+	"group_f6" : fast_group_f6_f7, "group_f7" : fast_group_f6_f7, "group_ff" : fast_group_ff, "arpl" : fast_movsxd
+}
+
+def compile_fast_plans(map, using64):
+	# Each plan is a (handler, operation, decode flags, opcode) tuple, or None for opcodes that
+	# must go through the full decoder
+	plans = []
+	for opcode in xrange(0, len(map)):
+		operation, encoder = map[opcode]
+		flags = Encoding[encoder][1]
+		if (encoder not in FastEncodings) or (using64 and (flags & DEC_FLAG_INVALID_IN_64BIT)):
+			plans.append(None)
+		elif using64 and ((opcode & 0xf0) == 0x40) and (map is MainOpcodeMap):
+			# REX prefix
+			plans.append(None)
+		else:
+			plans.append((FastEncodings[encoder], operation, flags, opcode))
+	return plans
+
+FastMainPlans32 = compile_fast_plans(MainOpcodeMap, False)
+FastMainPlans64 = compile_fast_plans(MainOpcodeMap, True)
+FastTwoBytePlans32 = compile_fast_plans(TwoByteOpcodeMap, False)
+FastTwoBytePlans64 = compile_fast_plans(TwoByteOpcodeMap, True)
+
+def disassemble_fast(opcode, addr, using64):
+	if len(opcode) == 0:
+		return None
+	i = 1
+	rex = 0
+	byte = ord(opcode[0])
+	if using64:
+		if (byte & 0xf0) == 0x40:
+			if len(opcode) < 2:
+				return None
+			rex = byte
+			byte = ord(opcode[1])
+			i = 2
+		plan = FastMainPlans64[byte]
+	else:
+		plan = FastMainPlans32[byte]
+	if plan is None:
+		return None
+	return plan[0](plan, opcode, i, addr, rex, using64)
+
 def disassemble16(opcode, addr):
 	state = DecodeState()
 	state.opcode = opcode
@@ -1893,6 +2246,12 @@ def disassemble16(opcode, addr):
 	return state.result
 
 def disassemble32(opcode, addr):
+	if len(opcode) > 15:
+		opcode = opcode[0:15]
+	result = disassemble_fast(opcode, addr, False)
+	if result is not None:
+		return result
+
 	state = DecodeState()
 	state.opcode = opcode
 	state.addr = addr
@@ -1912,6 +2271,12 @@ def disassemble32(opcode, addr):
 	return state.result
 
 def disassemble64(opcode, addr):
+	if len(opcode) > 15:
+		opcode = opcode[0:15]
+	result = disassemble_fast(opcode, addr, True)
+	if result is not None:
+		return result
+
 	state = DecodeState()
 	state.opcode = opcode
 	state.addr = addr
@@ -1930,6 +2295,58 @@ def disassemble64(opcode, addr):
 	state.result.addr_size = state.addr_size
 	return state.result
 
+ConditionalBranches = ["jo", "jno", "jb", "jae", "je", "jne", "jbe", "ja", "js", "jns",
+	"jpe", "jpo", "jl", "jge", "jle", "jg", "jcxz", "jecxz", "jrcxz", "loop"]
+CallInstructions = ["calln", "callf"]
+BlockEndingInstructions = ["jmpn", "jmpf", "retn", "retf", "hlt"] + ConditionalBranches
+
+def get_range_flags(operation):
+	flags = 0
+	if operation is None:
+		flags |= RANGE_FLAG_INVALID
+	if (operation == "jmpn") or (operation in ConditionalBranches):
+		flags |= RANGE_FLAG_JUMP
+	if operation in ConditionalBranches:
+		flags |= RANGE_FLAG_CONDITIONAL
+	if operation in CallInstructions:
+		flags |= RANGE_FLAG_CALL
+	if operation in BlockEndingInstructions:
+		flags |= RANGE_FLAG_BLOCK_ENDING
+	return flags
+
+RangeFlags = {}
+for operation in [None] + BlockEndingInstructions + CallInstructions:
+	RangeFlags[operation] = get_range_flags(operation)
+
+def disassemble_range(buf, base_addr, mode, instrs = False):
+	# Decodes instructions back to back from the start of the buffer.  Invalid bytes are recorded
+	# as one byte invalid instructions, and decoding stops at an instruction that runs past the
+	# end of the buffer, which is left at end_addr.
+	if mode == 16:
+		disassemble, addr_size = disassemble16, 2
+	elif mode == 32:
+		disassemble, addr_size = disassemble32, 4
+	else:
+		disassemble, addr_size = disassemble64, 8
+	result = InstructionRange(base_addr, addr_size, instrs)
+	ofs = 0
+	while ofs < len(buf):
+		addr = base_addr + ofs
+		instr = disassemble(buf[ofs:ofs + 15], addr)
+		if (instr.flags & FLAG_INSUFFICIENT_LENGTH) and ((ofs + 15) > len(buf)):
+			break
+		operation = instr.operation
+		flags = RangeFlags.get(operation, 0)
+		length = instr.length
+		if (operation is None) or (length == 0):
+			length = 1
+		target = None
+		if (flags & (RANGE_FLAG_JUMP | RANGE_FLAG_CALL)) and (len(instr.operands) > 0) and (instr.operands[0].operand == "imm"):
+			target = instr.operands[0].immediate
+		result.add(ofs, length, operation, flags, target, instr)
+		ofs += length
+	return result
+
 def get_size_string(size):
 	if size == 1:
 		return "byte "
@@ -1957,91 +2374,89 @@ def get_operand_string(type, scale, plus):
 		result += "*%d" % scale
 	return result
 
-def format_instruction_string(fmt, opcode, addr, instr):
-	result = ""
-	i = 0
-	while i < len(fmt):
-		if fmt[i] == '%':
-			width = 0
-			i += 1
-			while i < len(fmt):
-				if fmt[i] == 'a':
-					if width == 0:
-						width = 8
-					result += ("%%.%dx" % width) % addr
-					break
-				elif fmt[i] == 'b':
-					for j in range(0, instr.length):
-						result += "%.2x" % ord(opcode[j])
-					for j in range(instr.length, width):
-						result += "  "
-					break
-				elif fmt[i] == 'i':
-					operation = ""
-					if instr.flags & FLAG_LOCK:
-						operation += "lock "
-					if instr.flags & FLAG_ANY_REP:
-						operation += "rep"
-						if instr.flags & FLAG_REPNE:
-							operation += "ne"
-						elif instr.flags & FLAG_REPE:
-							operation += "e"
-						operation += " "
-					operation += instr.operation
-					for j in range(len(operation), width):
-						operation += " "
-					result += operation
-					break
-				elif fmt[i] == 'o':
-					for j in range(0, len(instr.operands)):
-						if j != 0:
-							result += ", "
-						if instr.operands[j].operand == "imm":
-							numfmt = "0x%%.%dx" % (instr.operands[j].size * 2)
-							result += numfmt % (instr.operands[j].immediate &
-								((1 << (instr.operands[j].size * 8)) - 1))
-						elif instr.operands[j].operand == "mem":
-							plus = False
-							result += get_size_string(instr.operands[j].size)
-							if (instr.segment != None) or (instr.operands[j].segment == "es"):
-								result += instr.operands[j].segment + ":"
-							result += '['
-							if instr.operands[j].components[0] != None:
-								result += instr.operands[j].components[0]
-								plus = True
-							if instr.operands[j].components[1] != None:
-								result += get_operand_string(instr.operands[j].components[1],
-									instr.operands[j].scale, plus)
-								plus = True
-							if (instr.operands[j].immediate != 0) or ((instr.operands[j].components[0] == None) and (instr.operands[j].components[1] == None)):
-								if plus and (instr.operands[j].immediate >= -0x80) and (instr.operands[j].immediate < 0):
-									result += '-'
-									result += "0x%.2x" % (-instr.operands[j].immediate)
-								elif plus and (instr.operands[j].immediate > 0) and (instr.operands[j].immediate <= 0x7f):
-									result += '+'
-									result += "0x%.2x" % instr.operands[j].immediate
-								elif (instr.flags & FLAG_64BIT_ADDRESS) != 0:
-									if plus:
-										result += '+'
-									result += "0x%.16x" % instr.operands[j].immediate
-								else:
-									if plus:
-										result += '+'
-									result += "0x%.8x" % (instr.operands[j].immediate & 0xffffffff)
-							result += ']'
-						else:
-							result += instr.operands[j].operand
-					break
-				elif (fmt[i] >= '0') and (fmt[i] <= '9'):
-					width = (width * 10) + (ord(fmt[i]) - 0x30)
-				else:
-					result += fmt[i]
-					break
-				i += 1
+def get_operation_string(instr):
+	if (instr.flags & (FLAG_LOCK | FLAG_ANY_REP)) == 0:
+		return instr.operation
+	operation = ""
+	if instr.flags & FLAG_LOCK:
+		operation += "lock "
+	if instr.flags & FLAG_ANY_REP:
+		operation += "rep"
+		if instr.flags & FLAG_REPNE:
+			operation += "ne"
+		elif instr.flags & FLAG_REPE:
+			operation += "e"
+		operation += " "
+	return operation + instr.operation
+
+def get_memory_operand_string(instr, operand):
+	result = [get_size_string(operand.size)]
+	if (instr.segment != None) or (operand.segment == "es"):
+		result.append(operand.segment + ":")
+	result.append('[')
+	plus = False
+	if operand.components[0] != None:
+		result.append(operand.components[0])
+		plus = True
+	if operand.components[1] != None:
+		result.append(get_operand_string(operand.components[1], operand.scale, plus))
+		plus = True
+	if (operand.immediate != 0) or ((operand.components[0] == None) and (operand.components[1] == None)):
+		if plus and (operand.immediate >= -0x80) and (operand.immediate < 0):
+			result.append("-0x%.2x" % (-operand.immediate))
+		elif plus and (operand.immediate > 0) and (operand.immediate <= 0x7f):
+			result.append("+0x%.2x" % operand.immediate)
 		else:
-			result += fmt[i]
-		i += 1
-	return result
+			if plus:
+				result.append('+')
+			if (instr.flags & FLAG_64BIT_ADDRESS) != 0:
+				result.append("0x%.16x" % operand.immediate)
+			else:
+				result.append("0x%.8x" % (operand.immediate & 0xffffffff))
+	result.append(']')
+	return "".join(result)
+
+def get_operands_string(instr):
+	result = []
+	for operand in instr.operands:
+		if operand.operand == "imm":
+			result.append("0x%.*x" % (operand.size * 2, operand.immediate & ((1 << (operand.size * 8)) - 1)))
+		elif operand.operand == "mem":
+			result.append(get_memory_operand_string(instr, operand))
+		else:
+			result.append(operand.operand)
+	return ", ".join(result)
+
+def format_compiled(result, ops, opcode, addr, instr):
+	# Appends the pieces of an instruction's text to result, following a compiled format
+	for code, value in ops:
+		if code is None:
+			result.append(value)
+		elif code == 'a':
+			result.append("%.*x" % (value, addr))
+		elif code == 'b':
+			result.append("".join(["%.2x" % ord(byte) for byte in opcode[0:instr.length]]))
+			if value > instr.length:
+				result.append("  " * (value - instr.length))
+		elif code == 'i':
+			result.append(get_operation_string(instr).ljust(value))
+		elif code == 'o':
+			result.append(get_operands_string(instr))
+
+def format_instruction_string(fmt, opcode, addr, instr):
+	result = []
+	format_compiled(result, get_compiled_format(fmt), opcode, addr, instr)
+	return "".join(result)
+
+def format_many(fmt, instrs):
+	# Formats a sequence of (opcode, addr, instr) tuples, returning one string per instruction
+	ops = get_compiled_format(fmt)
+	lines = []
+	for opcode, addr, instr in instrs:
+		result = []
+		format_compiled(result, ops, opcode, addr, instr)
+		lines.append("".join(result))
+	return lines
 
 def disassemble16_to_string(fmt, opcode, addr):
 	instr = disassemble16(opcode, addr)
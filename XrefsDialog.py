@@ -0,0 +1,74 @@
+# Copyright (c) 2012-2015 Rusty Wagner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from PySide.QtCore import *
+from PySide.QtGui import *
+
+
+class XrefsDialog(QDialog):
+	def __init__(self, analysis, addr, name, parent):
+		super(XrefsDialog, self).__init__(parent)
+
+		self.setWindowTitle("References to " + name)
+
+		layout = QVBoxLayout()
+
+		self.xrefs = analysis.get_xrefs(addr)
+		self.list = QListWidget()
+		for from_addr, func_entry, xref_type in self.xrefs:
+			func = analysis.functions.get(func_entry)
+			if func is not None:
+				func_name = func.name
+			else:
+				func_name = "sub_%.8x" % func_entry
+			if from_addr > func_entry:
+				func_name += "+0x%x" % (from_addr - func_entry)
+			elif from_addr < func_entry:
+				# Parts of a function can be placed before its entry
+				func_name += "-0x%x" % (func_entry - from_addr)
+			self.list.addItem("%.8x   %-5s %s" % (from_addr, xref_type, func_name))
+		if len(self.xrefs) > 0:
+			self.list.setCurrentRow(0)
+		self.list.itemActivated.connect(self.ok)
+		layout.addWidget(self.list)
+
+		self.cancelButton = QPushButton("Cancel")
+		self.cancelButton.clicked.connect(self.closeRequest)
+		self.cancelButton.setAutoDefault(False)
+
+		self.okButton = QPushButton("Go")
+		self.okButton.clicked.connect(self.ok)
+		self.okButton.setAutoDefault(True)
+		self.okButton.setEnabled(len(self.xrefs) > 0)
+
+		buttonLayout = QHBoxLayout()
+		buttonLayout.setContentsMargins(0, 0, 0, 0)
+		buttonLayout.addStretch(1)
+		buttonLayout.addWidget(self.cancelButton)
+		buttonLayout.addWidget(self.okButton)
+		layout.addLayout(buttonLayout)
+		self.setLayout(layout)
+
+	def ok(self):
+		row = self.list.currentRow()
+		if row < 0:
+			return
+		self.result = self.xrefs[row][0]
+		self.accept()
+
+	def closeRequest(self):
+		self.result = None
+		self.close()
+
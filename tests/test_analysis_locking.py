@@ -0,0 +1,86 @@
+# Copyright (c) 2011-2015 Rusty Wagner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+try:
+	import PySide
+	from Analysis import *
+except ImportError:
+	PySide = None
+
+
+class CodeBuffer:
+	# Minimal 32-bit x86 executable holding only code
+	def __init__(self, base, code):
+		self.base = base
+		self.code = code
+		self.symbols_by_addr = {}
+		self.symbols_by_name = {}
+
+	def architecture(self):
+		return "x86"
+
+	def start(self):
+		return self.base
+
+	def end(self):
+		return self.base + len(self.code)
+
+	def read(self, addr, size):
+		if (addr < self.start()) or (addr >= self.end()):
+			return ""
+		return self.code[addr - self.base:addr - self.base + size]
+
+	def create_symbol(self, addr, name):
+		self.symbols_by_addr[addr] = name
+		self.symbols_by_name[name] = addr
+
+	def add_callback(self, cb):
+		pass
+
+
+@unittest.skipIf(PySide is None, "requires PySide")
+class AnalysisLockingTest(unittest.TestCase):
+	def test_format_text_does_not_wait_for_analysis_lock(self):
+		# call 0x100a; ret; push ebp; mov ebp, esp; pop ebp; ret
+		exe = CodeBuffer(0x1000, "\xe8\x05\x00\x00\x00\xc3\x90\x90\x90\x90\x55\x89\xe5\x5d\xc3")
+		analysis = Analysis(exe)
+		func = Function(analysis, exe, 0x1000, "_start")
+		analysis.functions[0x1000] = func
+		analysis.lock.acquire()
+		func.findBasicBlocks()
+
+		# Format from another thread, as the GUI does, while the analysis lock stays held
+		thread = threading.Thread(target = analysis.format_text, args = (func, func.blocks))
+		thread.daemon = True
+		thread.start()
+		thread.join(10)
+		finished = not thread.is_alive()
+		analysis.lock.release()
+
+		self.assertTrue(finished)
+		instr = func.blocks[0x1000].instrs[0]
+		self.assertTrue(len(instr.text.lines) > 0)
+		self.assertTrue(0x100a in instr.text.refs)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,45 @@
+# Copyright (c) 2011-2015 Rusty Wagner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import struct
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import Arm
+from InstructionRange import *
+
+
+class ArmDisassembleRangeTest(unittest.TestCase):
+	def test_word_that_raises_in_decoder(self):
+		# 0x91eb79fa makes arm_extra_load_store_instr raise, the words around it are valid
+		words = [0xe1a00000, 0x91eb79fa, 0xe12fff1e]
+		self.assertRaises(Exception, Arm.disassemble, words[1], 0x1004)
+
+		result = Arm.disassemble_range(struct.pack("<3I", *words), 0x1000, True)
+		self.assertEqual(len(result), 3)
+		self.assertEqual([result.addr(i) for i in xrange(0, 3)], [0x1000, 0x1004, 0x1008])
+		self.assertEqual(result.operation(1), None)
+		self.assertTrue(result.flags[1] & RANGE_FLAG_INVALID)
+		self.assertEqual(result.instrs[1].operation, None)
+		self.assertEqual(result.operation(0), Arm.disassemble(words[0], 0x1000).operation)
+		self.assertEqual(result.operation(2), Arm.disassemble(words[2], 0x1008).operation)
+		self.assertEqual(result.end_addr, 0x100c)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,72 @@
+# Copyright (c) 2011-2015 Rusty Wagner
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+try:
+	import PySide
+	import multiprocessing
+	from BinaryData import *
+	from Analysis import *
+	# Importing the console replaces the standard streams, which are put back for the test runner
+	streams = (sys.stdin, sys.stdout, sys.stderr)
+	from PythonConsole import PythonConsoleInput, PythonConsoleOutput
+	sys.stdin, sys.stdout, sys.stderr = streams
+except ImportError:
+	PySide = None
+
+
+@unittest.skipIf(PySide is None, "requires PySide")
+class DiscoveryPoolTest(unittest.TestCase):
+	def setUp(self):
+		# Stream replacement as done by the GUI, on a machine with more than one processor
+		self.streams = (sys.stdin, sys.stdout, sys.stderr)
+		self.cpu_count = multiprocessing.cpu_count
+		multiprocessing.cpu_count = lambda: 4
+		sys.stderr = PythonConsoleOutput(sys.stderr, True)
+		sys.stdout = PythonConsoleOutput(sys.stdout, False)
+		sys.stdin = PythonConsoleInput(sys.stdin)
+
+	def tearDown(self):
+		sys.stdin, sys.stdout, sys.stderr = self.streams
+		multiprocessing.cpu_count = self.cpu_count
+
+	def test_pool_with_console_streams(self):
+		data = BinaryFile(sys.executable)
+		for exe_type in ExeFormats:
+			exe = exe_type(data)
+			if exe.valid:
+				break
+		else:
+			self.skipTest("interpreter is not in a supported executable format")
+
+		analysis = Analysis(exe)
+		try:
+			analysis.start_discovery_pool()
+			self.assertTrue(analysis.discovery_pool is not None)
+			version, result = analysis.submit_discovery(exe.entry())
+			instrs = result.get(DISCOVERY_TIMEOUT)
+		finally:
+			analysis.stop_discovery_pool()
+		self.assertTrue(len(instrs) > 0)
+		self.assertEqual(instrs[0][1], exe.entry())
+
+
+if __name__ == "__main__":
+	unittest.main()